@@ -3,8 +3,10 @@ from .models import (
     MobCashApp,
     APITransaction,
     APIBalanceUpdate,
+    BalanceRollup,
     MobCashAppBalanceUpdate,
     Transaction,
+    TransactionRollup,
     UserTransactionFilter,
 )
 from django.utils.html import format_html
@@ -44,6 +46,7 @@ class APITransactionAdmin(admin.ModelAdmin):
 class APIBalanceUpdateAdmin(admin.ModelAdmin):
     list_display = ("id", "api_transaction", "balance", "created_at")
     list_filter = ("api_transaction", "created_at")
+    list_select_related = ("api_transaction",)
     search_fields = ("api_transaction__name",)
     ordering = ("-created_at",)
     readonly_fields = ("created_at",)
@@ -53,6 +56,7 @@ class APIBalanceUpdateAdmin(admin.ModelAdmin):
 class MobCashAppBalanceUpdateAdmin(admin.ModelAdmin):
     list_display = ("id", "mobcash_balance", "balance", "created_at")
     list_filter = ("mobcash_balance", "created_at")
+    list_select_related = ("mobcash_balance",)
     search_fields = ("mobcash_balance__name",)
     ordering = ("-created_at",)
     readonly_fields = ("created_at",)
@@ -81,6 +85,42 @@ class TransactionAdmin(admin.ModelAdmin):
     readonly_fields = ("created_at",)
 
 
+@admin.register(TransactionRollup)
+class TransactionRollupAdmin(admin.ModelAdmin):
+    list_display = (
+        "bucket",
+        "mobcash",
+        "api",
+        "network",
+        "source",
+        "type",
+        "count",
+        "amount",
+        "mobcash_fee",
+        "blaffa_fee",
+    )
+    list_filter = ("api", "source", "type", "network")
+    ordering = ("-bucket",)
+
+
+@admin.register(BalanceRollup)
+class BalanceRollupAdmin(admin.ModelAdmin):
+    list_display = (
+        "bucket",
+        "resolution",
+        "api_transaction",
+        "mobcash_balance",
+        "open",
+        "min",
+        "max",
+        "close",
+        "count",
+    )
+    list_filter = ("resolution", "api_transaction", "mobcash_balance")
+    list_select_related = ("api_transaction", "mobcash_balance")
+    ordering = ("-bucket",)
+
+
 @admin.register(UserTransactionFilter)
 class UserTransactionFilterAdmin(admin.ModelAdmin):
     list_display = (
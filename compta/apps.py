@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ComptaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'compta'
+
+    def ready(self):
+        from compta import signals, task_metrics  # noqa: F401
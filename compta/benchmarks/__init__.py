@@ -0,0 +1,3 @@
+"""
+Benchmarks des chemins critiques (voir `manage.py benchmark_compta`)
+"""
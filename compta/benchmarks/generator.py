@@ -0,0 +1,190 @@
+import random
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from django.utils import timezone
+from compta.models import (
+    API_CHOICES,
+    APIBalanceUpdate,
+    APITransaction,
+    MobCashApp,
+    MobCashAppBalanceUpdate,
+    NETWORK_CHOICES,
+    Transaction,
+)
+
+# Préfixe des références et des apps MobCash générées : permet de compter / retrouver
+# les lignes du benchmark
+REFERENCE_PREFIX = "bench-"
+
+MOBCASH_NAMES = [
+    f"{REFERENCE_PREFIX}{name}"
+    for name in ["1xbet", "melbet", "betwinner", "linebet", "megapari", "888starz"]
+]
+
+# Répartitions pondérées (valeur, poids)
+TYPE_WEIGHTS = [("depot", 60), ("retrait", 38), ("other", 2)]
+SOURCE_WEIGHTS = [("mobile", 55), ("web", 25), ("telegram", 12), ("partner", 6), ("other", 2)]
+NETWORK_WEIGHTS = [("mtn", 45), ("moov", 30), ("orange", 12), ("wave", 10), (None, 3)]
+API_WEIGHTS = [("connect", 35), ("pal", 25), ("bpay", 20), ("dgs_pay", 12), ("barkapay", 8)]
+MOBCASH_WEIGHTS = [(name, weight) for name, weight in zip(MOBCASH_NAMES, [40, 20, 15, 10, 10, 5])]
+
+# Activité par heure de la journée (creux la nuit, pic en soirée)
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 6, 7, 7, 7, 7, 8, 8, 7, 7, 8, 9, 10, 10, 9, 7, 4, 2]
+
+
+def weighted(rng: random.Random, choices, count: int):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights=weights, k=count)
+
+
+class TransactionGenerator:
+    """
+    Génère des configs, transactions et historiques de balance synthétiques
+
+    Montants log-normaux (médiane ~5 000 FCFA), dimensions et heures pondérées,
+    transactions réparties sur `days` jours. Les insertions se font par lots
+    (bulk_create) et les dates par plages d'ids, sans charger les ids en
+    mémoire : plusieurs millions de lignes restent praticables.
+    """
+
+    def __init__(self, seed: int = 42, days: int = 365, batch_size: int = 5000):
+        self.rng = random.Random(seed)
+        self.days = days
+        self.batch_size = batch_size
+
+    def ensure_configs(self):
+        for name in MOBCASH_NAMES:
+            MobCashApp.objects.get_or_create(name=name)
+        for name, _ in API_CHOICES:
+            APITransaction.objects.get_or_create(name=name)
+
+    def count(self) -> int:
+        return Transaction.objects.filter(reference__startswith=REFERENCE_PREFIX).count()
+
+    def seed_transactions(self, target: int) -> int:
+        """
+        Complète les transactions du benchmark jusqu'à `target` lignes
+        Retourne le nombre de lignes insérées
+        """
+        self.ensure_configs()
+        existing = self.count()
+        created = 0
+        while existing + created < target:
+            size = min(self.batch_size, target - existing - created)
+            Transaction.objects.bulk_create(
+                self.build_transactions(size, offset=existing + created), batch_size=self.batch_size
+            )
+            created += size
+        if created:
+            self.spread_dates()
+        return created
+
+    def build_transactions(self, size: int, offset: int):
+        rng = self.rng
+        types = weighted(rng, TYPE_WEIGHTS, size)
+        sources = weighted(rng, SOURCE_WEIGHTS, size)
+        networks = weighted(rng, NETWORK_WEIGHTS, size)
+        apis = weighted(rng, API_WEIGHTS, size)
+        mobcashes = weighted(rng, MOBCASH_WEIGHTS, size)
+
+        transactions = []
+        for index in range(size):
+            amount = Decimal(min(int(rng.lognormvariate(8.5, 1.0)), 5_000_000))
+            fee_percent = Decimal(3 if types[index] == "depot" else 2)
+            transactions.append(
+                Transaction(
+                    reference=f"{REFERENCE_PREFIX}{offset + index}",
+                    amount=amount,
+                    mobcash_fee=(amount * fee_percent / 100) if types[index] != "other" else None,
+                    blaffa_fee=(amount / 100).quantize(Decimal("0.01")),
+                    user_mobcash_id=str(rng.randint(1, 200_000)),
+                    source=sources[index],
+                    type=types[index],
+                    api=apis[index],
+                    network=networks[index],
+                    mobcash=mobcashes[index],
+                )
+            )
+        return transactions
+
+    def spread_dates(self):
+        """
+        created_at est en auto_now_add : les dates sont réparties après insertion,
+        par un UPDATE par (jour, heure) sur une plage d'ids
+        """
+        transactions = Transaction.objects.filter(reference__startswith=REFERENCE_PREFIX)
+        total = transactions.count()
+        if not total:
+            return
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        hours = sorted(
+            now - timedelta(days=day, hours=hour)
+            for day in range(self.days)
+            for hour in range(24)
+        )
+        counts = self.count_per_hour(hours, total)
+
+        # Ids croissants -> dates croissantes : une plage d'ids par heure,
+        # bornée par une lecture d'index (id > précédent, OFFSET count - 1)
+        previous = 0
+        for bucket, count in zip(hours, counts):
+            if not count:
+                continue
+            last = list(
+                transactions.filter(id__gt=previous)
+                .order_by("id")
+                .values_list("id", flat=True)[count - 1 : count]
+            )
+            if not last:
+                break
+            transactions.filter(id__gt=previous, id__lte=last[0]).update(
+                created_at=bucket + timedelta(seconds=self.rng.randint(0, 3599))
+            )
+            previous = last[0]
+
+    def count_per_hour(self, hours, total: int):
+        """
+        Nombre de transactions par heure (tirage pondéré par HOUR_WEIGHTS), par lots
+        """
+        cum_weights, running = [], 0
+        for bucket in hours:
+            running += HOUR_WEIGHTS[bucket.hour]
+            cum_weights.append(running)
+
+        counts = Counter()
+        positions = range(len(hours))
+        drawn = 0
+        while drawn < total:
+            size = min(self.batch_size * 20, total - drawn)
+            counts.update(self.rng.choices(positions, cum_weights=cum_weights, k=size))
+            drawn += size
+        return [counts[position] for position in positions]
+
+    def seed_balance_history(self, points_per_entity: int) -> int:
+        """
+        Historique de balance (marche aléatoire) pour chaque API et app MobCash du benchmark
+        Seules les entités sans historique sont complétées : l'historique existant
+        (entités réelles, exécution précédente) n'est jamais enrichi
+        """
+        self.ensure_configs()
+        now = timezone.now()
+        step = timedelta(days=self.days) / max(points_per_entity, 1)
+        created = 0
+        for entities, history, field in (
+            (APITransaction.objects.all(), APIBalanceUpdate, "api_transaction"),
+            (MobCashApp.objects.filter(name__in=MOBCASH_NAMES), MobCashAppBalanceUpdate, "mobcash_balance"),
+        ):
+            for entity in entities.filter(**{f"{history._meta.model_name}__isnull": True}):
+                balance = Decimal(self.rng.randint(100_000, 5_000_000))
+                rows = []
+                for _ in range(points_per_entity):
+                    balance = max(Decimal(0), balance + Decimal(self.rng.randint(-50_000, 50_000)))
+                    rows.append(history(**{field: entity, "balance": balance}))
+                objs = history.objects.bulk_create(rows, batch_size=self.batch_size)
+                # created_at en auto_now_add : dates fixées après coup, du plus ancien au plus récent
+                for index, obj in enumerate(objs):
+                    obj.created_at = now - step * (points_per_entity - index)
+                history.objects.bulk_update(objs, ["created_at"], batch_size=self.batch_size)
+                created += len(objs)
+        return created
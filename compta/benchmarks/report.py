@@ -0,0 +1,45 @@
+import json
+from typing import Any, Dict, List
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(path: str, report: Dict[str, Any]):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    Écarts par (taille, scénario) présents dans les deux rapports
+    Une ligne est une régression si p50 / p95 augmente de plus de `threshold` %
+    ou si le nombre de requêtes augmente
+    """
+    previous_results = {
+        (result["rows"], name): metrics
+        for result in previous.get("results", [])
+        for name, metrics in result["scenarios"].items()
+    }
+
+    lines = []
+    for result in current.get("results", []):
+        for name, metrics in result["scenarios"].items():
+            before = previous_results.get((result["rows"], name))
+            if before is None:
+                continue
+            line = {"rows": result["rows"], "scenario": name, "regression": False}
+            for key in ("p50_ms", "p95_ms"):
+                change = (
+                    (metrics[key] - before[key]) / before[key] * 100 if before[key] else 0
+                )
+                line[key] = {"before": before[key], "after": metrics[key], "change": round(change, 1)}
+                if change > threshold:
+                    line["regression"] = True
+            line["queries"] = {"before": before["queries"], "after": metrics["queries"]}
+            if metrics["queries"] > before["queries"]:
+                line["regression"] = True
+            lines.append(line)
+    return lines
@@ -0,0 +1,169 @@
+import statistics
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from compta.benchmarks.generator import MOBCASH_NAMES
+from compta.services.snapshot_service import SnapshotService
+
+
+def percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class BenchmarkRunner:
+    """
+    Mesure les chemins critiques : nombre de requêtes SQL et latence p50 / p95
+
+    Les appels sortants (Pusher, Telegram, Celery) sont remplacés par des
+    no-op pendant la mesure pour ne mesurer que le travail local.
+    """
+
+    def __init__(self, repeat: int = 20, warmup: int = 2):
+        self.repeat = repeat
+        self.warmup = warmup
+        self.counter = 0
+        self.user = self.get_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def get_user() -> User:
+        user, _ = User.objects.get_or_create(
+            username="benchmark", defaults={"is_staff": True, "email": "benchmark@example.com"}
+        )
+        return user
+
+    def get_scenarios(self) -> Dict[str, Callable[[], Any]]:
+        return {
+            "dashboard_cold": self.dashboard_cold,
+            "dashboard_warm": self.dashboard_warm,
+            "dashboard_compare": self.dashboard_compare,
+            "batch_stats": self.batch_stats,
+            "series_90_days": self.series_90_days,
+            "transactions_page": self.transactions_page,
+            "send_stats_to_user": self.send_stats_to_user,
+            "create_transaction": self.create_transaction,
+            "send_compta_summary": self.send_compta_summary,
+        }
+
+    def run(self, names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        scenarios = self.get_scenarios()
+        results = {}
+        with ExitStack() as stack:
+            self.patch_outbound(stack)
+            for name in names or scenarios:
+                results[name] = self.measure(scenarios[name])
+        return results
+
+    @staticmethod
+    def patch_outbound(stack: ExitStack):
+        from compta import tasks
+        from compta.services.pusher_publisher import PusherPublisher
+
+        stack.enter_context(mock.patch.object(PusherPublisher, "send"))
+        stack.enter_context(mock.patch.object(tasks.flush_pusher_events, "apply_async"))
+        stack.enter_context(mock.patch.object(tasks, "send_telegram_message"))
+        stack.enter_context(mock.patch.object(tasks.flush_balance_refresh, "apply_async"))
+
+    def measure(self, scenario: Callable[[], Any]) -> Dict[str, Any]:
+        for _ in range(self.warmup):
+            scenario()
+
+        durations, queries = [], []
+        for _ in range(self.repeat):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                scenario()
+                durations.append((time.perf_counter() - start) * 1000)
+            queries.append(len(captured))
+
+        return {
+            "runs": self.repeat,
+            "queries": int(statistics.median(queries)),
+            "p50_ms": round(percentile(durations, 50), 2),
+            "p95_ms": round(percentile(durations, 95), 2),
+            "mean_ms": round(statistics.fmean(durations), 2),
+        }
+
+    @staticmethod
+    def check(response, path: str):
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} : statut {response.status_code}")
+        return response
+
+    def get(self, path: str, params: Dict[str, Any]):
+        return self.check(self.client.get(path, params), path)
+
+    def dashboard_cold(self):
+        SnapshotService.invalidate_all()
+        self.get("/compta/compta", {"last": "30_days"})
+
+    def dashboard_warm(self):
+        self.get("/compta/compta", {"last": "30_days"})
+
+    def dashboard_compare(self):
+        self.get("/compta/compta", {"last": "7_days", "compare": "previous"})
+
+    def batch_stats(self):
+        response = self.client.post(
+            "/compta/compta/batch",
+            {
+                "windows": {
+                    "today": {},
+                    "yesterday": {"last": "yesterday"},
+                    "7_days": {"last": "7_days"},
+                    "30_days": {"last": "30_days"},
+                }
+            },
+            format="json",
+        )
+        self.check(response, "/compta/compta/batch")
+
+    def series_90_days(self):
+        start = timezone.now() - timedelta(days=90)
+        self.get(
+            "/compta/series",
+            {"start_date": start.isoformat(), "granularity": "day", "split": "api"},
+        )
+
+    def transactions_page(self):
+        self.get("/compta/transactions", {"last": "30_days", "page_size": 50})
+
+    def send_stats_to_user(self):
+        from compta.views import send_stats_to_user
+
+        SnapshotService.invalidate_all()
+        send_stats_to_user()
+
+    def create_transaction(self):
+        self.counter += 1
+        response = self.client.post(
+            "/compta/transaction",
+            {
+                # Hors REFERENCE_PREFIX : ne compte pas dans la taille générée
+                "reference": f"benchmark_create-{time.time_ns()}-{self.counter}",
+                "amount": "5000",
+                "user_mobcash_id": "benchmark",
+                "source": "mobile",
+                "type": "depot",
+                "api": "connect",
+                "network": "mtn",
+                "mobcash": MOBCASH_NAMES[0],
+            },
+            format="json",
+        )
+        self.check(response, "/compta/transaction")
+
+    def send_compta_summary(self):
+        from compta.tasks import send_compta_summary
+
+        send_compta_summary()
@@ -0,0 +1,148 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import transaction as db_transaction
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "compta:config:invalidate"
+
+
+class ConfigRegistry:
+    """
+    Registre en mémoire (par processus) des configs MobCashApp / APITransaction
+
+    Les lignes sont chargées en une requête par modèle puis servies pendant
+    COMPTA_CONFIG_TTL secondes. Une modification (post_save / post_delete,
+    vues de mise à jour) vide le registre local et, si COMPTA_CONFIG_REDIS_URL
+    est défini, est diffusée sur Redis pour que chaque processus
+    (gunicorn, daphne, celery) oublie ses entrées.
+
+    Les instances retournées sont partagées : ne les modifier que pour un
+    save(update_fields=...) qui invalide le registre.
+    """
+
+    _entries: Dict[str, Dict] = {}
+    _generation = 0
+    _lock = threading.Lock()
+    _listener_pid: Optional[int] = None
+
+    @staticmethod
+    def get_ttl() -> int:
+        return getattr(settings, "COMPTA_CONFIG_TTL", 30)
+
+    @staticmethod
+    def get_label(model) -> str:
+        return model._meta.label_lower
+
+    @staticmethod
+    def load(model) -> Dict[str, object]:
+        ConfigRegistry.start_listener()
+        label = ConfigRegistry.get_label(model)
+        now = time.monotonic()
+
+        entry = ConfigRegistry._entries.get(label)
+        if entry is not None and now - entry["loaded_at"] < ConfigRegistry.get_ttl():
+            return entry["rows"]
+
+        generation = ConfigRegistry._generation
+        rows = {}
+        for obj in model.objects.order_by("id"):
+            # Noms en double (APITransaction) : la plus ancienne ligne, comme filter(...).first()
+            rows.setdefault(obj.name, obj)
+        with ConfigRegistry._lock:
+            # Une invalidation pendant le chargement l'emporte
+            if ConfigRegistry._generation == generation:
+                ConfigRegistry._entries[label] = {"rows": rows, "loaded_at": now}
+        return rows
+
+    @staticmethod
+    def all(model) -> List[object]:
+        return list(ConfigRegistry.load(model).values())
+
+    @staticmethod
+    def get(model, name: str):
+        rows = ConfigRegistry.load(model)
+        if name not in rows:
+            # Créée par un autre processus sans diffusion : relire une fois
+            ConfigRegistry.clear(ConfigRegistry.get_label(model))
+            rows = ConfigRegistry.load(model)
+        return rows.get(name)
+
+    @staticmethod
+    def invalidate(model=None, broadcast: bool = True):
+        """
+        Vide le registre local (un modèle ou tout) et prévient les autres processus
+        La diffusion part après le commit pour qu'ils ne relisent pas l'ancienne ligne
+        """
+        label = ConfigRegistry.get_label(model) if model is not None else None
+        ConfigRegistry.clear(label)
+        if broadcast and ConfigRegistry.get_redis_url():
+            db_transaction.on_commit(lambda: ConfigRegistry.publish(label))
+
+    @staticmethod
+    def clear(label: Optional[str] = None):
+        with ConfigRegistry._lock:
+            ConfigRegistry._generation += 1
+            if label is None:
+                ConfigRegistry._entries = {}
+            else:
+                ConfigRegistry._entries.pop(label, None)
+
+    @staticmethod
+    def get_redis_url() -> Optional[str]:
+        return getattr(settings, "COMPTA_CONFIG_REDIS_URL", None)
+
+    @staticmethod
+    def publish(label: Optional[str]):
+        try:
+            import redis
+
+            client = redis.Redis.from_url(ConfigRegistry.get_redis_url())
+            client.publish(INVALIDATION_CHANNEL, label or "*")
+        except Exception as e:
+            # Le TTL borne la durée pendant laquelle les autres processus restent en retard
+            logger.warning("Diffusion de l'invalidation des configs impossible : %s", e)
+
+    @staticmethod
+    def start_listener():
+        """
+        Démarre (une fois par processus, y compris après un fork) le thread
+        qui écoute les invalidations diffusées par les autres processus
+        """
+        url = ConfigRegistry.get_redis_url()
+        pid = os.getpid()
+        if not url or ConfigRegistry._listener_pid == pid:
+            return
+        with ConfigRegistry._lock:
+            if ConfigRegistry._listener_pid == pid:
+                return
+            ConfigRegistry._listener_pid = pid
+            # Un processus forké hérite du registre du parent sans son thread d'écoute
+            ConfigRegistry._entries = {}
+
+        thread = threading.Thread(
+            target=ConfigRegistry.listen, args=(url,), name="compta-config-registry", daemon=True
+        )
+        thread.start()
+
+    @staticmethod
+    def listen(url: str):
+        import redis
+
+        while True:
+            try:
+                pubsub = redis.Redis.from_url(url).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Des messages ont pu être manqués pendant la (re)connexion
+                ConfigRegistry.clear()
+                for message in pubsub.listen():
+                    label = message["data"].decode()
+                    ConfigRegistry.clear(None if label == "*" else label)
+            except Exception as e:
+                logger.warning("Écoute des invalidations de configs interrompue : %s", e)
+                ConfigRegistry.clear()
+                time.sleep(5)
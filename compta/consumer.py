@@ -1,40 +1,201 @@
-from channels.generic.websocket import JsonWebsocketConsumer
-from asgiref.sync import async_to_sync
+import asyncio
+import logging
+from typing import Dict, Optional
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from compta.services.subscription_service import SubscriptionService
 
+logger = logging.getLogger(__name__)
 
-class JsonWebsocketConsumer(JsonWebsocketConsumer):
-    def connect(self):
-        print("🟢 WebSocket consumer.connect() called for user", self.scope["user"])
+# Dernière trame "stat_data" lue par groupe, partagée par les sockets du processus
+_frames: Dict[str, Dict] = {}
+_fetches: Dict[str, asyncio.Future] = {}
+
+
+async def get_latest_frame(group: str, version: int) -> Optional[Dict]:
+    """
+    Dernière trame du groupe, au moins de la version demandée si possible
+    Une seule lecture du cache à la fois par groupe pour tout le processus
+    """
+    frame = _frames.get(group)
+    if frame is not None and frame["version"] >= version:
+        return frame
+
+    fetch = _fetches.get(group)
+    if fetch is None:
+        fetch = asyncio.ensure_future(
+            sync_to_async(SubscriptionService.get_frame, thread_sensitive=False)(group)
+        )
+        _fetches[group] = fetch
+        fetch.add_done_callback(lambda _: _fetches.pop(group, None))
+    frame = await asyncio.shield(fetch)
+
+    if frame is not None and frame["version"] > _frames.get(group, {}).get("version", 0):
+        _frames[group] = frame
+    return _frames.get(group, frame)
+
+
+class StatsConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Stats temps réel par websocket (admins uniquement)
+
+    À la connexion, l'admin est abonné au groupe de son filtre sauvegardé ;
+    il peut en changer avec {"action": "subscribe", "filters": {...}}
+    (mêmes clés que /compta/compta). Les sockets qui partagent un filtre
+    normalisé partagent le groupe : send_stats_to_user calcule et sérialise
+    les stats une fois par groupe. Le consumer est asynchrone : une socket
+    inactive n'occupe aucun thread.
+
+    Les snapshots "stat_data" sont livrés en "dernier gagnant" : une
+    notification ne fait que relever la version attendue, au plus un envoi
+    est en attente par connexion et il lit la trame la plus récente au moment
+    de partir, au plus une fois par COMPTA_LIVE_STATS_MIN_INTERVAL secondes.
+    Les deltas portent une version du même compteur : reçus pendant qu'un
+    envoi est en attente, ils sont gardés et envoyés après le snapshot s'ils
+    sont plus récents ; un snapshot plus ancien que le dernier envoi est ignoré.
+    """
+
+    stats_group = None
+    flush_task = None
+    pending_version = 0
+    delivered_version = 0
+    pending_deltas = ()
+    last_sent_at = float("-inf")
+
+    async def connect(self):
         user = self.scope["user"]
-        if not user.is_authenticated:
-            print("User non authentifie")
-            self.close()
-        else:
-            print("User authentifie")
-            self.accept()
-            self.group_name = f"private_channel_{str(user.id)}"
-            async_to_sync(self.channel_layer.group_add)(
-                self.group_name, self.channel_name
-            )
-
-    def notification(self, event):
-        self.send_json(
+        if not user.is_authenticated or not user.is_staff:
+            logger.debug("Websocket refusée pour %s", user)
+            await self.close()
+            return
+
+        await self.accept()
+        self.user_group = f"private_channel_{user.id}"
+        await self.channel_layer.group_add(self.user_group, self.channel_name)
+
+        definition = await database_sync_to_async(SubscriptionService.get_user_definition)(user)
+        await self.subscribe(definition)
+        self.keep_alive_task = asyncio.ensure_future(self.keep_alive())
+
+    async def subscribe(self, definition):
+        group = await sync_to_async(SubscriptionService.register, thread_sensitive=False)(
+            definition
+        )
+        self.definition = definition
+        if group == self.stats_group:
+            return
+        if self.stats_group:
+            await self.channel_layer.group_discard(self.stats_group, self.channel_name)
+        await self.channel_layer.group_add(group, self.channel_name)
+        self.stats_group = group
+
+        # Nouveau groupe : versions remises à zéro, dernière trame connue envoyée
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        self.pending_version = self.delivered_version = 0
+        self.pending_deltas = []
+        if SubscriptionService.is_coalesced():
+            _frames.pop(group, None)
+            await self.stats_latest({"version": 1})
+
+    async def keep_alive(self):
+        """
+        Prolonge l'abonnement tant que la socket est ouverte
+        """
+        while True:
+            await asyncio.sleep(SubscriptionService.get_ttl() / 3)
+            try:
+                await self.subscribe(self.definition)
+            except Exception as e:
+                logger.warning("Renouvellement de l'abonnement impossible : %s", e)
+
+    async def receive_json(self, content, **kwargs):
+        if not isinstance(content, dict) or content.get("action") != "subscribe":
+            await self.send_json({"type": "error", "erreur": "Action inconnue"})
+            return
+        try:
+            definition = SubscriptionService.get_definition(content.get("filters") or {})
+        except (AttributeError, ValueError) as e:
+            await self.send_json({"type": "error", "erreur": str(e)})
+            return
+        await self.subscribe(definition)
+        await self.send_json({"type": "subscribed", "filters": definition})
+
+    async def notification(self, event):
+        await self.send_json(
             {
                 "data": event.get("data"),
                 "type": event.get("type"),
             }
         )
 
-    def stat_data(self, event):
-        print(f"Le statistic a ete envoyer avec {event}")
-        self.send_json({"type": "stat_data", "data": event.get("data")})
+    async def stat_data(self, event):
+        await self.send_json({"type": "stat_data", "data": event.get("data")})
 
-    def disconnect(self, code):
-        print("User est deconnecter")
-        user = self.scope["user"]
-        if not user.is_authenticated:
-            self.close()
-        else:
-            async_to_sync(self.channel_layer.group_discard)(
-                self.group_name, self.channel_name
-            )
+    async def stats_latest(self, event):
+        """
+        Un snapshot plus récent est disponible pour le groupe (livraison "coalesce")
+        """
+        self.pending_version = max(self.pending_version, event["version"])
+        if self.pending_version > self.delivered_version and self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """
+        Snapshots en attente puis deltas gardés, par version croissante ;
+        ce qui arrive pendant un envoi est traité par la même boucle
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while self.pending_version > self.delivered_version or self.pending_deltas:
+                if self.pending_version <= self.delivered_version:
+                    # Deltas déjà inclus dans le snapshot envoyé : abandonnés
+                    version, text = self.pending_deltas.pop(0)
+                    if version > self.delivered_version:
+                        await self.send(text_data=text)
+                        self.delivered_version = version
+                    continue
+
+                delay = self.last_sent_at + SubscriptionService.get_min_interval() - loop.time()
+                if delay > 0:
+                    # Les notifications reçues pendant l'attente ne font que relever pending_version
+                    await asyncio.sleep(delay)
+
+                target = self.pending_version
+                frame = await get_latest_frame(self.stats_group, target)
+                if frame is None:
+                    # Trame expirée : seuls les deltas gardés restent à envoyer
+                    self.pending_version = self.delivered_version
+                    continue
+                if frame["version"] > self.delivered_version:
+                    await self.send(text_data=frame["text"])
+                    self.last_sent_at = loop.time()
+                # Une trame plus ancienne que la notification a été remplacée entre-temps
+                self.delivered_version = max(self.delivered_version, frame["version"], target)
+        finally:
+            if self.flush_task is asyncio.current_task():
+                self.flush_task = None
+
+    async def stats_message(self, event):
+        # Trame déjà sérialisée une fois pour tout le groupe
+        version = event.get("version")
+        if version is None:
+            await self.send(text_data=event["text"])
+            return
+        if version <= self.delivered_version:
+            return
+        if self.flush_task is not None:
+            self.pending_deltas.append((version, event["text"]))
+            return
+        await self.send(text_data=event["text"])
+        self.delivered_version = version
+
+    async def disconnect(self, code):
+        for task in (getattr(self, "keep_alive_task", None), self.flush_task):
+            if task is not None:
+                task.cancel()
+        for group in (getattr(self, "user_group", None), getattr(self, "stats_group", None)):
+            if group:
+                await self.channel_layer.group_discard(group, self.channel_name)
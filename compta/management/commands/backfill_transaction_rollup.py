@@ -0,0 +1,48 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+from compta.models import Transaction
+from compta.services.rollup_service import RollupService, ceil_hour
+
+
+def parse_bound(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Date invalide : {value}")
+        parsed = timezone.datetime.combine(day, timezone.datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Reconstruit la table TransactionRollup depuis Transaction, jour par jour"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="Date de début (incluse), défaut : première transaction")
+        parser.add_argument("--end", help="Date de fin (exclue), défaut : maintenant")
+
+    def handle(self, *args, **options):
+        bounds = Transaction.objects.aggregate(first=Min("created_at"))
+        if bounds["first"] is None:
+            self.stdout.write("Aucune transaction à agréger")
+            return
+
+        start = parse_bound(options["start"]) if options["start"] else bounds["first"]
+        end = parse_bound(options["end"]) if options["end"] else timezone.now()
+        # Ne jamais reconstruire une heure à moitié
+        end = ceil_hour(end)
+
+        total = 0
+        # Une transaction par jour : la commande peut être relancée après interruption
+        for day in RollupService.iter_days(start, end):
+            day_end = min(day + timedelta(days=1), end)
+            created = RollupService.rebuild_range(day, day_end)
+            total += created
+            self.stdout.write(f"{day.date()} : {created} agrégats")
+
+        self.stdout.write(self.style.SUCCESS(f"{total} agrégats horaires reconstruits"))
@@ -0,0 +1,105 @@
+import io
+import platform
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from compta.benchmarks import report
+from compta.benchmarks.generator import TransactionGenerator
+from compta.benchmarks.runner import BenchmarkRunner
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère des données synthétiques puis mesure requêtes SQL et latence p50 / p95 "
+        "des chemins critiques à chaque taille demandée "
+        "(base dédiée uniquement, désignée par COMPTA_BENCHMARK_DATABASE)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            nargs="+",
+            default=[10_000],
+            help="Tailles successives de la table Transaction (ex : 10000 1000000 10000000)",
+        )
+        parser.add_argument("--repeat", type=int, default=20, help="Mesures par scénario")
+        parser.add_argument("--scenario", nargs="+", help="Scénarios à mesurer (défaut : tous)")
+        parser.add_argument("--days", type=int, default=365, help="Étendue des dates générées")
+        parser.add_argument("--history-points", type=int, default=2000, help="Points d'historique par API / app")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", default="benchmark.json", help="Fichier JSON des résultats")
+        parser.add_argument("--compare", help="Rapport JSON précédent à comparer")
+        parser.add_argument("--threshold", type=float, default=20, help="Régression au-delà de ce % (p50 / p95)")
+
+    def handle(self, *args, **options):
+        # Garde explicite : DEBUG ne dit rien de la base visée
+        dedicated = getattr(settings, "COMPTA_BENCHMARK_DATABASE", None)
+        if not dedicated or connection.settings_dict["NAME"] != dedicated:
+            raise CommandError(
+                "Cette commande insère des millions de lignes : à lancer uniquement sur la base "
+                f"dédiée désignée par COMPTA_BENCHMARK_DATABASE (base actuelle : "
+                f"{connection.settings_dict['NAME']})"
+            )
+
+        runner = BenchmarkRunner(repeat=options["repeat"])
+        unknown = set(options["scenario"] or []) - set(runner.get_scenarios())
+        if unknown:
+            raise CommandError(f"Scénarios inconnus : {', '.join(sorted(unknown))}")
+
+        generator = TransactionGenerator(seed=options["seed"], days=options["days"])
+        self.stdout.write(f"Historique de balance : {generator.seed_balance_history(options['history_points'])} points")
+
+        results = []
+        for rows in sorted(options["rows"]):
+            created = generator.seed_transactions(rows)
+            self.stdout.write(f"{rows} transactions ({created} ajoutées)")
+            if created:
+                call_command("backfill_transaction_rollup", stdout=io.StringIO())
+                self.analyze()
+
+            scenarios = runner.run(options["scenario"])
+            for name, metrics in scenarios.items():
+                self.stdout.write(
+                    f"  {name:<22} {metrics['queries']:>4} requêtes  "
+                    f"p50 {metrics['p50_ms']:>9.2f} ms  p95 {metrics['p95_ms']:>9.2f} ms"
+                )
+            results.append({"rows": rows, "scenarios": scenarios})
+
+        current = {
+            "created_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "repeat": options["repeat"],
+            "results": results,
+        }
+        report.save(options["output"], current)
+        self.stdout.write(self.style.SUCCESS(f"Résultats enregistrés dans {options['output']}"))
+
+        if options["compare"]:
+            self.print_comparison(current, report.load(options["compare"]), options["threshold"])
+
+    def analyze(self):
+        # Statistiques du planificateur à jour après un gros import
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+    def print_comparison(self, current, previous, threshold):
+        regressions = 0
+        for line in report.compare(current, previous, threshold):
+            text = (
+                f"{line['rows']:>9} {line['scenario']:<22} "
+                f"p50 {line['p50_ms']['before']:.2f} -> {line['p50_ms']['after']:.2f} ({line['p50_ms']['change']:+.1f}%)  "
+                f"p95 {line['p95_ms']['before']:.2f} -> {line['p95_ms']['after']:.2f} ({line['p95_ms']['change']:+.1f}%)  "
+                f"requêtes {line['queries']['before']} -> {line['queries']['after']}"
+            )
+            if line["regression"]:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(text))
+            else:
+                self.stdout.write(text)
+        if regressions:
+            self.stdout.write(self.style.WARNING(f"{regressions} régression(s) au-delà de {threshold}%"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from compta.services.balance_retention_service import BalanceRetentionService
+
+
+class Command(BaseCommand):
+    help = (
+        "Compacte l'historique des balances selon COMPTA_BALANCE_RETENTION "
+        "(points bruts -> heures -> jours) ; peut être relancée après interruption"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-chunks", type=int, help="Nombre maximum de lots à traiter")
+
+    def handle(self, *args, **options):
+        stats = BalanceRetentionService.run(max_chunks=options["max_chunks"])
+        for step, total in stats.items():
+            self.stdout.write(f"{step} : {total} ligne(s) compactée(s)")
+        self.stdout.write(self.style.SUCCESS("Compaction terminée"))
@@ -0,0 +1,40 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Min
+from compta.models import Transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime les transactions en double sur (reference, api) en gardant la première, "
+        "à lancer avant d'appliquer la contrainte unique_transaction_reference_api"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Affiche les doublons sans les supprimer")
+        parser.add_argument("--skip-rollup", action="store_true", help="Ne pas reconstruire TransactionRollup")
+
+    def handle(self, *args, **options):
+        duplicates = (
+            Transaction.objects.filter(reference__isnull=False)
+            .order_by()
+            .values("reference", "api")
+            .annotate(first_id=Min("id"), total=Count("id"))
+            .filter(total__gt=1)
+        )
+
+        deleted = 0
+        for duplicate in duplicates:
+            extra = Transaction.objects.filter(
+                reference=duplicate["reference"], api=duplicate["api"]
+            ).exclude(id=duplicate["first_id"])
+            self.stdout.write(
+                f"{duplicate['reference']} / {duplicate['api']} : {duplicate['total'] - 1} doublon(s)"
+            )
+            if not options["dry_run"]:
+                deleted += extra.delete()[0]
+
+        if deleted and not options["skip_rollup"]:
+            call_command("backfill_transaction_rollup", stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(f"{deleted} transaction(s) supprimée(s)"))
@@ -0,0 +1,71 @@
+import re
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from compta.services.filter_service import FilterService
+from compta.services.rollup_service import floor_hour
+from compta.services.stats_services import StatsService
+from compta.services.transaction_service import TransactionService
+
+INDEX_PATTERN = re.compile(r"(?:Index Only Scan|Index Scan|Bitmap Index Scan)(?: Backward)? (?:using|on) (\w+)")
+SEQ_SCAN_PATTERN = re.compile(r"Seq Scan on (\w+)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Exécute EXPLAIN ANALYZE sur les requêtes standard du dashboard "
+        "et indique si elles utilisent les index de Transaction"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--last", default="7_days", help="Fenêtre 'last' utilisée pour les requêtes (défaut : 7_days)")
+        parser.add_argument("--api", action="append", default=[], help="Filtre api (répétable)")
+        parser.add_argument("--mobcash", action="append", default=[], help="Filtre mobcash (répétable)")
+        parser.add_argument("--verbose-plan", action="store_true", help="Affiche le plan complet")
+
+    def get_queries(self, options):
+        filters = FilterService.process_dates(
+            {
+                "last": options["last"],
+                "is_all_date": False,
+                "source": [],
+                "network": [],
+                "api": options["api"],
+                "type": [],
+                "mobcash": options["mobcash"],
+            }
+        )
+        transactions = FilterService.apply_filters(
+            TransactionService.get_all_transactions(), filters
+        )
+
+        return [
+            ("Liste des transactions (50 dernières)", transactions[:50]),
+            ("GROUP BY des statistiques", StatsService.get_grouped_queryset(transactions)),
+            (
+                "GROUP BY de l'heure en cours (lecture brute à côté du rollup)",
+                StatsService.get_grouped_queryset(
+                    transactions.filter(created_at__gte=floor_hour(timezone.now()))
+                ),
+            ),
+        ]
+
+    def handle(self, *args, **options):
+        is_postgres = connection.vendor == "postgresql"
+        if not is_postgres:
+            self.stdout.write(self.style.WARNING("Base non PostgreSQL : EXPLAIN sans ANALYZE"))
+
+        for label, queryset in self.get_queries(options):
+            plan = queryset.explain(analyze=True, buffers=True) if is_postgres else queryset.explain()
+            indexes = sorted(set(INDEX_PATTERN.findall(plan)))
+            seq_scans = sorted(set(SEQ_SCAN_PATTERN.findall(plan)))
+
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            if indexes:
+                self.stdout.write(self.style.SUCCESS(f"  Index utilisés : {', '.join(indexes)}"))
+            if seq_scans:
+                self.stdout.write(self.style.ERROR(f"  Seq Scan sur : {', '.join(seq_scans)}"))
+            if not indexes and not seq_scans:
+                self.stdout.write("  Aucun accès table détecté dans le plan")
+            if options["verbose_plan"]:
+                self.stdout.write(plan)
@@ -0,0 +1,74 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from django.db.models import F, Max, Min
+from django.db.models.functions import Lower, Trim
+from compta.models import APITransaction, MobCashApp, Transaction, UserTransactionFilter
+from compta.services.filter_service import FilterService
+from compta.utils import DIMENSION_FIELDS, normalize_dimension
+
+
+class Command(BaseCommand):
+    help = (
+        "Met en minuscules les dimensions (source, network, api, type, mobcash) "
+        "des transactions existantes, des configs MobCash/API et des filtres sauvegardés"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=10000, help="Nombre d'ids par UPDATE")
+        parser.add_argument("--skip-rollup", action="store_true", help="Ne pas reconstruire TransactionRollup")
+
+    def handle(self, *args, **options):
+        self.normalize_transactions(options["chunk_size"])
+        self.normalize_configs(MobCashApp)
+        self.normalize_configs(APITransaction)
+        self.normalize_user_filters()
+
+        if not options["skip_rollup"]:
+            # Les agrégats horaires ont été construits avec l'ancienne casse
+            call_command("backfill_transaction_rollup", stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS("Dimensions normalisées"))
+
+    def normalize_transactions(self, chunk_size):
+        bounds = Transaction.objects.aggregate(first=Min("id"), last=Max("id"))
+        if bounds["first"] is None:
+            return
+
+        updated = 0
+        # Tranches d'ids : verrous courts, relançable après interruption
+        for low in range(bounds["first"], bounds["last"] + 1, chunk_size):
+            chunk = Transaction.objects.filter(id__gte=low, id__lt=low + chunk_size)
+            with db_transaction.atomic():
+                for field in DIMENSION_FIELDS:
+                    updated += (
+                        chunk.annotate(normalized=Lower(Trim(field)))
+                        .exclude(**{field: F("normalized")})
+                        .update(**{field: Lower(Trim(field))})
+                    )
+        self.stdout.write(f"Transactions : {updated} valeurs normalisées")
+
+    def normalize_configs(self, model):
+        for obj in model.objects.all():
+            name = normalize_dimension(obj.name)
+            if name == obj.name:
+                continue
+            if model.objects.filter(name=name).exclude(pk=obj.pk).exists():
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"{model.__name__} '{obj.name}' ignoré : '{name}' existe déjà"
+                    )
+                )
+                continue
+            obj.name = name
+            obj.save(update_fields=["name"])
+
+    def normalize_user_filters(self):
+        for user_filter in UserTransactionFilter.objects.all():
+            for field in DIMENSION_FIELDS:
+                setattr(
+                    user_filter,
+                    field,
+                    FilterService.normalize_values(getattr(user_filter, field)),
+                )
+            user_filter.save(update_fields=list(DIMENSION_FIELDS))
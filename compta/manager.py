@@ -0,0 +1,62 @@
+from typing import List
+from django.db import connections, models
+
+
+class TransactionManager(models.Manager):
+
+    def insert_ignore_conflicts(self, objs: List[models.Model], batch_size=500) -> List[models.Model]:
+        """
+        INSERT ... ON CONFLICT (reference, api) DO NOTHING RETURNING id
+        Retourne les objets réellement insérés (pk renseigné), dans l'ordre reçu ;
+        ceux qui violent la contrainte unique (reference, api) sont ignorés en une
+        sonde d'index, toute autre violation d'unicité lève toujours IntegrityError
+        """
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        opts = self.model._meta
+        fields = [field for field in opts.concrete_fields if not field.primary_key]
+        columns = ", ".join(quote_name(field.column) for field in fields)
+        row_placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+
+        inserted = []
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start : start + batch_size]
+            # Sans référence, la contrainte partielle ne s'applique pas : insertion simple
+            unkeyed = [obj for obj in batch if obj.reference is None]
+            keyed = [obj for obj in batch if obj.reference is not None]
+            if unkeyed:
+                self.bulk_create(unkeyed, batch_size=batch_size)
+
+            ids = {}
+            if keyed:
+                params = []
+                for obj in keyed:
+                    for field in fields:
+                        # pre_save renseigne created_at (auto_now_add)
+                        value = field.pre_save(obj, add=True)
+                        params.append(field.get_db_prep_save(value, connection))
+
+                sql = (
+                    f"INSERT INTO {quote_name(opts.db_table)} ({columns}) "
+                    f"VALUES {', '.join([row_placeholder] * len(keyed))} "
+                    f"ON CONFLICT ({quote_name('reference')}, {quote_name('api')}) "
+                    f"WHERE {quote_name('reference')} IS NOT NULL DO NOTHING "
+                    f"RETURNING {quote_name(opts.pk.column)}, {quote_name('reference')}, {quote_name('api')}"
+                )
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    # L'ordre de RETURNING n'est pas garanti : appariement par clé
+                    ids = {(reference, api): pk for pk, reference, api in cursor.fetchall()}
+
+            for obj in batch:
+                if obj.reference is not None:
+                    # pop : un doublon dans le même lot n'est apparié qu'une fois
+                    pk = ids.pop((obj.reference, obj.api), None)
+                    if pk is None:
+                        continue
+                    obj.pk = pk
+                    obj._state.adding = False
+                    obj._state.db = self.db
+                inserted.append(obj)
+
+        return inserted
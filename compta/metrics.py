@@ -0,0 +1,269 @@
+import logging
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = "compta:metrics"
+
+# Métriques exposées : nom -> (type Prometheus, description)
+METRICS = {
+    "compta_http_requests_total": (
+        "counter",
+        "Requêtes HTTP par endpoint, méthode et statut",
+    ),
+    "compta_http_request_duration_seconds": (
+        "histogram",
+        "Durée des requêtes HTTP (jusqu'au premier octet pour les réponses en flux)",
+    ),
+    "compta_http_db_queries": (
+        "summary",
+        "Requêtes SQL exécutées par requête HTTP",
+    ),
+    "compta_http_db_duration_seconds": (
+        "summary",
+        "Temps passé en SQL par requête HTTP",
+    ),
+    "compta_http_response_size_bytes": (
+        "summary",
+        "Taille des réponses HTTP (hors réponses en flux)",
+    ),
+    "compta_task_queue_wait_seconds": (
+        "histogram",
+        "Attente des tâches Celery entre l'envoi (ou l'ETA) et le début de l'exécution",
+    ),
+    "compta_task_duration_seconds": (
+        "histogram",
+        "Durée d'exécution des tâches Celery par état final",
+    ),
+    "compta_task_failures_total": (
+        "counter",
+        "Tâches Celery en échec par exception",
+    ),
+    "compta_task_retries_total": (
+        "counter",
+        "Tâches Celery relancées (retry)",
+    ),
+    "compta_outbound_duration_seconds": (
+        "histogram",
+        "Durée des appels sortants (Blaffa, Telegram, Pusher) par résultat",
+    ),
+    "compta_pusher_events_total": (
+        "counter",
+        "Événements Pusher envoyés, remplacés par un snapshot plus récent, remis en file ou abandonnés",
+    ),
+}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Ordre des lignes d'un histogramme / résumé
+SUFFIX_ORDER = {"_bucket": 0, "_sum": 1, "_count": 2}
+LE_LABEL = re.compile(r'(?:^|,)le="([^"]*)"$')
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_sample(name: str, labels: Dict[str, str], le: Optional[str] = None) -> str:
+    """
+    Ligne d'exposition sans la valeur : nom{label="valeur",...}
+    le est toujours le dernier label (tri des buckets au rendu)
+    """
+    pairs = [f'{key}="{escape_label(value)}"' for key, value in sorted(labels.items())]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return f"{name}{{{','.join(pairs)}}}" if pairs else name
+
+
+def format_bound(bound: float) -> str:
+    return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """
+    Compteurs et histogrammes au format Prometheus, agrégés entre processus
+
+    Avec COMPTA_METRICS_REDIS_URL, chaque échantillon est un champ d'un hash
+    Redis incrémenté par HINCRBYFLOAT : tous les workers (gunicorn, daphne,
+    celery) écrivent dans le même hash et /compta/metrics l'expose tel quel.
+    Sans Redis, les valeurs restent dans le processus courant.
+
+    Une panne du store ne fait jamais échouer la requête mesurée : les
+    échantillons sont perdus et l'erreur journalisée au plus une fois par minute.
+    """
+
+    _local: Dict[str, float] = {}
+    _lock = threading.Lock()
+    _client = None
+    _pid: Optional[int] = None
+    _last_error = 0.0
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return getattr(settings, "COMPTA_METRICS_ENABLED", True)
+
+    @staticmethod
+    def get_buckets() -> Tuple[float, ...]:
+        return tuple(getattr(settings, "COMPTA_METRICS_BUCKETS", DEFAULT_BUCKETS))
+
+    @staticmethod
+    def get_redis_url() -> Optional[str]:
+        return getattr(settings, "COMPTA_METRICS_REDIS_URL", None)
+
+    @staticmethod
+    def get_client():
+        # Un nouveau pool après un fork : les sockets du parent ne sont pas partagées
+        pid = os.getpid()
+        if Metrics._client is not None and Metrics._pid == pid:
+            return Metrics._client
+
+        with Metrics._lock:
+            if Metrics._client is None or Metrics._pid != pid:
+                import redis
+
+                Metrics._client = redis.Redis.from_url(
+                    Metrics.get_redis_url(), socket_timeout=0.5, socket_connect_timeout=0.5
+                )
+                Metrics._pid = pid
+        return Metrics._client
+
+    @staticmethod
+    def add(samples: Dict[str, float], name: str, labels: Dict[str, str], value: float = 1):
+        """
+        Ajoute une observation à un lot d'échantillons selon le type de la métrique
+        """
+        kind = METRICS[name][0]
+        if kind == "counter":
+            sample = format_sample(name, labels)
+            samples[sample] = samples.get(sample, 0) + value
+            return
+
+        if kind == "histogram":
+            # Tous les buckets sont écrits (0 au-dessous de la valeur) : chaque série expose ses bornes
+            for bound in Metrics.get_buckets() + (math.inf,):
+                sample = format_sample(f"{name}_bucket", labels, format_bound(bound))
+                samples[sample] = samples.get(sample, 0) + (1 if value <= bound else 0)
+        for suffix, increment in (("_sum", value), ("_count", 1)):
+            sample = format_sample(f"{name}{suffix}", labels)
+            samples[sample] = samples.get(sample, 0) + increment
+
+    @staticmethod
+    def observe(name: str, labels: Dict[str, str], value: float = 1):
+        samples: Dict[str, float] = {}
+        Metrics.add(samples, name, labels, value)
+        Metrics.record(samples)
+
+    @staticmethod
+    @contextmanager
+    def span(service: str, operation: str):
+        """
+        Chronomètre un appel sortant :
+        with Metrics.span("telegram", "sendMessage") as span:
+            ...
+            span["outcome"] = "error"  # échec sans exception (statut HTTP...)
+        Une exception levée dans le bloc compte comme "error" et est propagée
+        """
+        span = {"outcome": "ok"}
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception:
+            span["outcome"] = "error"
+            raise
+        finally:
+            Metrics.observe(
+                "compta_outbound_duration_seconds",
+                {"service": service, "operation": operation, "outcome": span["outcome"]},
+                time.perf_counter() - start,
+            )
+
+    @staticmethod
+    def record(samples: Dict[str, float]):
+        """
+        Enregistre un lot d'échantillons (un aller-retour Redis)
+        """
+        if not samples or not Metrics.is_enabled():
+            return
+        if not Metrics.get_redis_url():
+            with Metrics._lock:
+                for sample, value in samples.items():
+                    Metrics._local[sample] = Metrics._local.get(sample, 0) + value
+            return
+
+        try:
+            pipeline = Metrics.get_client().pipeline(transaction=False)
+            for sample, value in samples.items():
+                pipeline.hincrbyfloat(METRICS_KEY, sample, value)
+            pipeline.execute()
+        except Exception as e:
+            now = time.monotonic()
+            if now - Metrics._last_error > 60:
+                Metrics._last_error = now
+                logger.warning("Enregistrement des métriques impossible : %s", e)
+
+    @staticmethod
+    def collect() -> Dict[str, float]:
+        if not Metrics.get_redis_url():
+            with Metrics._lock:
+                return dict(Metrics._local)
+        values = Metrics.get_client().hgetall(METRICS_KEY)
+        return {sample.decode(): float(value) for sample, value in values.items()}
+
+    @staticmethod
+    def reset():
+        with Metrics._lock:
+            Metrics._local = {}
+        if Metrics.get_redis_url():
+            Metrics.get_client().delete(METRICS_KEY)
+
+    @staticmethod
+    def render() -> str:
+        """
+        Exposition au format texte Prometheus (version 0.0.4)
+        """
+        grouped: Dict[str, List[Tuple[str, float]]] = {}
+        for sample, value in Metrics.collect().items():
+            base = sample.split("{", 1)[0]
+            for suffix in SUFFIX_ORDER:
+                if base.endswith(suffix) and base[: -len(suffix)] in METRICS:
+                    base = base[: -len(suffix)]
+                    break
+            if base in METRICS:
+                grouped.setdefault(base, []).append((sample, value))
+
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            if name not in grouped:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample, value in sorted(grouped[name], key=lambda item: Metrics.sort_key(name, item[0])):
+                lines.append(f"{sample} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def sort_key(name: str, sample: str):
+        """
+        Regroupe les lignes d'une même série (mêmes labels hors le) et
+        classe les buckets par borne croissante
+        """
+        metric, _, labels = sample.partition("{")
+        labels = labels.rstrip("}")
+        match = LE_LABEL.search(labels)
+        bound = match.group(1) if match else "0"
+        return (
+            labels[: match.start()] if match else labels,
+            SUFFIX_ORDER.get(metric[len(name):], 0),
+            math.inf if bound == "+Inf" else float(bound),
+        )
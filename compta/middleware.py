@@ -0,0 +1,73 @@
+import time
+from contextlib import ExitStack
+from django.db import connections
+from compta.metrics import Metrics
+
+
+class QueryRecorder:
+    """
+    execute_wrapper qui compte les requêtes SQL et leur durée cumulée
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def get_endpoint(request) -> str:
+    """
+    Nom de l'URL résolue, sinon son motif (compta/compta) : une valeur par route,
+    jamais le chemin brut, pour borner le nombre de séries
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.url_name or match.route or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Mesure chaque requête HTTP : latence, nombre et durée des requêtes SQL,
+    taille de la réponse, par endpoint (voir compta.metrics)
+
+    Pour une réponse en flux (export), seule la préparation est mesurée :
+    les requêtes exécutées pendant l'envoi ne sont pas comptées.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not Metrics.is_enabled():
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        labels = {"endpoint": get_endpoint(request), "method": request.method}
+        samples = {}
+        Metrics.add(
+            samples,
+            "compta_http_requests_total",
+            {**labels, "status": str(response.status_code)},
+        )
+        Metrics.add(samples, "compta_http_request_duration_seconds", labels, duration)
+        Metrics.add(samples, "compta_http_db_queries", labels, recorder.count)
+        Metrics.add(samples, "compta_http_db_duration_seconds", labels, recorder.duration)
+        if not response.streaming:
+            Metrics.add(samples, "compta_http_response_size_bytes", labels, len(response.content))
+        Metrics.record(samples)
+        return response
@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction as db_transaction
 from django.contrib.auth.models import User
 
+from compta.manager import TransactionManager
+
 SOURCE_CHOICES = [
     ("web", "Web"),
     ("mobile", "Mobile"),
@@ -49,6 +51,38 @@ class Transaction(models.Model):
     network = models.CharField(max_length=10, choices=NETWORK_CHOICES, blank=True, null=True)
     mobcash = models.CharField(max_length=100)
 
+    objects = TransactionManager()
+
+    def save(self, *args, **kwargs):
+        # post_save (agrégat horaire, voir compta.signals) validé avec l'INSERT / UPDATE
+        with db_transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+
+    class Meta:
+        constraints = [
+            # Idempotence : un partenaire ne peut pas rejouer la même référence
+            models.UniqueConstraint(
+                fields=["reference", "api"],
+                condition=models.Q(reference__isnull=False),
+                name="unique_transaction_reference_api",
+            )
+        ]
+        indexes = [
+            # Plage created_at + tri -created_at, -id (lisible à l'envers) ;
+            # INCLUDE permet un Index Only Scan pour les agrégats du dashboard
+            models.Index(
+                fields=["created_at", "id"],
+                include=["amount", "mobcash_fee", "blaffa_fee", "mobcash", "api", "network", "source", "type"],
+                name="tx_created_at_covering_idx",
+            ),
+            # Dimensions stockées en minuscules : égalité / IN simples (voir normalize_dimension)
+            models.Index(fields=["source", "created_at"], name="tx_source_created_idx"),
+            models.Index(fields=["network", "created_at"], name="tx_network_created_idx"),
+            models.Index(fields=["api", "created_at"], name="tx_api_created_idx"),
+            models.Index(fields=["type", "created_at"], name="tx_type_created_idx"),
+            models.Index(fields=["mobcash", "created_at"], name="tx_mobcash_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.reference} - {self.type} - {self.api}"
 
@@ -75,18 +109,40 @@ class MobCashApp(models.Model):
     balance = models.DecimalField(decimal_places=2, max_digits=10, default=0.0)
     image = models.URLField(blank=True, null=True)
 
+    def get_mobcash_fee(self, transaction_type, amount):
+        """
+        Commission mobcash d'une transaction (None pour les autres types)
+        """
+        if transaction_type == "depot":
+            return (self.deposit_fee_percent * amount) / 100
+        if transaction_type == "retrait":
+            return (self.retrait_fee_percent * amount) / 100
+        return None
+
 
 class APIBalanceUpdate(models.Model):
     api_transaction = models.ForeignKey(APITransaction, on_delete=models.CASCADE, blank=True, null=True)
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Dernière balance connue à une date (BalanceService.get_balances_as_of)
+            models.Index(fields=["api_transaction", "-created_at", "-id"], name="api_balance_as_of_idx"),
+        ]
+
 
 class MobCashAppBalanceUpdate(models.Model):
     mobcash_balance = models.ForeignKey(MobCashApp, on_delete=models.CASCADE, blank=True, null=True)
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Dernière balance connue à une date (BalanceService.get_balances_as_of)
+            models.Index(fields=["mobcash_balance", "-created_at", "-id"], name="mobcash_balance_as_of_idx"),
+        ]
+
 
 class Notification(models.Model):
     reference = models.CharField(max_length=150, blank=True, null=True)
@@ -128,3 +184,79 @@ class UserTransactionFilter(models.Model):
 
 
 # Create your models here.
+
+
+class TransactionRollup(models.Model):
+    """
+    Agrégat horaire des transactions par (heure, mobcash, api, network, source, type)
+    Maintenu à chaque création de transaction et reconstruit par
+    `manage.py backfill_transaction_rollup`
+    """
+
+    bucket = models.DateTimeField()
+    mobcash = models.CharField(max_length=100)
+    api = models.CharField(max_length=20)
+    # "" à la place de NULL pour que la contrainte unique s'applique aussi sans réseau
+    network = models.CharField(max_length=10, blank=True, default="")
+    source = models.CharField(max_length=20)
+    type = models.CharField(max_length=10)
+    count = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    mobcash_fee = models.DecimalField(max_digits=20, decimal_places=2, blank=True, null=True)
+    blaffa_fee = models.DecimalField(max_digits=20, decimal_places=2, blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bucket", "mobcash", "api", "network", "source", "type"],
+                name="unique_transaction_rollup_key",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.bucket} - {self.mobcash} - {self.api} ({self.count})"
+
+
+class BalanceRollup(models.Model):
+    """
+    Historique compacté des balances API / MobCash (ouverture, min, max, clôture)
+    Les points bruts plus anciens que la fenêtre de rétention sont regroupés par heure,
+    puis les heures par jour (voir BalanceRetentionService)
+    """
+
+    RESOLUTION_CHOICES = [
+        ("hour", "Heure"),
+        ("day", "Jour"),
+    ]
+
+    resolution = models.CharField(max_length=4, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()
+    api_transaction = models.ForeignKey(APITransaction, on_delete=models.CASCADE, blank=True, null=True)
+    mobcash_balance = models.ForeignKey(MobCashApp, on_delete=models.CASCADE, blank=True, null=True)
+    open = models.DecimalField(max_digits=10, decimal_places=2)
+    min = models.DecimalField(max_digits=10, decimal_places=2)
+    max = models.DecimalField(max_digits=10, decimal_places=2)
+    close = models.DecimalField(max_digits=10, decimal_places=2)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["resolution", "api_transaction", "bucket"],
+                condition=models.Q(api_transaction__isnull=False),
+                name="unique_api_balance_rollup",
+            ),
+            models.UniqueConstraint(
+                fields=["resolution", "mobcash_balance", "bucket"],
+                condition=models.Q(mobcash_balance__isnull=False),
+                name="unique_mobcash_balance_rollup",
+            ),
+        ]
+        indexes = [
+            # Dernier bucket complet avant une date, toutes résolutions confondues
+            models.Index(fields=["api_transaction", "-bucket"], name="api_balance_rollup_as_of_idx"),
+            models.Index(fields=["mobcash_balance", "-bucket"], name="mobcash_rollup_as_of_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.resolution} {self.bucket} - {self.api_transaction or self.mobcash_balance}"
@@ -4,5 +4,5 @@ from compta import consumer
 
 
 websocket_urlpatterns = [
-    path('ws/socket', consumer.JsonWebsocketConsumer.as_asgi()),
+    path('ws/socket', consumer.StatsConsumer.as_asgi()),
 ]
@@ -1,10 +1,13 @@
 import os
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db import transaction as db_transaction
+from django.db.models.signals import post_save
 from django.utils import timezone
 
+from compta.config_registry import ConfigRegistry
 from compta.models import APIBalanceUpdate, APITransaction, MobCashApp, MobCashAppBalanceUpdate, Notification, Transaction, UserTransactionFilter
-from compta.utils import send_mails, valider_password
+from compta.utils import DIMENSION_FIELDS, normalize_dimension, send_mails, valider_password
 from compta.view_2 import send_telegram_message
 
 
@@ -12,25 +15,50 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = "__all__"
+        # Une référence déjà reçue est un rejeu, pas une erreur de validation
+        validators = []
+
+    is_replay = False
 
     def create(self, validated_data):
+        for field in DIMENSION_FIELDS:
+            if field in validated_data:
+                validated_data[field] = normalize_dimension(validated_data[field])
+
         mobcash_name = validated_data.get("mobcash")
         transaction_type = validated_data.get("type")
         api_name = validated_data.get("api")
 
-        mobcash_config, _ = MobCashApp.objects.get_or_create(name=mobcash_name)
-        api_config, _ = APITransaction.objects.get_or_create(name=api_name)
-
-        if transaction_type == "depot":
-            validated_data["mobcash_fee"] = (
-                mobcash_config.deposit_fee_percent * validated_data.get("amount")
-            ) / 100
-        elif transaction_type == "retrait":
-            validated_data["mobcash_fee"] = (
-                mobcash_config.retrait_fee_percent * validated_data.get("amount")
-            ) / 100
-
-        transaction = Transaction.objects.create(**validated_data)
+        # Configs lues dans le registre ; créées seulement si absentes
+        mobcash_config = ConfigRegistry.get(MobCashApp, mobcash_name)
+        if mobcash_config is None:
+            mobcash_config, _ = MobCashApp.objects.get_or_create(name=mobcash_name)
+        if ConfigRegistry.get(APITransaction, api_name) is None:
+            APITransaction.objects.get_or_create(name=api_name)
+
+        mobcash_fee = mobcash_config.get_mobcash_fee(
+            transaction_type, validated_data.get("amount")
+        )
+        if mobcash_fee is not None:
+            validated_data["mobcash_fee"] = mobcash_fee
+
+        # INSERT ... ON CONFLICT DO NOTHING : un rejeu renvoie la transaction existante
+        transaction = Transaction(**validated_data)
+        # post_save (agrégat horaire) validé avec l'INSERT
+        with db_transaction.atomic():
+            if not Transaction.objects.insert_ignore_conflicts([transaction]):
+                self.is_replay = True
+                return Transaction.objects.get(
+                    reference=transaction.reference, api=transaction.api
+                )
+            post_save.send(
+                sender=Transaction,
+                instance=transaction,
+                created=True,
+                update_fields=None,
+                raw=False,
+                using=transaction._state.db,
+            )
 
         alerts = []
 
@@ -52,6 +80,22 @@ class MobCashAppSerializer(serializers.ModelSerializer):
         model = MobCashApp
         fields = "__all__"
 
+    def to_internal_value(self, data):
+        # Normalisé avant les validateurs de champ (UniqueValidator compare la valeur stockée)
+        if "name" in data:
+            data = data.copy()
+            data["name"] = normalize_dimension(data["name"])
+        return super().to_internal_value(data)
+
+    def validate_name(self, value):
+        # Noms enregistrés avant la normalisation : comparaison sans casse
+        existing = MobCashApp.objects.filter(name__iexact=value)
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError("Une application MobCash porte déjà ce nom.")
+        return value
+
 
 class APITransactionSerializer(serializers.ModelSerializer):
     class Meta:
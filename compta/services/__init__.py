@@ -2,10 +2,32 @@ from .filter_service import FilterService
 from .balance_service import BalanceService
 from .stats_services import StatsService
 from .transaction_service import TransactionService
+from .rollup_service import RollupService
+from .snapshot_service import SnapshotService
+from .dashboard_service import DashboardService
+from .live_stats_service import LiveStatsService
+from .refresh_scheduler import BalanceRefreshScheduler
+from .ingestion_service import IngestionService
+from .balance_retention_service import BalanceRetentionService
+from .export_service import ExportService
+from .series_service import SeriesService
+from .subscription_service import SubscriptionService
+from .pusher_publisher import PusherPublisher
 
 __all__ = [
     "FilterService",
     "BalanceService",
     "StatsService",
     "TransactionService",
+    "RollupService",
+    "SnapshotService",
+    "DashboardService",
+    "LiveStatsService",
+    "BalanceRefreshScheduler",
+    "IngestionService",
+    "BalanceRetentionService",
+    "ExportService",
+    "SeriesService",
+    "SubscriptionService",
+    "PusherPublisher",
 ]
@@ -0,0 +1,184 @@
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Min
+from django.utils import timezone
+from compta.models import APIBalanceUpdate, BalanceRollup, MobCashAppBalanceUpdate
+from compta.services.rollup_service import floor_hour
+
+# Historique brut et clé étrangère correspondante dans BalanceRollup
+BALANCE_SOURCES = {
+    "api": {"history": APIBalanceUpdate, "field": "api_transaction"},
+    "mobcash": {"history": MobCashAppBalanceUpdate, "field": "mobcash_balance"},
+}
+
+
+def floor_day(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def fold_point(points: Dict, key: Tuple, open_, low, high, close, count: int):
+    """
+    Ajoute un point (ou un agrégat) à la fin de son bucket ; les points arrivent dans l'ordre
+    """
+    point = points.get(key)
+    if point is None:
+        points[key] = {"open": open_, "min": low, "max": high, "close": close, "count": count}
+        return
+    point["min"] = min(point["min"], low)
+    point["max"] = max(point["max"], high)
+    point["close"] = close
+    point["count"] += count
+
+
+class BalanceRetentionService:
+    """
+    Rétention de l'historique des balances (APIBalanceUpdate / MobCashAppBalanceUpdate)
+
+    - points bruts gardés COMPTA_BALANCE_RETENTION["raw_days"] jours
+    - au-delà, regroupés par heure dans BalanceRollup (ouverture, min, max, clôture)
+    - heures gardées COMPTA_BALANCE_RETENTION["hourly_days"] jours, puis regroupées par jour
+
+    Le travail est découpé en lots (une transaction chacun) : une exécution
+    interrompue reprend simplement au plus ancien point restant.
+    """
+
+    @staticmethod
+    def get_policy() -> Dict[str, int]:
+        policy = getattr(settings, "COMPTA_BALANCE_RETENTION", {})
+        return {
+            "raw_days": policy.get("raw_days", 7),
+            "hourly_days": policy.get("hourly_days", 90),
+            "chunk_hours": policy.get("chunk_hours", 24),
+        }
+
+    @staticmethod
+    def run(max_chunks: Optional[int] = None, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Compacte tout ce qui dépasse la politique de rétention (ou max_chunks lots)
+        Retourne le nombre de lignes compactées par étape
+        """
+        now = now or timezone.now()
+        policy = BalanceRetentionService.get_policy()
+        raw_cutoff = floor_hour(now - timedelta(days=policy["raw_days"]))
+        hourly_cutoff = floor_day(now - timedelta(days=policy["hourly_days"]))
+
+        steps = []
+        for source in BALANCE_SOURCES:
+            steps.append((f"{source}_raw", BalanceRetentionService.compact_raw, source, raw_cutoff))
+            steps.append((f"{source}_hourly", BalanceRetentionService.compact_hourly, source, hourly_cutoff))
+
+        stats = {name: 0 for name, *_ in steps}
+        chunks = 0
+        for name, compact, source, cutoff in steps:
+            while max_chunks is None or chunks < max_chunks:
+                compacted = compact(source, cutoff)
+                if not compacted:
+                    break
+                stats[name] += compacted
+                chunks += 1
+        return stats
+
+    @staticmethod
+    def compact_raw(source: str, cutoff: datetime) -> int:
+        """
+        Regroupe par heure le plus ancien lot de points bruts antérieurs à cutoff (heure pleine)
+        puis les supprime ; retourne le nombre de points traités (0 = terminé)
+        """
+        config = BALANCE_SOURCES[source]
+        history, field = config["history"], config["field"]
+        pending = history.objects.filter(created_at__lt=cutoff, **{f"{field}__isnull": False})
+
+        first = pending.aggregate(first=Min("created_at"))["first"]
+        if first is None:
+            return 0
+        start = floor_hour(first)
+        end = min(start + timedelta(hours=BalanceRetentionService.get_policy()["chunk_hours"]), cutoff)
+
+        with db_transaction.atomic():
+            chunk = pending.filter(created_at__gte=start, created_at__lt=end)
+            points = {}
+            total = 0
+            for entity_id, balance, created_at in chunk.order_by("created_at", "id").values_list(
+                f"{field}_id", "balance", "created_at"
+            ):
+                fold_point(points, (entity_id, floor_hour(created_at)), balance, balance, balance, balance, 1)
+                total += 1
+
+            BalanceRetentionService.merge("hour", field, points)
+            chunk.delete()
+        return total
+
+    @staticmethod
+    def compact_hourly(source: str, cutoff: datetime) -> int:
+        """
+        Regroupe par jour les agrégats horaires du plus ancien jour antérieur à cutoff (jour plein)
+        """
+        field = BALANCE_SOURCES[source]["field"]
+        pending = BalanceRollup.objects.filter(
+            resolution="hour", bucket__lt=cutoff, **{f"{field}__isnull": False}
+        )
+
+        first = pending.aggregate(first=Min("bucket"))["first"]
+        if first is None:
+            return 0
+        start = floor_day(first)
+        end = min(start + timedelta(days=1), cutoff)
+
+        with db_transaction.atomic():
+            chunk = pending.filter(bucket__gte=start, bucket__lt=end)
+            points = {}
+            total = 0
+            for row in chunk.order_by("bucket").values(
+                f"{field}_id", "bucket", "open", "min", "max", "close", "count"
+            ):
+                fold_point(
+                    points,
+                    (row[f"{field}_id"], floor_day(row["bucket"])),
+                    row["open"],
+                    row["min"],
+                    row["max"],
+                    row["close"],
+                    row["count"],
+                )
+                total += 1
+
+            BalanceRetentionService.merge("day", field, points)
+            chunk.delete()
+        return total
+
+    @staticmethod
+    def merge(resolution: str, field: str, points: Dict[Tuple, Dict[str, Any]]):
+        """
+        Écrit les buckets calculés ; un bucket déjà présent (lot précédent du même
+        bucket) est complété, ses points étant antérieurs
+        """
+        if not points:
+            return
+        existing = {
+            (getattr(rollup, f"{field}_id"), rollup.bucket): rollup
+            for rollup in BalanceRollup.objects.filter(
+                resolution=resolution,
+                bucket__in={bucket for _, bucket in points},
+                **{f"{field}_id__in": {entity_id for entity_id, _ in points}},
+            )
+        }
+
+        to_create, to_update = [], []
+        for (entity_id, bucket), point in points.items():
+            rollup = existing.get((entity_id, bucket))
+            if rollup is None:
+                to_create.append(
+                    BalanceRollup(resolution=resolution, bucket=bucket, **{f"{field}_id": entity_id}, **point)
+                )
+                continue
+            rollup.min = min(rollup.min, point["min"])
+            rollup.max = max(rollup.max, point["max"])
+            rollup.close = point["close"]
+            rollup.count += point["count"]
+            to_update.append(rollup)
+
+        BalanceRollup.objects.bulk_create(to_create)
+        if to_update:
+            BalanceRollup.objects.bulk_update(to_update, fields=["min", "max", "close", "count"])
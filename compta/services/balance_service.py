@@ -1,10 +1,16 @@
-from typing import Dict
-from decimal import Decimal
-from compta.models import APITransaction, MobCashApp
+from typing import Any, Dict, List
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from compta.config_registry import ConfigRegistry
+from compta.models import APIBalanceUpdate, APITransaction, BalanceRollup, MobCashApp, MobCashAppBalanceUpdate
+from compta.services.snapshot_service import SnapshotService
+from compta.utils import normalize_dimension
 
 
 class BalanceService:
-    """Service pour récupérer les balances actuelles API et MobCash"""
+    """Service pour récupérer et enregistrer les balances API et MobCash"""
 
     @staticmethod
     def get_all_balances() -> Dict[str, any]:
@@ -33,7 +39,7 @@ class BalanceService:
         """
         api_balances = {}
 
-        for api_obj in APITransaction.objects.all():
+        for api_obj in ConfigRegistry.all(APITransaction):
             api_balances[api_obj.name] = api_obj.balance
 
         return api_balances
@@ -45,7 +51,134 @@ class BalanceService:
         """
         mobcash_balances = {}
 
-        for mobcash_obj in MobCashApp.objects.all():
+        for mobcash_obj in ConfigRegistry.all(MobCashApp):
             mobcash_balances[mobcash_obj.name] = mobcash_obj.balance
 
         return mobcash_balances
+
+    @staticmethod
+    def save_api_balances(balances: Dict[str, Any]) -> List[APITransaction]:
+        return BalanceService.save_balances(
+            APITransaction, APIBalanceUpdate, "api_transaction", balances
+        )
+
+    @staticmethod
+    def save_mobcash_balances(balances: Dict[str, Any]) -> List[MobCashApp]:
+        return BalanceService.save_balances(
+            MobCashApp, MobCashAppBalanceUpdate, "mobcash_balance", balances
+        )
+
+    @staticmethod
+    def save_balances(model, history_model, history_field: str, balances: Dict[str, Any]) -> List:
+        """
+        Enregistre les balances reçues ({nom: valeur}) qui diffèrent des valeurs en base :
+        un bulk_update sur balance et un bulk_create d'historique, rien si rien n'a changé
+        Les valeurs invalides ou en erreur sont ignorées
+        Retourne les objets modifiés
+        """
+        # Comparaison aux valeurs en base : le registre peut être en retard
+        # sur une écriture d'un autre processus (invalidation non encore reçue)
+        changed = []
+        for pk, name, current in model.objects.values_list("pk", "name", "balance"):
+            normalized = normalize_dimension(name)
+            if normalized not in balances:
+                continue
+            balance = BalanceService.to_balance(balances[normalized])
+            if balance is None or balance == current:
+                continue
+            changed.append(model(pk=pk, name=name, balance=balance))
+
+        if not changed:
+            return []
+
+        model.objects.bulk_update(changed, fields=["balance"])
+        history_model.objects.bulk_create(
+            [history_model(**{history_field: obj, "balance": obj.balance}) for obj in changed]
+        )
+
+        # bulk_update n'envoie pas post_save
+        ConfigRegistry.invalidate(model)
+        SnapshotService.invalidate_all()
+        return changed
+
+    @staticmethod
+    def to_balance(value) -> Decimal:
+        """
+        Balance au format du modèle (2 décimales), None si la valeur n'est pas un nombre
+        """
+        if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)):
+            return None
+        try:
+            balance = Decimal(str(value)).quantize(Decimal("0.01"))
+        except (InvalidOperation, ValueError):
+            return None
+        return balance if balance.is_finite() else None
+
+    @staticmethod
+    def get_balances_as_of(timestamps: List[datetime]) -> List[Dict[str, Any]]:
+        """
+        Balances API et MobCash connues à chaque date demandée
+        Une requête par table quel que soit le nombre de dates : une sous-requête
+        LIMIT 1 par (entité, date), servie par les index (entité, -created_at)
+        """
+        api_balances = BalanceService.get_entity_balances_as_of(
+            APITransaction, APIBalanceUpdate, "api_transaction", timestamps
+        )
+        mobcash_balances = BalanceService.get_entity_balances_as_of(
+            MobCashApp, MobCashAppBalanceUpdate, "mobcash_balance", timestamps
+        )
+
+        results = []
+        for index, timestamp in enumerate(timestamps):
+            total_api_balance = sum(api_balances[index].values())
+            total_mobcash_balance = sum(mobcash_balances[index].values())
+            results.append(
+                {
+                    "at": timestamp,
+                    "api_balances": api_balances[index],
+                    "mobcash_balances": mobcash_balances[index],
+                    "total_api_balance": total_api_balance,
+                    "total_mobcash_balance": total_mobcash_balance,
+                    "total_balance": total_api_balance + total_mobcash_balance,
+                }
+            )
+        return results
+
+    @staticmethod
+    def get_entity_balances_as_of(
+        model, history_model, history_field: str, timestamps: List[datetime]
+    ) -> List[Dict[str, Decimal]]:
+        """
+        Pour chaque date, {nom: dernière balance <= date}
+        Le point brut le plus récent l'emporte ; sinon la clôture du dernier bucket
+        compacté entièrement écoulé (BalanceRollup). Les entités sans historique sont omises
+        """
+        annotations = {}
+        for index, timestamp in enumerate(timestamps):
+            raw = (
+                history_model.objects.filter(
+                    **{history_field: OuterRef("pk")}, created_at__lte=timestamp
+                )
+                .order_by("-created_at", "-id")
+                .values("balance")[:1]
+            )
+            compacted = (
+                BalanceRollup.objects.filter(
+                    Q(resolution="hour", bucket__lte=timestamp - timedelta(hours=1))
+                    | Q(resolution="day", bucket__lte=timestamp - timedelta(days=1)),
+                    **{history_field: OuterRef("pk")},
+                )
+                .order_by("-bucket")
+                .values("close")[:1]
+            )
+            annotations[f"as_of_{index}"] = Coalesce(Subquery(raw), Subquery(compacted))
+
+        balances = [{} for _ in timestamps]
+        if not annotations:
+            return balances
+        for row in model.objects.order_by("id").annotate(**annotations).values("name", *annotations):
+            for index in range(len(timestamps)):
+                value = row[f"as_of_{index}"]
+                if value is not None:
+                    balances[index][row["name"]] = value
+        return balances
@@ -0,0 +1,91 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from compta.metrics import Metrics
+
+
+class BlaffaClient:
+    """
+    Client HTTP partagé pour les endpoints de balance Blaffa
+
+    Une session par processus (keep-alive, pool de connexions), des timeouts
+    connexion / lecture stricts et quelques retries bornés sur les erreurs
+    réseau et les 502/503/504. Un upstream lent ne bloque donc plus un worker
+    Celery ou un thread gunicorn plus de COMPTA_BLAFFA_TIMEOUT par tentative.
+    """
+
+    _session = None
+    _pid = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_base_url() -> str:
+        return getattr(settings, "COMPTA_BLAFFA_BASE_URL", "https://api.blaffa.net/blaffa")
+
+    @staticmethod
+    def get_timeout():
+        return getattr(settings, "COMPTA_BLAFFA_TIMEOUT", (3, 10))
+
+    @staticmethod
+    def get_session() -> requests.Session:
+        # Une nouvelle session après un fork : les sockets du parent ne sont pas partagées
+        pid = os.getpid()
+        if BlaffaClient._session is not None and BlaffaClient._pid == pid:
+            return BlaffaClient._session
+
+        with BlaffaClient._lock:
+            if BlaffaClient._session is None or BlaffaClient._pid != pid:
+                retries = getattr(settings, "COMPTA_BLAFFA_RETRIES", 2)
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=10,
+                    max_retries=Retry(
+                        total=retries,
+                        connect=retries,
+                        read=retries,
+                        status=retries,
+                        backoff_factor=0.3,
+                        status_forcelist=(502, 503, 504),
+                        allowed_methods=("GET",),
+                        raise_on_status=False,
+                    ),
+                )
+                session = requests.Session()
+                session.headers.update({"Content-Type": "application/json"})
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                BlaffaClient._session = session
+                BlaffaClient._pid = pid
+        return BlaffaClient._session
+
+    @staticmethod
+    def get(path: str) -> Any:
+        with Metrics.span("blaffa", path):
+            response = BlaffaClient.get_session().get(
+                f"{BlaffaClient.get_base_url()}/{path}", timeout=BlaffaClient.get_timeout()
+            )
+            response.raise_for_status()
+            return response.json()
+
+    @staticmethod
+    def get_many(paths: Iterable[str]) -> Dict[str, Any]:
+        """
+        Interroge plusieurs endpoints en parallèle
+        Retourne {path: réponse JSON ou exception levée}
+        """
+        paths = list(paths)
+        with ThreadPoolExecutor(max_workers=len(paths) or 1) as executor:
+            futures = {path: executor.submit(BlaffaClient.get, path) for path in paths}
+
+        results = {}
+        for path, future in futures.items():
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                results[path] = e
+        return results
@@ -0,0 +1,168 @@
+from typing import Dict, Any, List, Optional
+from decimal import Decimal
+from django.utils import timezone
+from compta.models import Transaction
+from compta.services.balance_service import BalanceService
+from compta.services.filter_service import FilterService
+from compta.services.rollup_service import RollupService
+from compta.services.snapshot_service import SnapshotService
+from compta.services.stats_services import StatsService
+from compta.services.transaction_service import TransactionService
+from compta.utils import DIMENSION_FIELDS
+
+# Champs du contenu du dashboard qui ne sont pas des métriques de la période
+NON_METRIC_KEYS = {"id", "name", "label", "image", "balance", "balances", "mobcash_setting"}
+
+
+class DashboardService:
+    """Service pour construire le contenu du dashboard (agrégats + stats + balances)"""
+
+    @staticmethod
+    def get_payload(filters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Contenu du dashboard pour des filtres déjà traités,
+        servi depuis le cache de snapshots quand il est à jour
+        """
+        return SnapshotService.get_or_compute(
+            filters, lambda: DashboardService.build_payload(filters)
+        )
+
+    @staticmethod
+    def build_payload(filters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Calcule le contenu du dashboard sans passer par le cache
+        """
+        # Regrouper les transactions filtrées (agrégats horaires + heures partielles)
+        rows = RollupService.get_grouped_rows(filters)
+        return DashboardService.build_payload_from_rows(rows)
+
+    @staticmethod
+    def build_payload_from_rows(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Construit le contenu du dashboard à partir des lignes regroupées
+        (balances et configs relues, aucune requête sur Transaction)
+        """
+        return {
+            **DashboardService.build_stats_from_rows(rows),
+            "balances": BalanceService.get_all_balances(),
+        }
+
+    @staticmethod
+    def build_stats_from_rows(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Agrégats et stats du dashboard, sans les balances
+        """
+        aggregates = TransactionService.get_aggregates_from_rows(rows)
+        stats = StatsService.build_all_stats(rows)
+
+        return {
+            "total": aggregates["total"],
+            "mobcash_fee": aggregates["mobcash_fee"],
+            "blaffa_fee": aggregates["blaffa_fee"],
+            "amount": aggregates["amount"],
+            "mobcash_stats": stats["mobcash_stats"],
+            "api_stats": stats["api_stats"],
+            "network_stats": stats["network_stats"],
+            "source_stats": stats["source_stats"],
+            "type_stats": stats["type_stats"],
+        }
+
+    @staticmethod
+    def build_comparison(filters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Fenêtre filtrée et fenêtre précédente de même durée, calculées en un seul
+        parcours (agrégats conditionnels sur leur union), avec les écarts
+        Lève ValueError si la fenêtre n'a pas de date de début (is_all_date)
+        """
+        start = None if filters.get("is_all_date") else filters.get("start_date")
+        if start is None:
+            raise ValueError("La comparaison nécessite une date de début")
+        end = filters.get("end_date") or timezone.now()
+        previous_start = start - (end - start)
+
+        transactions = FilterService.apply_dimension_filters(
+            Transaction.objects.filter(created_at__gte=previous_start, created_at__lte=end),
+            filters,
+        )
+        current_rows, previous_rows = StatsService.get_split_grouped_rows(transactions, start)
+
+        # Écarts sur les métriques de période seulement : les balances sont
+        # l'état actuel, la fenêtre précédente n'en a pas
+        current = DashboardService.build_stats_from_rows(current_rows)
+        previous = DashboardService.build_stats_from_rows(previous_rows)
+        return {
+            "current": {**current, "balances": BalanceService.get_all_balances()},
+            "previous": previous,
+            "previous_window": {"start_date": previous_start, "end_date": start},
+            "deltas": DashboardService.build_deltas(current, previous),
+        }
+
+    @staticmethod
+    def build_windows(windows: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Stats de plusieurs jeux de filtres traités (nom -> filtres) en un seul parcours
+        sur la plage couvrant toutes les fenêtres, une clause FILTER par fenêtre
+        Les balances (actuelles) ne sont lues qu'une fois
+        """
+        starts = [
+            None if filters.get("is_all_date") else filters.get("start_date")
+            for filters in windows.values()
+        ]
+        ends = [
+            None if filters.get("is_all_date") else filters.get("end_date")
+            for filters in windows.values()
+        ]
+
+        transactions = Transaction.objects.all()
+        if starts and None not in starts:
+            transactions = transactions.filter(created_at__gte=min(starts))
+        if ends and None not in ends:
+            transactions = transactions.filter(created_at__lte=max(ends))
+
+        # Dimensions communes à toutes les fenêtres : filtrées une fois pour toutes
+        dimensions = [
+            {field: sorted(FilterService.normalize_values(filters.get(field))) for field in DIMENSION_FIELDS}
+            for filters in windows.values()
+        ]
+        if dimensions and all(dimension == dimensions[0] for dimension in dimensions):
+            transactions = FilterService.apply_dimension_filters(transactions, dimensions[0])
+
+        rows = StatsService.get_window_grouped_rows(
+            transactions,
+            {name: FilterService.build_q(filters) for name, filters in windows.items()},
+        )
+        return {
+            "windows": {
+                name: DashboardService.build_stats_from_rows(window_rows)
+                for name, window_rows in rows.items()
+            },
+            "balances": BalanceService.get_all_balances(),
+        }
+
+    @staticmethod
+    def build_deltas(current: Any, previous: Any) -> Optional[Any]:
+        """
+        Même structure que le contenu du dashboard, chaque métrique remplacée
+        par {"delta": écart absolu, "percent": écart en % (None si la période précédente vaut 0)}
+        Les champs descriptifs (id, nom, réglages...) et les balances sont ignorés
+        """
+        if isinstance(current, dict):
+            deltas = {}
+            for key, value in current.items():
+                if key in NON_METRIC_KEYS or "balance" in key:
+                    continue
+                delta = DashboardService.build_deltas(
+                    value, previous.get(key) if isinstance(previous, dict) else None
+                )
+                if delta is not None:
+                    deltas[key] = delta
+            return deltas
+
+        if isinstance(current, bool) or not isinstance(current, (int, float, Decimal)):
+            return None
+        previous = previous or 0
+        delta = current - previous
+        return {
+            "delta": delta,
+            "percent": round(float(delta) / float(previous) * 100, 2) if previous else None,
+        }
@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+import zlib
+from decimal import Decimal
+from typing import Iterable, Iterator
+from django.conf import settings
+from django.db.models import QuerySet
+
+# Colonnes exportées, dans l'ordre
+EXPORT_FIELDS = (
+    "id",
+    "reference",
+    "created_at",
+    "type",
+    "amount",
+    "mobcash_fee",
+    "blaffa_fee",
+    "mobcash",
+    "api",
+    "network",
+    "source",
+    "user_mobcash_id",
+    "mobcash_balance",
+    "api_balance",
+)
+
+# Taille des morceaux envoyés au client
+BUFFER_SIZE = 64 * 1024
+
+
+def format_value(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class ExportService:
+    """
+    Export des transactions filtrées en flux (CSV ou NDJSON, gzip optionnel)
+
+    Les lignes sont lues par curseur serveur (values_list().iterator()),
+    sans instancier de modèles, et envoyées par morceaux : la mémoire
+    reste constante quel que soit le nombre de lignes.
+    """
+
+    @staticmethod
+    def get_chunk_size() -> int:
+        return getattr(settings, "COMPTA_EXPORT_CHUNK_SIZE", 2000)
+
+    @staticmethod
+    def iter_rows(transactions: QuerySet) -> Iterator[tuple]:
+        return (
+            transactions.order_by("created_at", "id")
+            .values_list(*EXPORT_FIELDS)
+            .iterator(chunk_size=ExportService.get_chunk_size())
+        )
+
+    @staticmethod
+    def iter_csv(transactions: QuerySet) -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        for row in ExportService.iter_rows(transactions):
+            writer.writerow([format_value(value) for value in row])
+            if buffer.tell() >= BUFFER_SIZE:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode()
+
+    @staticmethod
+    def iter_ndjson(transactions: QuerySet) -> Iterator[bytes]:
+        lines, size = [], 0
+        for row in ExportService.iter_rows(transactions):
+            line = json.dumps(
+                {field: format_value(value) for field, value in zip(EXPORT_FIELDS, row)}
+            )
+            lines.append(line)
+            size += len(line) + 1
+            if size >= BUFFER_SIZE:
+                yield ("\n".join(lines) + "\n").encode()
+                lines, size = [], 0
+        if lines:
+            yield ("\n".join(lines) + "\n").encode()
+
+    @staticmethod
+    def gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Compresse le flux à la volée (format gzip)
+        """
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
@@ -5,6 +5,7 @@ from datetime import timedelta
 from compta.models import UserTransactionFilter
 from django.contrib.auth.models import User
 from django.db.models import Q
+from compta.utils import DIMENSION_FIELDS, normalize_dimension
 
 
 class FilterService:
@@ -43,17 +44,44 @@ class FilterService:
                 "last": request.GET.get("last"),
                 "is_all_date": request.GET.get("is_all_date", "false").lower()
                 == "true",
-                "source": request.GET.getlist("source"),
-                "network": request.GET.getlist("network"),
-                "api": request.GET.getlist("api"),
-                "type": request.GET.getlist("type"),
-                "mobcash": request.GET.getlist("mobcash"),
+                "source": FilterService.normalize_values(request.GET.getlist("source")),
+                "network": FilterService.normalize_values(request.GET.getlist("network")),
+                "api": FilterService.normalize_values(request.GET.getlist("api")),
+                "type": FilterService.normalize_values(request.GET.getlist("type")),
+                "mobcash": FilterService.normalize_values(request.GET.getlist("mobcash")),
                 "periode": request.GET.get("periode"),
             }
         else:
             # Charger le dernier filtre sauvegardé de l'utilisateur
             filters = FilterService.load_user_last_filter(request.user)
 
+        return FilterService.prepare_filters(filters)
+
+    @staticmethod
+    def parse_filters_from_data(data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Parse un jeu de filtres envoyé dans un corps JSON (mêmes clés que les paramètres GET)
+        Aucun repli sur le filtre sauvegardé : un jeu vide vaut "aujourd'hui"
+        """
+        is_all_date = data.get("is_all_date", False)
+        if isinstance(is_all_date, str):
+            is_all_date = is_all_date.lower() == "true"
+        filters = {
+            "start_date": data.get("start_date"),
+            "end_date": data.get("end_date"),
+            "last": data.get("last"),
+            "is_all_date": bool(is_all_date),
+            "periode": data.get("periode"),
+        }
+        for field in DIMENSION_FIELDS:
+            filters[field] = FilterService.normalize_values(data.get(field))
+        return FilterService.prepare_filters(filters)
+
+    @staticmethod
+    def prepare_filters(filters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Dates converties, "last" et is_all_date appliqués, start_date par défaut à aujourd'hui
+        """
         # Traiter les dates (conversion + gestion du "last")
         filters = FilterService.process_dates(filters)
 
@@ -77,19 +105,16 @@ class FilterService:
         """
         try:
             user_filter = UserTransactionFilter.objects.get(user=user)
-            return {
-                "start_date": user_filter.start_date,
-                "end_date": user_filter.end_date,
-                "last": user_filter.last,
-                "is_all_date": user_filter.is_all_date,
-                "source": user_filter.source or [],
-                "network": user_filter.network or [],
-                "api": user_filter.api or [],
-                "type": user_filter.type or [],
-                "mobcash": user_filter.mobcash or [],
-                "periode": user_filter.periode,
-            }
         except UserTransactionFilter.DoesNotExist:
+            user_filter = None
+        return FilterService.to_filters(user_filter)
+
+    @staticmethod
+    def to_filters(user_filter: Optional[UserTransactionFilter]) -> Dict[str, Any]:
+        """
+        Filtres bruts d'un UserTransactionFilter (valeurs par défaut si None)
+        """
+        if user_filter is None:
             # Valeurs par défaut si aucun filtre sauvegardé
             return {
                 "start_date": None,  # Sera remplacé par aujourd'hui plus tard
@@ -102,6 +127,18 @@ class FilterService:
                 "type": [],
                 "mobcash": [],
             }
+        return {
+            "start_date": user_filter.start_date,
+            "end_date": user_filter.end_date,
+            "last": user_filter.last,
+            "is_all_date": user_filter.is_all_date,
+            "source": user_filter.source or [],
+            "network": user_filter.network or [],
+            "api": user_filter.api or [],
+            "type": user_filter.type or [],
+            "mobcash": user_filter.mobcash or [],
+            "periode": user_filter.periode,
+        }
 
     @staticmethod
     def process_dates(filters: Dict[str, Any]) -> Dict[str, Any]:
@@ -138,15 +175,14 @@ class FilterService:
                 filters["end_date"] = None
                 filters["is_all_date"] = True
         else:
-            # Conversion des dates string en datetime
-            start_date = filters.get("start_date")
-            end_date = filters.get("end_date")
-
-            if start_date and isinstance(start_date, str):
-                filters["start_date"] = parse_datetime(start_date)
-
-            if end_date and isinstance(end_date, str):
-                filters["end_date"] = parse_datetime(end_date)
+            # Conversion des dates string en datetime (avec fuseau : comparées à timezone.now())
+            for field in ("start_date", "end_date"):
+                value = filters.get(field)
+                if value and isinstance(value, str):
+                    value = parse_datetime(value)
+                if value and timezone.is_naive(value):
+                    value = timezone.make_aware(value)
+                filters[field] = value or None
 
         return filters
 
@@ -154,7 +190,7 @@ class FilterService:
     def apply_filters(queryset, filters: Dict[str, Any]):
         """
         Applique tous les filtres à un QuerySet de transactions
-        ✅ Utilise __iexact pour ignorer la casse (majuscules/minuscules)
+        Les dimensions sont comparées en minuscules (voir normalize_dimension)
         """
         # Si is_all_date = True, ne pas filtrer par dates
         if not filters.get("is_all_date"):
@@ -166,46 +202,54 @@ class FilterService:
             if end_date:
                 queryset = queryset.filter(created_at__lte=end_date)
 
-        # Filtres sur les choix (insensibles à la casse)
-        source_list = filters.get("source", [])
-        network_list = filters.get("network", [])
-        api_list = filters.get("api", [])
-        type_list = filters.get("type", [])
-        mobcash_list = filters.get("mobcash", [])
-
-        # ✅ Utiliser Q avec __iexact pour chaque valeur
-        if source_list:
-            q_objects = Q()
-            for source in source_list:
-                q_objects |= Q(source__iexact=source)
-            queryset = queryset.filter(q_objects)
-
-        if network_list:
-            q_objects = Q()
-            for network in network_list:
-                q_objects |= Q(network__iexact=network)
-            queryset = queryset.filter(q_objects)
-
-        if api_list:
-            q_objects = Q()
-            for api in api_list:
-                q_objects |= Q(api__iexact=api)
-            queryset = queryset.filter(q_objects)
-
-        if type_list:
-            q_objects = Q()
-            for type_val in type_list:
-                q_objects |= Q(type__iexact=type_val)
-            queryset = queryset.filter(q_objects)
-
-        if mobcash_list:
-            q_objects = Q()
-            for mobcash in mobcash_list:
-                q_objects |= Q(mobcash__iexact=mobcash)
-            queryset = queryset.filter(q_objects)
+        return FilterService.apply_dimension_filters(queryset, filters)
+
+    @staticmethod
+    def build_q(filters: Dict[str, Any]) -> Q:
+        """
+        Mêmes conditions que apply_filters sous forme de Q
+        (pour les agrégats conditionnels COUNT(...) FILTER (WHERE ...))
+        """
+        condition = Q()
+        if not filters.get("is_all_date"):
+            if filters.get("start_date"):
+                condition &= Q(created_at__gte=filters["start_date"])
+            if filters.get("end_date"):
+                condition &= Q(created_at__lte=filters["end_date"])
+        for field in DIMENSION_FIELDS:
+            values = FilterService.normalize_values(filters.get(field, []))
+            if values:
+                condition &= Q(**{f"{field}__in": values})
+        return condition
+
+    @staticmethod
+    def apply_dimension_filters(queryset, filters: Dict[str, Any]):
+        """
+        Applique uniquement les filtres source / network / api / type / mobcash
+        Utilisable sur Transaction comme sur TransactionRollup (mêmes noms de champs)
+        """
+        # Les valeurs sont stockées en minuscules : un seul `__in` par dimension
+        for field in DIMENSION_FIELDS:
+            values = FilterService.normalize_values(filters.get(field, []))
+            if values:
+                queryset = queryset.filter(**{f"{field}__in": values})
 
         return queryset
 
+    @staticmethod
+    def normalize_values(values) -> List[str]:
+        """
+        Met les valeurs d'une dimension sous forme canonique (minuscules, sans doublons)
+        """
+        if isinstance(values, str):
+            values = [values]
+        normalized = []
+        for value in values or []:
+            value = normalize_dimension(value)
+            if value and value not in normalized:
+                normalized.append(value)
+        return normalized
+
     @staticmethod
     def save_user_filter(user, filters: Dict[str, Any]):
         """
@@ -0,0 +1,111 @@
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Any, List
+from django.conf import settings
+from django.db import transaction as db_transaction
+from compta.config_registry import ConfigRegistry
+from compta.models import APITransaction, MobCashApp, Transaction
+from compta.services.refresh_scheduler import BalanceRefreshScheduler
+from compta.services.rollup_service import RollupService
+from compta.services.snapshot_service import SnapshotService
+from compta.utils import DIMENSION_FIELDS, normalize_dimension
+
+
+class IngestionService:
+    """Service pour l'import en masse de transactions"""
+
+    @staticmethod
+    def get_chunk_size() -> int:
+        return getattr(settings, "COMPTA_BULK_CHUNK_SIZE", 500)
+
+    @staticmethod
+    def resolve_configs(model, names) -> Dict[str, Any]:
+        """
+        Lit les configs référencées dans le registre et crée celles qui manquent
+        """
+        configs = ConfigRegistry.load(model)
+        missing = [model(name=name) for name in names if name not in configs]
+        if missing:
+            model.objects.bulk_create(missing, ignore_conflicts=True)
+            # bulk_create n'envoie pas post_save
+            ConfigRegistry.invalidate(model)
+            SnapshotService.invalidate_all()
+            configs = ConfigRegistry.load(model)
+        return {name: configs[name] for name in names}
+
+    @staticmethod
+    def create_transactions(items: List[Dict[str, Any]]) -> List[Transaction]:
+        """
+        Crée des transactions validées (TransactionSerializer) en masse :
+        configs résolues une fois, fees calculés en un passage,
+        INSERT par lots sans doublon, un seul rafraîchissement balances / stats à la fin
+        Retourne uniquement les transactions réellement insérées
+        """
+        for item in items:
+            for field in DIMENSION_FIELDS:
+                if field in item:
+                    item[field] = normalize_dimension(item[field])
+
+        mobcash_configs = IngestionService.resolve_configs(
+            MobCashApp, {item["mobcash"] for item in items}
+        )
+        IngestionService.resolve_configs(APITransaction, {item["api"] for item in items})
+
+        transactions = []
+        for item in items:
+            mobcash_fee = mobcash_configs[item["mobcash"]].get_mobcash_fee(
+                item.get("type"), item.get("amount")
+            )
+            if mobcash_fee is not None:
+                item["mobcash_fee"] = mobcash_fee
+            transactions.append(Transaction(**item))
+
+        # ON CONFLICT DO NOTHING : les références déjà reçues sont ignorées
+        chunk_size = IngestionService.get_chunk_size()
+        created = []
+        try:
+            for start in range(0, len(transactions), chunk_size):
+                # Agrégat validé avec les lignes du lot : un lot en échec
+                # n'annule ni ne fausse ceux déjà validés
+                with db_transaction.atomic():
+                    inserted = Transaction.objects.insert_ignore_conflicts(
+                        transactions[start : start + chunk_size], batch_size=chunk_size
+                    )
+                    IngestionService.add_to_rollup(inserted)
+                created += inserted
+        finally:
+            IngestionService.after_create(created)
+        return created
+
+    @staticmethod
+    def add_to_rollup(created: List[Transaction]):
+        """
+        Un UPDATE par clé horaire au lieu d'un par transaction
+        """
+        deltas = defaultdict(
+            lambda: {"count": 0, "amount": Decimal(0), "mobcash_fee": None, "blaffa_fee": None}
+        )
+        for transaction in created:
+            key = tuple(sorted(RollupService.get_rollup_key(transaction).items()))
+            delta = deltas[key]
+            delta["count"] += 1
+            delta["amount"] += transaction.amount
+            for field in ("mobcash_fee", "blaffa_fee"):
+                value = getattr(transaction, field)
+                if value is not None:
+                    delta[field] = value if delta[field] is None else delta[field] + value
+        # Heures croissantes : même ordre de verrouillage que rebuild_range
+        for key, delta in sorted(deltas.items(), key=lambda item: dict(item[0])["bucket"]):
+            RollupService.add_delta(dict(key), **delta)
+
+    @staticmethod
+    def after_create(created: List[Transaction]):
+        """
+        Ce que CreateTransaction fait par transaction, fait une fois pour les lots validés
+        """
+        if not created:
+            return
+
+        # bulk_create n'envoie pas post_save
+        SnapshotService.invalidate_transactions(created)
+        BalanceRefreshScheduler.schedule(*[transaction.id for transaction in created])
@@ -0,0 +1,229 @@
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+from django.conf import settings
+from django.db import connection, transaction as db_transaction
+from django.db.models import Max
+from django.utils import timezone
+from compta.models import Transaction
+from compta.services.dashboard_service import DashboardService
+from compta.services.rollup_service import RollupService
+from compta.services.snapshot_service import SnapshotService
+from compta.services.stats_services import STATS_DIMENSIONS
+from compta.utils import DIMENSION_FIELDS, normalize_dimension
+
+# Verrou de l'état d'un filtre (lecture - application - écriture)
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+# Ids relevés sous le plus grand id du calcul complet (transactions validées hors ordre)
+ID_SCAN = 1000
+# Au-delà, l'état est recalculé plutôt que de retenir plus d'ids appliqués
+MAX_APPLIED_IDS = 1000
+
+
+class LiveStatsService:
+    """
+    État des dernières stats poussées par filtre abonné
+
+    Une nouvelle transaction qui correspond au filtre est appliquée aux lignes
+    regroupées en mémoire au lieu de relancer tout le pipeline.
+    L'état est recalculé entièrement quand il est plus vieux que
+    COMPTA_LIVE_STATS_MAX_AGE (les fenêtres relatives glissent).
+    Les ids ne sont pas validés dans l'ordre : le calcul complet retient son
+    plus grand id et les ids absents juste en dessous (ID_SCAN), validés plus
+    tard ; une transaction plus ancienne dont la présence est inconnue
+    provoque un recalcul complet.
+    """
+
+    @staticmethod
+    def get_state_key(filters: Dict[str, Any]) -> str:
+        return f"compta:live:{SnapshotService.get_filter_key(filters)}"
+
+    @staticmethod
+    def get_max_age() -> int:
+        return getattr(settings, "COMPTA_LIVE_STATS_MAX_AGE", 120)
+
+    @staticmethod
+    def get_window(filters: Dict[str, Any]) -> Dict[str, Any]:
+        is_all_date = filters.get("is_all_date")
+        return {
+            "start_date": None if is_all_date else filters.get("start_date"),
+            "end_date": None if is_all_date or filters.get("last") else filters.get("end_date"),
+            "dimensions": {
+                field: [normalize_dimension(value) for value in filters.get(field) or []]
+                for field in DIMENSION_FIELDS
+            },
+        }
+
+    @staticmethod
+    @contextmanager
+    def lock(state_key: str):
+        """
+        Verrou partagé (cache.add) autour de la lecture - mise à jour d'un état
+        Donne False si le verrou n'a pas pu être pris à temps
+        """
+        cache = SnapshotService.get_cache()
+        lock_key = f"{state_key}:lock"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + LOCK_WAIT
+        acquired = cache.add(lock_key, token, LOCK_TIMEOUT)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(0.05)
+            acquired = cache.add(lock_key, token, LOCK_TIMEOUT)
+        try:
+            yield acquired
+        finally:
+            if acquired and cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    @staticmethod
+    def compute_state(filters: Dict[str, Any], version: int) -> Dict[str, Any]:
+        """
+        Calcul complet : lignes regroupées et ids de transaction qu'elles couvrent,
+        lus dans un même instantané de la base (REPEATABLE READ sur PostgreSQL)
+        """
+        is_nested = connection.in_atomic_block
+        with db_transaction.atomic():
+            if connection.vendor == "postgresql" and not is_nested:
+                with connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            covered_id = Transaction.objects.aggregate(covered_id=Max("id"))["covered_id"] or 0
+            scan_floor = max(covered_id - ID_SCAN, 0)
+            present = set(
+                Transaction.objects.filter(id__gt=scan_floor).values_list("id", flat=True)
+            )
+            rows = RollupService.get_grouped_rows(filters)
+        return {
+            "rows": rows,
+            "window": LiveStatsService.get_window(filters),
+            "computed_at": timezone.now().timestamp(),
+            "covered_id": covered_id,
+            "scan_floor": scan_floor,
+            # Ids non encore validés au moment du calcul (ou jamais utilisés)
+            "missing_ids": set(range(scan_floor + 1, covered_id + 1)) - present,
+            "applied_ids": set(),
+            "version": version,
+        }
+
+    @staticmethod
+    def get_payload(
+        filters: Dict[str, Any], transactions: Optional[List] = None
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        Retourne (snapshot, delta)
+        delta vaut None quand le snapshot a été recalculé entièrement
+        Sans nouvelles transactions, le snapshot vient du cache de snapshots
+        """
+        if not transactions:
+            return DashboardService.get_payload(filters), None
+
+        cache = SnapshotService.get_cache()
+        state_key = LiveStatsService.get_state_key(filters)
+        with LiveStatsService.lock(state_key) as acquired:
+            if not acquired:
+                # État en cours de mise à jour ailleurs : snapshot complet sans y toucher
+                return DashboardService.build_payload(filters), None
+
+            state = cache.get(state_key)
+            now = timezone.now()
+            is_fresh = state is not None and (
+                now.timestamp() - state["computed_at"] < LiveStatsService.get_max_age()
+            )
+            pending = []
+            if is_fresh:
+                covered = [LiveStatsService.is_covered(state, transaction) for transaction in transactions]
+                pending = [
+                    transaction
+                    for transaction, is_covered in zip(transactions, covered)
+                    if is_covered is False
+                ]
+                is_fresh = (
+                    None not in covered
+                    and len(state["applied_ids"]) + len(pending) <= MAX_APPLIED_IDS
+                )
+
+            if not is_fresh:
+                state = LiveStatsService.compute_state(filters, (state or {}).get("version", 0) + 1)
+                cache.set(state_key, state, LiveStatsService.get_max_age())
+                return DashboardService.build_payload_from_rows(state["rows"]), None
+
+            applied = []
+            for transaction in pending:
+                if transaction.id in state["applied_ids"]:
+                    # Reçue deux fois dans le même appel
+                    continue
+                state["applied_ids"].add(transaction.id)
+                if SnapshotService.matches(state["window"], transaction):
+                    LiveStatsService.apply_transaction(state["rows"], transaction)
+                    applied.append(transaction)
+
+            state["version"] += 1
+            remaining = LiveStatsService.get_max_age() - (now.timestamp() - state["computed_at"])
+            cache.set(state_key, state, max(int(remaining), 1))
+
+        payload = DashboardService.build_payload_from_rows(state["rows"])
+        delta = LiveStatsService.build_delta(payload, applied, state["version"])
+        return payload, delta
+
+    @staticmethod
+    def is_covered(state: Dict[str, Any], transaction) -> Optional[bool]:
+        """
+        True si la transaction est déjà comptée (calcul complet ou delta appliqué),
+        False si elle reste à appliquer, None si le calcul complet ne permet pas
+        de le savoir (id trop ancien pour le relevé : recalcul)
+        """
+        if transaction.id in state["applied_ids"]:
+            return True
+        if transaction.id > state["covered_id"] or transaction.id in state["missing_ids"]:
+            return False
+        if transaction.id > state["scan_floor"]:
+            return True
+        return None
+
+    @staticmethod
+    def apply_transaction(rows: List[Dict[str, Any]], transaction):
+        """
+        Ajoute une transaction à la ligne regroupée de ses dimensions
+        """
+        key = {field: getattr(transaction, field) for field in STATS_DIMENSIONS}
+        for row in rows:
+            if all(row[field] == value for field, value in key.items()):
+                break
+        else:
+            row = dict(key, total=0, total_amount=None, fee=None, blaffa_fee=None)
+            rows.append(row)
+
+        row["total"] += 1
+        for field, value in (
+            ("total_amount", transaction.amount),
+            ("fee", transaction.mobcash_fee),
+            ("blaffa_fee", transaction.blaffa_fee),
+        ):
+            if value is not None:
+                row[field] = value if row[field] is None else row[field] + value
+
+    @staticmethod
+    def build_delta(payload: Dict[str, Any], transactions: List, version: int) -> Dict[str, Any]:
+        """
+        Message compact : transactions appliquées, nouveaux totaux et balances
+        """
+        return {
+            "version": version,
+            "transactions": [
+                {
+                    "id": transaction.id,
+                    "created_at": transaction.created_at,
+                    "amount": transaction.amount,
+                    "mobcash_fee": transaction.mobcash_fee,
+                    "blaffa_fee": transaction.blaffa_fee,
+                    **{field: getattr(transaction, field) for field in STATS_DIMENSIONS},
+                }
+                for transaction in transactions
+            ],
+            "total": payload["total"],
+            "amount": payload["amount"],
+            "mobcash_fee": payload["mobcash_fee"],
+            "blaffa_fee": payload["blaffa_fee"],
+            "balances": payload["balances"],
+        }
@@ -0,0 +1,299 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from django.conf import settings
+from pusher import Pusher
+from compta.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "compta:pusher:queue"
+PENDING_KEY = "compta:pusher:pending"
+
+# Snapshots complets : un "stat_data" rend inutiles les événements listés
+# qui le précèdent sur le même channel (snapshot plus ancien, deltas déjà inclus)
+SUPERSEDED_EVENTS = {"stat_data": {"stat_data", "stat_delta"}}
+
+# Nombre maximum d'événements par appel trigger_batch (limite Pusher)
+BATCH_SIZE = 10
+
+# Nombre maximum de channels par appel trigger (limite Pusher)
+MAX_CHANNELS = 100
+
+# Taille maximale des données d'un événement dans trigger_batch (au-delà : trigger seul,
+# limité à 30720), mesurée comme le client pusher (sys.getsizeof de la chaîne)
+BATCH_MAX_DATA = 10240
+
+
+class PusherPublisher:
+    """
+    Publication Pusher groupée, hors du chemin des tâches de balance
+
+    publish() dépose les événements (une liste de channels par événement :
+    un par filtre distinct, pas un par admin) à la suite d'une même liste
+    Redis (COMPTA_PUSHER_REDIS_URL), dans l'ordre de dépôt. Le premier dépôt
+    d'une fenêtre programme `flush_pusher_events` sur la file
+    COMPTA_PUSHER_QUEUE (celle des workers par défaut), qui vide la liste,
+    retire pour chaque channel ce qu'un snapshot "stat_data" plus récent
+    remplace (voir SUPERSEDED_EVENTS) et envoie le reste dans l'ordre, sur
+    une session HTTP gardée ouverte : trigger_batch (10 événements par
+    requête) pour les événements à un seul channel, trigger pour ceux à
+    plusieurs channels ou trop gros pour un batch.
+    Sans Redis, les événements partent tout de suite, groupés.
+
+    Si un envoi échoue, les événements non envoyés sont remis en tête de la
+    liste et un nouvel envoi est programmé.
+    """
+
+    _client = None
+    _redis = None
+    _pid: Optional[int] = None
+    _lock = threading.Lock()
+    # Channels occupés par préfixe : (lu à, noms)
+    _occupied: Dict[str, Tuple[float, Set[str]]] = {}
+
+    @staticmethod
+    def get_window() -> float:
+        return getattr(settings, "COMPTA_PUSHER_FLUSH_WINDOW", 1.0)
+
+    @staticmethod
+    def get_queue() -> str:
+        return getattr(settings, "COMPTA_PUSHER_QUEUE", None) or settings.CELERY_TASK_DEFAULT_QUEUE
+
+    @staticmethod
+    def get_redis_url() -> Optional[str]:
+        return getattr(settings, "COMPTA_PUSHER_REDIS_URL", None)
+
+    @staticmethod
+    def get_clients():
+        """
+        Client Pusher (session requests gardée ouverte) et client Redis, un par processus
+        """
+        pid = os.getpid()
+        if PusherPublisher._client is not None and PusherPublisher._pid == pid:
+            return PusherPublisher._client, PusherPublisher._redis
+
+        with PusherPublisher._lock:
+            if PusherPublisher._client is None or PusherPublisher._pid != pid:
+                PusherPublisher._client = Pusher(
+                    app_id=os.getenv("PUSER_ID"),
+                    key=os.getenv("PUSHER_KEY"),
+                    secret=os.getenv("PUSHER_SECRET"),
+                    cluster="eu",
+                    ssl=getattr(settings, "COMPTA_PUSHER_SSL", True),
+                    timeout=getattr(settings, "COMPTA_PUSHER_TIMEOUT", 5),
+                )
+                PusherPublisher._redis = None
+                if PusherPublisher.get_redis_url():
+                    import redis
+
+                    PusherPublisher._redis = redis.Redis.from_url(PusherPublisher.get_redis_url())
+                PusherPublisher._pid = pid
+        return PusherPublisher._client, PusherPublisher._redis
+
+    @staticmethod
+    def get_occupied_channels(prefix: str) -> Optional[Set[str]]:
+        """
+        Channels du préfixe qui ont au moins un abonné (API channels de Pusher),
+        relus au plus toutes les COMPTA_PUSHER_OCCUPANCY_TTL secondes par processus
+        None si Pusher n'a pas répondu
+        """
+        now = time.monotonic()
+        cached = PusherPublisher._occupied.get(prefix)
+        if cached is not None and now - cached[0] < getattr(settings, "COMPTA_PUSHER_OCCUPANCY_TTL", 10):
+            return cached[1]
+
+        pusher_client, _ = PusherPublisher.get_clients()
+        try:
+            with Metrics.span("pusher", "channels_info"):
+                info = pusher_client.channels_info(prefix_filter=prefix)
+        except Exception as e:
+            logger.warning("Channels Pusher occupés illisibles : %s", e)
+            return None
+        channels = set(info.get("channels", {}))
+        PusherPublisher._occupied[prefix] = (now, channels)
+        return channels
+
+    @staticmethod
+    def publish(events: List[Tuple[List[str], str, Dict[str, Any]]]) -> int:
+        """
+        Dépose des événements (channels, nom, données) en un aller-retour Redis
+        Retourne le nombre d'événements déposés
+        """
+        events = [
+            {"channels": list(channels), "name": name, "data": data}
+            for channels, name, data in events
+            if channels
+        ]
+        if not events:
+            return 0
+        _, client = PusherPublisher.get_clients()
+        if client is None:
+            PusherPublisher.send(PusherPublisher.coalesce(events))
+            return len(events)
+
+        client.rpush(QUEUE_KEY, *[json.dumps(event) for event in events])
+        PusherPublisher.schedule()
+        return len(events)
+
+    @staticmethod
+    def schedule() -> bool:
+        """
+        Programme un envoi si aucun n'est en attente (même principe que BalanceRefreshScheduler)
+        """
+        _, client = PusherPublisher.get_clients()
+        window = PusherPublisher.get_window()
+        # Le marqueur expire de lui-même si la tâche est perdue
+        if not client.set(PENDING_KEY, 1, nx=True, ex=int(window) + 60):
+            return False
+
+        from compta.tasks import flush_pusher_events
+
+        flush_pusher_events.apply_async(countdown=window, queue=PusherPublisher.get_queue())
+        return True
+
+    @staticmethod
+    def coalesce(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Retire de chaque événement les channels où un snapshot plus récent le
+        remplace ; l'ordre des événements restants est conservé
+        """
+        last_seen = {}
+        for index, event in enumerate(events):
+            for channel in event["channels"]:
+                last_seen[(channel, event["name"])] = index
+
+        coalesced, superseded = [], 0
+        for index, event in enumerate(events):
+            channels = [
+                channel
+                for channel in event["channels"]
+                if not any(
+                    last_seen.get((channel, snapshot), -1) > index
+                    for snapshot, replaced in SUPERSEDED_EVENTS.items()
+                    if event["name"] in replaced
+                )
+            ]
+            superseded += len(event["channels"]) - len(channels)
+            if channels:
+                coalesced.append(dict(event, channels=channels))
+
+        if superseded:
+            Metrics.observe("compta_pusher_events_total", {"outcome": "superseded"}, superseded)
+        return coalesced
+
+    @staticmethod
+    def flush() -> int:
+        """
+        Vide le tampon et envoie tout ; exécuté par la tâche flush_pusher_events
+        """
+        _, client = PusherPublisher.get_clients()
+        if client is None:
+            return 0
+        # Libéré avant la lecture : un dépôt pendant l'envoi programme l'envoi suivant
+        client.delete(PENDING_KEY)
+
+        pipeline = client.pipeline(transaction=True)
+        pipeline.lrange(QUEUE_KEY, 0, -1)
+        pipeline.delete(QUEUE_KEY)
+        queued, _ = pipeline.execute()
+
+        events = PusherPublisher.coalesce([json.loads(event) for event in queued])
+        done = sent = 0
+        try:
+            for request in PusherPublisher.get_requests(events):
+                sent += PusherPublisher.send_request(request)
+                done += len(request)
+        except Exception:
+            PusherPublisher.requeue(events[done:])
+            raise
+        return sent
+
+    @staticmethod
+    def requeue(events: List[Dict[str, Any]]):
+        """
+        Remet en tête du tampon les événements non envoyés, dans leur ordre
+        Un snapshot déposé pendant l'envoi les remplacera au prochain envoi
+        """
+        if not events:
+            return
+        _, client = PusherPublisher.get_clients()
+        client.lpush(QUEUE_KEY, *[json.dumps(event) for event in reversed(events)])
+        Metrics.observe("compta_pusher_events_total", {"outcome": "requeued"}, len(events))
+        PusherPublisher.schedule()
+
+    @staticmethod
+    def get_size(data) -> int:
+        return sys.getsizeof(data if isinstance(data, str) else json.dumps(data, ensure_ascii=False))
+
+    @staticmethod
+    def is_batchable(event: Dict[str, Any]) -> bool:
+        return (
+            len(event["channels"]) == 1
+            and PusherPublisher.get_size(event["data"]) <= BATCH_MAX_DATA
+        )
+
+    @staticmethod
+    def get_requests(events: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        Découpe en appels Pusher, dans l'ordre : trigger_batch par BATCH_SIZE
+        événements à un channel, un appel trigger (MAX_CHANNELS channels au
+        plus) pour un événement à plusieurs channels ou trop gros pour un batch
+        """
+        requests, batch = [], []
+        for event in events:
+            if PusherPublisher.is_batchable(event):
+                batch.append(event)
+                if len(batch) == BATCH_SIZE:
+                    requests.append(batch)
+                    batch = []
+                continue
+            if batch:
+                requests.append(batch)
+                batch = []
+            channels = event["channels"]
+            for start in range(0, len(channels), MAX_CHANNELS):
+                requests.append([dict(event, channels=channels[start : start + MAX_CHANNELS])])
+        if batch:
+            requests.append(batch)
+        return requests
+
+    @staticmethod
+    def send_request(request: List[Dict[str, Any]]) -> int:
+        """
+        Un appel Pusher, retourne le nombre d'événements envoyés ;
+        un événement refusé avant l'envoi (données trop grosses même pour
+        trigger, channel invalide) est abandonné : le renvoyer échouerait de
+        la même façon
+        """
+        pusher_client, _ = PusherPublisher.get_clients()
+        try:
+            if len(request) == 1 and not PusherPublisher.is_batchable(request[0]):
+                event = request[0]
+                with Metrics.span("pusher", "trigger"):
+                    pusher_client.trigger(event["channels"], event["name"], event["data"])
+            else:
+                # trigger_batch remplace les données par leur version encodée : copie
+                batch = [
+                    {"channel": event["channels"][0], "name": event["name"], "data": event["data"]}
+                    for event in request
+                ]
+                with Metrics.span("pusher", "trigger_batch"):
+                    pusher_client.trigger_batch(batch)
+        except (TypeError, ValueError) as e:
+            logger.error("Événements Pusher abandonnés (%s) : %s", len(request), e)
+            Metrics.observe("compta_pusher_events_total", {"outcome": "dropped"}, len(request))
+            return 0
+        Metrics.observe("compta_pusher_events_total", {"outcome": "sent"}, len(request))
+        return len(request)
+
+    @staticmethod
+    def send(events: List[Dict[str, Any]]) -> int:
+        return sum(
+            PusherPublisher.send_request(request)
+            for request in PusherPublisher.get_requests(events)
+        )
@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from compta.models import Transaction
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "compta:refresh:pending"
+# Ids des transactions en attente de la fenêtre courante (liste Redis)
+QUEUE_KEY = "compta:refresh:queue"
+# Compteurs partagés par tous les processus (même Redis)
+METRIC_KEYS = {
+    "triggers": "compta:refresh:triggers",
+    "flushes": "compta:refresh:flushes",
+    "merged": "compta:refresh:merged",
+}
+
+
+class BalanceRefreshScheduler:
+    """
+    Regroupe les transactions arrivées pendant COMPTA_BALANCE_REFRESH_WINDOW
+    secondes en un seul rafraîchissement des balances et un seul push des stats
+
+    Chaque transaction dépose son id dans une liste Redis
+    (COMPTA_REFRESH_REDIS_URL, par défaut le Redis du cache ou du broker
+    Celery) ; le premier déclencheur d'une fenêtre pose un marqueur partagé
+    et programme la tâche `flush_balance_refresh`, qui vide la liste d'un
+    coup. Les ids sont repris tels quels : une transaction d'id plus petit
+    validée après une autre n'est pas perdue. Sans Redis configuré, schedule
+    lève ImproperlyConfigured plutôt que de programmer une tâche par transaction.
+    """
+
+    _client = None
+    _pid: Optional[int] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_window() -> int:
+        return getattr(settings, "COMPTA_BALANCE_REFRESH_WINDOW", 5)
+
+    @staticmethod
+    def get_redis_url() -> Optional[str]:
+        return getattr(settings, "COMPTA_REFRESH_REDIS_URL", None)
+
+    @staticmethod
+    def get_client():
+        # Un client par processus (même principe que Metrics)
+        pid = os.getpid()
+        if BalanceRefreshScheduler._client is not None and BalanceRefreshScheduler._pid == pid:
+            return BalanceRefreshScheduler._client
+
+        if not BalanceRefreshScheduler.get_redis_url():
+            raise ImproperlyConfigured(
+                "COMPTA_REFRESH_REDIS_URL est requis pour regrouper les "
+                "rafraîchissements de balance entre processus"
+            )
+        with BalanceRefreshScheduler._lock:
+            if BalanceRefreshScheduler._client is None or BalanceRefreshScheduler._pid != pid:
+                import redis
+
+                BalanceRefreshScheduler._client = redis.Redis.from_url(
+                    BalanceRefreshScheduler.get_redis_url()
+                )
+                BalanceRefreshScheduler._pid = pid
+        return BalanceRefreshScheduler._client
+
+    @staticmethod
+    def schedule(*transaction_ids: int) -> bool:
+        """
+        Retourne True si un nouveau rafraîchissement a été programmé,
+        False si les transactions ont été fusionnées dans celui en attente
+        """
+        from compta.tasks import flush_balance_refresh
+
+        window = BalanceRefreshScheduler.get_window()
+        client = BalanceRefreshScheduler.get_client()
+        pipeline = client.pipeline(transaction=True)
+        pipeline.rpush(QUEUE_KEY, *transaction_ids)
+        # Le marqueur expire de lui-même si la tâche est perdue
+        pipeline.set(PENDING_KEY, 1, nx=True, ex=window + 60)
+        pipeline.incrby(METRIC_KEYS["triggers"], len(transaction_ids))
+        _, created, _ = pipeline.execute()
+        if not created:
+            return False
+
+        flush_balance_refresh.apply_async(countdown=window)
+        return True
+
+    @staticmethod
+    def collect(transaction_ids: Optional[Iterable[int]] = None) -> List[Transaction]:
+        """
+        Libère la fenêtre puis retourne les transactions à traiter, dans l'ordre
+        La liste des ids en attente est vidée atomiquement ; un id déposé juste
+        après part avec la fenêtre suivante. Des ids passés en argument
+        (tâches programmées par une version précédente) sont ajoutés.
+        """
+        client = BalanceRefreshScheduler.get_client()
+        pipeline = client.pipeline(transaction=True)
+        pipeline.delete(PENDING_KEY)
+        pipeline.lrange(QUEUE_KEY, 0, -1)
+        pipeline.delete(QUEUE_KEY)
+        _, queued, _ = pipeline.execute()
+        ids = {int(transaction_id) for transaction_id in queued}
+        ids.update(transaction_ids or [])
+
+        transactions = list(Transaction.objects.filter(id__in=ids).order_by("id"))
+
+        pipeline = client.pipeline(transaction=False)
+        pipeline.incr(METRIC_KEYS["flushes"])
+        if len(transactions) > 1:
+            pipeline.incrby(METRIC_KEYS["merged"], len(transactions) - 1)
+        pipeline.execute()
+        logger.info(
+            "Rafraîchissement des balances : %s transaction(s) regroupée(s)",
+            len(transactions),
+        )
+        return transactions
+
+    @staticmethod
+    def get_metrics() -> Dict[str, int]:
+        values = BalanceRefreshScheduler.get_client().mget(list(METRIC_KEYS.values()))
+        return {name: int(value or 0) for name, value in zip(METRIC_KEYS, values)}
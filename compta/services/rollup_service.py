@@ -0,0 +1,216 @@
+from typing import Dict, Any, List, Iterable
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction as db_transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncHour
+from django.utils import timezone
+from compta.models import Transaction, TransactionRollup
+from compta.services.filter_service import FilterService
+from compta.services.stats_services import STATS_DIMENSIONS, StatsService
+
+
+# Espace des verrous consultatifs PostgreSQL par heure d'agrégat
+ROLLUP_LOCK_NAMESPACE = 7207
+
+
+def floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(value: datetime) -> datetime:
+    floored = floor_hour(value)
+    return floored if floored == value else floored + timedelta(hours=1)
+
+
+class RollupService:
+    """Service pour maintenir et interroger l'agrégat horaire TransactionRollup"""
+
+    @staticmethod
+    def get_rollup_key(transaction: Transaction) -> Dict[str, Any]:
+        """
+        Clé (heure, dimensions) d'une transaction dans TransactionRollup
+        """
+        return {
+            "bucket": floor_hour(transaction.created_at),
+            "mobcash": transaction.mobcash,
+            "api": transaction.api,
+            "network": transaction.network or "",
+            "source": transaction.source,
+            "type": transaction.type,
+        }
+
+    @staticmethod
+    def add_transaction(transaction: Transaction):
+        """
+        Ajoute une transaction à son agrégat horaire (UPDATE ... SET count = count + 1)
+        Crée la ligne si elle n'existe pas encore
+        """
+        RollupService.add_delta(
+            RollupService.get_rollup_key(transaction),
+            count=1,
+            amount=transaction.amount,
+            mobcash_fee=transaction.mobcash_fee,
+            blaffa_fee=transaction.blaffa_fee,
+        )
+
+    @staticmethod
+    def lock_hours(hours: Iterable[datetime], shared: bool):
+        """
+        Verrous consultatifs PostgreSQL par heure, libérés à la fin de la transaction
+        Partagés pour les incréments (add_delta), exclusifs pour rebuild_range :
+        une reconstruction attend les incréments en cours et les suivants l'attendent.
+        Toujours pris par heure croissante (pas d'interblocage entre lots)
+        """
+        if connection.vendor != "postgresql":
+            return
+        function = "pg_advisory_xact_lock_shared" if shared else "pg_advisory_xact_lock"
+        with connection.cursor() as cursor:
+            for hour in sorted(set(hours)):
+                cursor.execute(
+                    f"SELECT {function}(%s, %s)",
+                    [ROLLUP_LOCK_NAMESPACE, int(hour.timestamp() // 3600)],
+                )
+
+    @staticmethod
+    def add_delta(key: Dict[str, Any], count, amount, mobcash_fee, blaffa_fee):
+        """
+        Incrémente une ligne TransactionRollup, les fees NULL ne sont pas ajoutés
+        À appeler dans la transaction qui insère les lignes comptées
+        """
+        RollupService.lock_hours([key["bucket"]], shared=True)
+        updates = {"count": F("count") + count, "amount": F("amount") + amount}
+        if mobcash_fee is not None:
+            updates["mobcash_fee"] = Coalesce(F("mobcash_fee"), Decimal(0)) + mobcash_fee
+        if blaffa_fee is not None:
+            updates["blaffa_fee"] = Coalesce(F("blaffa_fee"), Decimal(0)) + blaffa_fee
+
+        if TransactionRollup.objects.filter(**key).update(**updates):
+            return
+
+        try:
+            with db_transaction.atomic():
+                TransactionRollup.objects.create(
+                    **key,
+                    count=count,
+                    amount=amount,
+                    mobcash_fee=mobcash_fee,
+                    blaffa_fee=blaffa_fee,
+                )
+        except IntegrityError:
+            # Créée entre-temps par un autre process : on incrémente
+            TransactionRollup.objects.filter(**key).update(**updates)
+
+    @staticmethod
+    def get_grouped_rows(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Même résultat que StatsService.get_grouped_rows sur les transactions filtrées
+        Les heures complètes sont lues dans TransactionRollup,
+        seules les heures partielles (début / fin de fenêtre) lisent Transaction
+        """
+        transactions = Transaction.objects.all()
+        if not getattr(settings, "COMPTA_ROLLUP_ENABLED", False):
+            return StatsService.get_grouped_rows(
+                FilterService.apply_filters(transactions, filters)
+            )
+
+        start_date = None if filters.get("is_all_date") else filters.get("start_date")
+        end_date = None if filters.get("is_all_date") else filters.get("end_date")
+        now = timezone.now()
+
+        # Heures complètes : [first_hour, last_hour)
+        first_hour = ceil_hour(start_date) if start_date else None
+        last_hour = floor_hour(min(end_date, now) if end_date else now)
+
+        if first_hour is not None and first_hour >= last_hour:
+            # Fenêtre plus courte qu'une heure complète : lecture brute
+            return StatsService.get_grouped_rows(
+                FilterService.apply_filters(transactions, filters)
+            )
+
+        # Heures partielles lues dans Transaction
+        tail = Q(created_at__gte=last_hour)
+        if end_date:
+            tail &= Q(created_at__lte=end_date)
+        edges = tail
+        if start_date and start_date < first_hour:
+            edges |= Q(created_at__gte=start_date, created_at__lt=first_hour)
+        raw_rows = StatsService.get_grouped_rows(
+            FilterService.apply_dimension_filters(transactions.filter(edges), filters)
+        )
+
+        # Heures complètes lues dans TransactionRollup
+        rollups = TransactionRollup.objects.filter(bucket__lt=last_hour)
+        if first_hour is not None:
+            rollups = rollups.filter(bucket__gte=first_hour)
+        rollups = FilterService.apply_dimension_filters(rollups, filters)
+        rollup_rows = [
+            dict(row, network=row["network"] or None)
+            for row in rollups.values(*STATS_DIMENSIONS).annotate(
+                total=Sum("count"),
+                total_amount=Sum("amount"),
+                fee=Sum("mobcash_fee"),
+                blaffa_fee=Sum("blaffa_fee"),
+            )
+        ]
+
+        return raw_rows + rollup_rows
+
+    @staticmethod
+    def rebuild_range(start: datetime, end: datetime) -> int:
+        """
+        Recalcule les agrégats des heures [start, end) depuis Transaction
+        Idempotent : les lignes existantes de la plage sont remplacées
+        Lecture et remplacement sous verrou exclusif des heures (voir lock_hours)
+        """
+        hours = []
+        hour = floor_hour(start)
+        while hour < end:
+            hours.append(hour)
+            hour += timedelta(hours=1)
+
+        with db_transaction.atomic():
+            RollupService.lock_hours(hours, shared=False)
+            rows = (
+                Transaction.objects.filter(created_at__gte=start, created_at__lt=end)
+                .order_by()
+                .annotate(bucket=TruncHour("created_at"))
+                .values("bucket", *STATS_DIMENSIONS)
+                .annotate(
+                    total=Count("id"),
+                    total_amount=Sum("amount"),
+                    fee=Sum("mobcash_fee"),
+                    blaffa_fee=Sum("blaffa_fee"),
+                )
+            )
+            rollups = [
+                TransactionRollup(
+                    bucket=row["bucket"],
+                    mobcash=row["mobcash"],
+                    api=row["api"],
+                    network=row["network"] or "",
+                    source=row["source"],
+                    type=row["type"],
+                    count=row["total"],
+                    amount=row["total_amount"] or 0,
+                    mobcash_fee=row["fee"],
+                    blaffa_fee=row["blaffa_fee"],
+                )
+                for row in rows
+            ]
+
+            TransactionRollup.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+            TransactionRollup.objects.bulk_create(rollups, batch_size=1000)
+
+        return len(rollups)
+
+    @staticmethod
+    def iter_days(start: datetime, end: datetime) -> Iterable[datetime]:
+        """
+        Découpe [start, end) en tranches d'un jour pour les reconstructions
+        """
+        current = floor_hour(start).replace(hour=0)
+        while current < end:
+            yield current
+            current += timedelta(days=1)
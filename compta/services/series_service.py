@@ -0,0 +1,140 @@
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMonth, TruncWeek
+from django.utils import timezone
+from compta.models import Transaction
+from compta.services.filter_service import FilterService
+from compta.services.stats_services import STATS_DIMENSIONS
+
+# Granularités supportées et fonction date_trunc correspondante
+GRANULARITIES = {
+    "hour": TruncHour,
+    "day": TruncDay,
+    "week": TruncWeek,
+    "month": TruncMonth,
+}
+
+
+def truncate(value: datetime, granularity: str) -> datetime:
+    """
+    Même découpage que date_trunc, en heure locale (sans fuseau)
+    """
+    value = timezone.localtime(value).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    if granularity == "hour":
+        return value
+    value = value.replace(hour=0)
+    if granularity == "week":
+        return value - timedelta(days=value.weekday())
+    if granularity == "month":
+        return value.replace(day=1)
+    return value
+
+
+def next_bucket(value: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return value + timedelta(hours=1)
+    if granularity == "day":
+        return value + timedelta(days=1)
+    if granularity == "week":
+        return value + timedelta(weeks=1)
+    if value.month == 12:
+        return value.replace(year=value.year + 1, month=1)
+    return value.replace(month=value.month + 1)
+
+
+class SeriesService:
+    """Service pour les séries temporelles du dashboard (graphiques)"""
+
+    @staticmethod
+    def get_max_buckets() -> int:
+        return getattr(settings, "COMPTA_SERIES_MAX_BUCKETS", 2000)
+
+    @staticmethod
+    def get_series(
+        filters: Dict[str, Any], granularity: str, split: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        count / amount / mobcash_fee / blaffa_fee par bucket, éventuellement par valeur
+        d'une dimension, en un seul GROUP BY date_trunc ; les buckets vides sont complétés
+        Retourne [{"key": valeur de la dimension ou "all", "points": [...]}]
+        Lève ValueError si la granularité ou la dimension est inconnue, ou la série trop longue
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularité inconnue : {granularity}")
+        if split is not None and split not in STATS_DIMENSIONS:
+            raise ValueError(f"Dimension inconnue : {split}")
+
+        # Fenêtre bornée : taille de la série vérifiée avant la requête
+        has_start = not filters.get("is_all_date") and filters.get("start_date")
+        buckets = SeriesService.get_buckets(filters, granularity, []) if has_start else None
+
+        transactions = FilterService.apply_filters(Transaction.objects.all(), filters)
+        group_by = ["bucket"] + ([split] if split else [])
+        rows = list(
+            transactions.order_by()
+            .annotate(bucket=GRANULARITIES[granularity]("created_at"))
+            .values(*group_by)
+            .annotate(
+                count=Count("id"),
+                amount=Sum("amount"),
+                mobcash_fee=Sum("mobcash_fee"),
+                blaffa_fee=Sum("blaffa_fee"),
+            )
+        )
+
+        if buckets is None:
+            buckets = SeriesService.get_buckets(filters, granularity, rows)
+
+        grouped: Dict[str, Dict[datetime, Dict]] = {}
+        for row in rows:
+            key = row[split] if split else "all"
+            grouped.setdefault(key, {})[truncate(row["bucket"], granularity)] = row
+        if not split:
+            grouped.setdefault("all", {})
+
+        series = []
+        for key in sorted(grouped, key=lambda value: (value is None, value or "")):
+            points = []
+            for bucket in buckets:
+                row = grouped[key].get(bucket, {})
+                points.append(
+                    {
+                        "bucket": timezone.make_aware(bucket),
+                        "count": row.get("count", 0),
+                        "amount": row.get("amount") or Decimal(0),
+                        "mobcash_fee": row.get("mobcash_fee") or Decimal(0),
+                        "blaffa_fee": row.get("blaffa_fee") or Decimal(0),
+                    }
+                )
+            series.append({"key": key, "points": points})
+        return series
+
+    @staticmethod
+    def get_buckets(
+        filters: Dict[str, Any], granularity: str, rows: List[Dict[str, Any]]
+    ) -> List[datetime]:
+        """
+        Tous les buckets de la fenêtre filtrée, y compris ceux sans transaction
+        Sans date de début (is_all_date), la série commence au premier bucket non vide
+        """
+        start = None if filters.get("is_all_date") else filters.get("start_date")
+        end = None if filters.get("is_all_date") else filters.get("end_date")
+        if start is None:
+            if not rows:
+                return []
+            start = min(row["bucket"] for row in rows)
+        end = end or timezone.now()
+
+        buckets = []
+        bucket, last = truncate(start, granularity), truncate(end, granularity)
+        while bucket <= last:
+            buckets.append(bucket)
+            if len(buckets) > SeriesService.get_max_buckets():
+                raise ValueError(
+                    f"Maximum {SeriesService.get_max_buckets()} buckets, choisir une granularité plus large"
+                )
+            bucket = next_bucket(bucket, granularity)
+        return buckets
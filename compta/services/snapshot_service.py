@@ -0,0 +1,162 @@
+import hashlib
+import json
+from typing import Callable, Dict, Any
+from django.conf import settings
+from django.core.cache import caches
+from compta.utils import DIMENSION_FIELDS, normalize_dimension
+
+GENERATION_KEY = "compta:snapshot:generation"
+# Index des snapshots actifs : une entrée par enregistrement, numérotée par un
+# compteur atomique (pas de dict partagé réécrit par plusieurs processus)
+INDEX_LAST_KEY = "compta:snapshot:index:last"
+INDEX_LOW_KEY = "compta:snapshot:index:low"
+INDEX_ENTRY_KEY = "compta:snapshot:index:{slot}"
+
+
+class SnapshotService:
+    """
+    Cache des snapshots du dashboard, indexé par un hash canonique des filtres
+
+    Invalidation :
+    - une transaction créée supprime les snapshots dont la fenêtre et les
+      dimensions la contiennent (index des snapshots actifs : une clé par
+      snapshot enregistré, expirant avec lui)
+    - un changement de balance / config API ou MobCash invalide tout
+      (numéro de génération inclus dans chaque clé)
+    """
+
+    @staticmethod
+    def get_cache():
+        return caches["snapshots"]
+
+    @staticmethod
+    def get_filter_key(filters: Dict[str, Any]) -> str:
+        """
+        Hash canonique des filtres traités
+        Pour une fenêtre relative (last=...), les dates recalculées à chaque
+        appel sont ignorées afin que la clé reste stable
+        """
+        canonical = {
+            "last": filters.get("last"),
+            "is_all_date": bool(filters.get("is_all_date")),
+        }
+        if not filters.get("last") and not filters.get("is_all_date"):
+            for field in ("start_date", "end_date"):
+                value = filters.get(field)
+                canonical[field] = value.isoformat() if value else None
+        for field in DIMENSION_FIELDS:
+            canonical[field] = sorted(
+                {normalize_dimension(value) for value in filters.get(field) or []}
+            )
+
+        encoded = json.dumps(canonical, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    @staticmethod
+    def get_ttl(filters: Dict[str, Any]) -> int:
+        ttl = getattr(settings, "COMPTA_SNAPSHOT_TTL", {})
+        if filters.get("last") and not filters.get("is_all_date"):
+            return ttl.get("relative", 60)
+        return ttl.get("default", 300)
+
+    @staticmethod
+    def get_or_compute(filters: Dict[str, Any], compute: Callable[[], Dict]) -> Dict:
+        """
+        Retourne le snapshot en cache ou le calcule puis l'enregistre
+        """
+        cache = SnapshotService.get_cache()
+        generation = cache.get(GENERATION_KEY, 0)
+        cache_key = f"compta:snapshot:{generation}:{SnapshotService.get_filter_key(filters)}"
+
+        snapshot = cache.get(cache_key)
+        if snapshot is not None:
+            return snapshot
+
+        snapshot = compute()
+        ttl = SnapshotService.get_ttl(filters)
+        cache.set(cache_key, snapshot, ttl)
+        SnapshotService.register(cache_key, filters, ttl)
+        return snapshot
+
+    @staticmethod
+    def register(cache_key: str, filters: Dict[str, Any], ttl: int):
+        """
+        Enregistre la fenêtre et les dimensions couvertes par un snapshot
+        """
+        cache = SnapshotService.get_cache()
+        is_all_date = filters.get("is_all_date")
+        # Une fenêtre relative se termine toujours à "maintenant" au prochain calcul
+        is_relative = bool(filters.get("last"))
+        entry = {
+            "cache_key": cache_key,
+            "start_date": None if is_all_date else filters.get("start_date"),
+            "end_date": None if is_all_date or is_relative else filters.get("end_date"),
+            "dimensions": {
+                field: [normalize_dimension(value) for value in filters.get(field) or []]
+                for field in DIMENSION_FIELDS
+            },
+        }
+        slot = 1 if cache.add(INDEX_LAST_KEY, 1, None) else cache.incr(INDEX_LAST_KEY)
+        cache.set(INDEX_ENTRY_KEY.format(slot=slot), entry, ttl)
+
+    @staticmethod
+    def get_entries() -> Dict[str, Dict]:
+        """
+        Entrées actives de l'index (clé d'entrée -> entrée), en une lecture groupée
+        Les entrées expirent avec leur snapshot ; le premier numéro encore actif
+        est mémorisé pour ne pas relire les plus anciennes
+        """
+        cache = SnapshotService.get_cache()
+        last = cache.get(INDEX_LAST_KEY, 0)
+        low = cache.get(INDEX_LOW_KEY, 1)
+        keys = [INDEX_ENTRY_KEY.format(slot=slot) for slot in range(low, last + 1)]
+        entries = cache.get_many(keys)
+
+        first_active = next((slot for slot, key in enumerate(keys, low) if key in entries), last + 1)
+        if first_active > low:
+            # Indication seulement : une écriture concurrente ne peut que la laisser plus basse
+            cache.set(INDEX_LOW_KEY, first_active, None)
+        return entries
+
+    @staticmethod
+    def matches(entry: Dict[str, Any], transaction) -> bool:
+        """
+        Indique si une transaction tombe dans la fenêtre et les dimensions d'un snapshot
+        """
+        created_at = transaction.created_at
+        if entry["start_date"] and created_at < entry["start_date"]:
+            return False
+        if entry["end_date"] and created_at > entry["end_date"]:
+            return False
+        for field, values in entry["dimensions"].items():
+            if values and normalize_dimension(getattr(transaction, field)) not in values:
+                return False
+        return True
+
+    @staticmethod
+    def invalidate_transaction(transaction) -> int:
+        """
+        Supprime les snapshots concernés par une nouvelle transaction
+        """
+        return SnapshotService.invalidate_transactions([transaction])
+
+    @staticmethod
+    def invalidate_transactions(transactions) -> int:
+        stale = {
+            key: entry["cache_key"]
+            for key, entry in SnapshotService.get_entries().items()
+            if any(SnapshotService.matches(entry, transaction) for transaction in transactions)
+        }
+        if stale:
+            SnapshotService.get_cache().delete_many(list(stale) + list(stale.values()))
+        return len(stale)
+
+    @staticmethod
+    def invalidate_all():
+        """
+        Invalide tous les snapshots (balance ou config API / MobCash modifiée)
+        Les entrées d'index de l'ancienne génération expirent d'elles-mêmes
+        """
+        cache = SnapshotService.get_cache()
+        if not cache.add(GENERATION_KEY, 1, None):
+            cache.incr(GENERATION_KEY)
@@ -1,6 +1,7 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Optional
 from collections import OrderedDict
-from django.db.models import Sum, QuerySet
+from django.db.models import Count, Q, Sum, QuerySet
+from compta.config_registry import ConfigRegistry
 from compta.models import (
     APITransaction,
     MobCashApp,
@@ -11,6 +12,25 @@ from compta.models import (
 )
 from compta.serializers import MobCashAppSerializer
 
+# Dimensions sur lesquelles les transactions sont regroupées en une seule requête
+STATS_DIMENSIONS = ("mobcash", "api", "network", "source", "type")
+
+
+def _empty_totals() -> Dict[str, any]:
+    return {"total": 0, "total_amount": 0, "fee": 0}
+
+
+def _add_row(totals: Dict[str, any], row: Dict[str, any]):
+    """
+    Ajoute une ligne agrégée (count / sum) aux totaux d'un groupe
+    Les sommes NULL sont ignorées, comme le faisait `aggregate(...) or 0`
+    """
+    totals["total"] += row["total"]
+    if row["total_amount"] is not None:
+        totals["total_amount"] += row["total_amount"]
+    if row["fee"] is not None:
+        totals["fee"] += row["fee"]
+
 
 class StatsService:
     """Service pour calculer les statistiques des transactions"""
@@ -19,69 +39,160 @@ class StatsService:
     def get_all_stats(transactions: QuerySet) -> Dict[str, any]:
         """
         Récupère toutes les statistiques pour un ensemble de transactions
+        Une seule requête GROUP BY alimente toutes les ventilations
+        """
+        rows = StatsService.get_grouped_rows(transactions)
+        return StatsService.build_all_stats(rows)
+
+    @staticmethod
+    def get_grouped_rows(transactions: QuerySet) -> List[Dict[str, any]]:
+        """
+        Regroupe les transactions par (mobcash, api, network, source, type)
+        et calcule count / sum(amount) / sum(mobcash_fee) / sum(blaffa_fee)
+        en une seule requête
+        """
+        return list(StatsService.get_grouped_queryset(transactions))
+
+    @staticmethod
+    def get_grouped_queryset(transactions: QuerySet) -> QuerySet:
+        """
+        Requête GROUP BY (non évaluée) utilisée par get_grouped_rows
+        """
+        # order_by() vide : sinon created_at serait ajouté au GROUP BY
+        return (
+            transactions.order_by()
+            .values(*STATS_DIMENSIONS)
+            .annotate(
+                total=Count("id"),
+                total_amount=Sum("amount"),
+                fee=Sum("mobcash_fee"),
+                blaffa_fee=Sum("blaffa_fee"),
+            )
+        )
+
+    @staticmethod
+    def get_split_grouped_rows(
+        transactions: QuerySet, split_at
+    ) -> Tuple[List[Dict[str, any]], List[Dict[str, any]]]:
+        """
+        Comme get_grouped_rows, pour deux périodes contiguës en un seul parcours
+        Retourne (lignes à partir de split_at, lignes avant split_at)
+        """
+        rows = StatsService.get_window_grouped_rows(
+            transactions,
+            {
+                "current": Q(created_at__gte=split_at),
+                "previous": Q(created_at__lt=split_at),
+            },
+        )
+        return rows["current"], rows["previous"]
+
+    @staticmethod
+    def get_window_grouped_rows(
+        transactions: QuerySet, windows: Dict[str, Q]
+    ) -> Dict[str, List[Dict[str, any]]]:
+        """
+        Comme get_grouped_rows pour plusieurs fenêtres (nom -> condition) en un seul
+        parcours : un jeu d'agrégats conditionnels (FILTER) par fenêtre
+        Retourne {nom: lignes regroupées de la fenêtre}
+        """
+        annotations = {}
+        for index, condition in enumerate(windows.values()):
+            annotations.update(
+                {
+                    f"w{index}_total": Count("id", filter=condition),
+                    f"w{index}_total_amount": Sum("amount", filter=condition),
+                    f"w{index}_fee": Sum("mobcash_fee", filter=condition),
+                    f"w{index}_blaffa_fee": Sum("blaffa_fee", filter=condition),
+                }
+            )
+        grouped = transactions.order_by().values(*STATS_DIMENSIONS).annotate(**annotations)
+
+        rows = {name: [] for name in windows}
+        for row in grouped:
+            key = {field: row[field] for field in STATS_DIMENSIONS}
+            for index, name in enumerate(windows):
+                if row[f"w{index}_total"]:
+                    rows[name].append(
+                        dict(
+                            key,
+                            total=row[f"w{index}_total"],
+                            total_amount=row[f"w{index}_total_amount"],
+                            fee=row[f"w{index}_fee"],
+                            blaffa_fee=row[f"w{index}_blaffa_fee"],
+                        )
+                    )
+        return rows
+
+    @staticmethod
+    def build_all_stats(rows: List[Dict[str, any]]) -> Dict[str, any]:
+        """
+        Construit toutes les statistiques à partir des lignes regroupées
         """
         return {
-            "mobcash_stats": StatsService.get_mobcash_stats(transactions),
-            "api_stats": StatsService.get_api_stats(transactions),
+            "mobcash_stats": StatsService.get_mobcash_stats(rows=rows),
+            "api_stats": StatsService.get_api_stats(rows=rows),
             "network_stats": StatsService.get_generic_stats(
-                transactions, "network", NETWORK_CHOICES
+                None, "network", NETWORK_CHOICES, rows=rows
             ),
             "source_stats": StatsService.get_generic_stats(
-                transactions, "source", SOURCE_CHOICES
+                None, "source", SOURCE_CHOICES, rows=rows
             ),
             "type_stats": StatsService.get_generic_stats(
-                transactions, "type", TYPE_CHOICES
+                None, "type", TYPE_CHOICES, rows=rows
             ),
         }
 
     @staticmethod
-    def get_mobcash_stats(transactions: QuerySet) -> OrderedDict:
+    def get_mobcash_stats(
+        transactions: Optional[QuerySet] = None, rows: Optional[List[Dict]] = None
+    ) -> OrderedDict:
         """
         Calcule les statistiques détaillées par MobCash
         """
-        mobcash_apps = MobCashApp.objects.all()
+        if rows is None:
+            rows = StatsService.get_grouped_rows(transactions)
+
+        # Agrégation en mémoire : totaux par mobcash et par type
+        grouped = {}
+        for row in rows:
+            entry = grouped.setdefault(
+                row["mobcash"],
+                {"all": _empty_totals(), "depot": _empty_totals(), "retrait": _empty_totals()},
+            )
+            _add_row(entry["all"], row)
+            if row["type"] in ("depot", "retrait"):
+                _add_row(entry[row["type"]], row)
+
+        mobcash_apps = ConfigRegistry.all(MobCashApp)
         data = {}
 
         for mobcash in mobcash_apps:
             name = mobcash.name
-            txs = transactions.filter(mobcash=name)
-
-            # Statistiques détaillées
-            deposit_txs = txs.filter(type="depot")
-            retrait_txs = txs.filter(type="retrait")
+            entry = grouped.get(
+                name,
+                {"all": _empty_totals(), "depot": _empty_totals(), "retrait": _empty_totals()},
+            )
+            txs = entry["all"]
+            deposit_txs = entry["depot"]
+            retrait_txs = entry["retrait"]
 
             data[name] = {
-                "total": txs.count(),
-                "total_amount": txs.aggregate(total=Sum("amount"))["total"] or 0,
-                "fee": txs.aggregate(total=Sum("mobcash_fee"))["total"] or 0,
+                "total": txs["total"],
+                "total_amount": txs["total_amount"],
+                "fee": txs["fee"],
                 "image": mobcash.image,
                 "balance": mobcash.balance,
                 "id": mobcash.id,
                 "name": mobcash.name.upper(),
-                "total_commission_amount": txs.aggregate(total=Sum("mobcash_fee"))[
-                    "total"
-                ]
-                or 0,
-                "total_operations_amount": txs.aggregate(total=Sum("amount"))["total"]
-                or 0,
-                "withdrawal_commission": retrait_txs.aggregate(
-                    total=Sum("mobcash_fee")
-                )["total"]
-                or 0,
-                "deposit_commission": deposit_txs.aggregate(total=Sum("mobcash_fee"))[
-                    "total"
-                ]
-                or 0,
-                "total_withdrawal_amount": retrait_txs.aggregate(total=Sum("amount"))[
-                    "total"
-                ]
-                or 0,
-                "total_deposit_amount": deposit_txs.aggregate(total=Sum("amount"))[
-                    "total"
-                ]
-                or 0,
-                "total_withdrawals": retrait_txs.count(),
-                "total_deposit": deposit_txs.count(),
+                "total_commission_amount": txs["fee"],
+                "total_operations_amount": txs["total_amount"],
+                "withdrawal_commission": retrait_txs["fee"],
+                "deposit_commission": deposit_txs["fee"],
+                "total_withdrawal_amount": retrait_txs["total_amount"],
+                "total_deposit_amount": deposit_txs["total_amount"],
+                "total_withdrawals": retrait_txs["total"],
+                "total_deposit": deposit_txs["total"],
                 "mobcash_setting": MobCashAppSerializer(mobcash).data,
             }
 
@@ -93,20 +204,50 @@ class StatsService:
         return sorted_data
 
     @staticmethod
-    def get_api_stats(transactions: QuerySet) -> OrderedDict:
+    def get_api_stats(
+        transactions: Optional[QuerySet] = None, rows: Optional[List[Dict]] = None
+    ) -> OrderedDict:
         """
         Calcule les statistiques détaillées par API
         """
-        api_transactions = APITransaction.objects.all()
+        if rows is None:
+            rows = StatsService.get_grouped_rows(transactions)
+
+        grouped = {}
+        total_transactions = 0
+        for row in rows:
+            total_transactions += row["total"]
+            entry = grouped.setdefault(
+                row["api"],
+                {
+                    "all": _empty_totals(),
+                    "depot": _empty_totals(),
+                    "retrait": _empty_totals(),
+                    "network": {},
+                },
+            )
+            _add_row(entry["all"], row)
+            if row["type"] in ("depot", "retrait"):
+                _add_row(entry[row["type"]], row)
+            entry["network"][row["network"]] = (
+                entry["network"].get(row["network"], 0) + row["total"]
+            )
+
+        api_transactions = ConfigRegistry.all(APITransaction)
         data = {}
-        total_transactions = transactions.count()
 
         for api_transaction in api_transactions:
             api = api_transaction.name.lower()
-            txs = transactions.filter(api=api)
-            total = txs.count()
-            total_amount = txs.aggregate(total=Sum("amount"))["total"] or 0
-            fee = txs.aggregate(total=Sum("mobcash_fee"))["total"] or 0
+            entry = grouped.get(
+                api,
+                {
+                    "all": _empty_totals(),
+                    "depot": _empty_totals(),
+                    "retrait": _empty_totals(),
+                    "network": {},
+                },
+            )
+            total = entry["all"]["total"]
 
             # Pourcentage d'utilisation
             percent = (
@@ -115,10 +256,8 @@ class StatsService:
 
             # Stats par réseau
             raw_network_stat = {
-                "mtn": txs.filter(network="mtn").count(),
-                "moov": txs.filter(network="moov").count(),
-                "orange": txs.filter(network="orange").count(),
-                "wave": txs.filter(network="wave").count(),
+                network: entry["network"].get(network, 0)
+                for network in ("mtn", "moov", "orange", "wave")
             }
 
             # Tri décroissant des réseaux
@@ -129,20 +268,14 @@ class StatsService:
             data[api] = {
                 "label": api,
                 "total": total,
-                "total_amount": total_amount,
-                "fee": fee,
+                "total_amount": entry["all"]["total_amount"],
+                "fee": entry["all"]["fee"],
                 "balance": api_transaction.balance,
                 "percent": round(percent, 2),
-                "total_withdrawal_amount": txs.filter(type="retrait").aggregate(
-                    total=Sum("amount")
-                )["total"]
-                or 0,
-                "total_deposit_amount": txs.filter(type="depot").aggregate(
-                    total=Sum("amount")
-                )["total"]
-                or 0,
-                "total_withdrawals": txs.filter(type="retrait").count(),
-                "total_deposit": txs.filter(type="depot").count(),
+                "total_withdrawal_amount": entry["retrait"]["total_amount"],
+                "total_deposit_amount": entry["depot"]["total_amount"],
+                "total_withdrawals": entry["retrait"]["total"],
+                "total_deposit": entry["depot"]["total"],
                 "network_stat": sorted_network_stat,
                 "id": api_transaction.id,
             }
@@ -156,21 +289,31 @@ class StatsService:
 
     @staticmethod
     def get_generic_stats(
-        transactions: QuerySet, field: str, choices: List[Tuple[str, str]]
+        transactions: Optional[QuerySet],
+        field: str,
+        choices: List[Tuple[str, str]],
+        rows: Optional[List[Dict]] = None,
     ) -> Dict[str, any]:
         """
         Fonction générique pour calculer les stats
         Fonctionne pour source, network, type, etc.
         """
+        if rows is None:
+            rows = StatsService.get_grouped_rows(transactions)
+
+        grouped = {}
+        for row in rows:
+            _add_row(grouped.setdefault(row[field], _empty_totals()), row)
+
         data = {}
 
         for value, label in choices:
-            txs = transactions.filter(**{field: value})
+            totals = grouped.get(value, _empty_totals())
             data[value] = {
                 "label": label,
-                "total": txs.count(),
-                "total_amount": txs.aggregate(total=Sum("amount"))["total"] or 0,
-                "fee": txs.aggregate(total=Sum("mobcash_fee"))["total"] or 0,
+                "total": totals["total"],
+                "total_amount": totals["total_amount"],
+                "fee": totals["fee"],
             }
 
         return data
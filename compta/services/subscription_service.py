@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from compta.services.filter_service import FilterService
+from compta.utils import DIMENSION_FIELDS
+
+# Définitions (hash clé -> JSON) et expirations (zset clé -> timestamp) des abonnements
+SUBSCRIPTIONS_KEY = "compta:live:subscriptions"
+EXPIRY_KEY = "compta:live:subscriptions:expiry"
+# Dernière trame "stat_data" par groupe (hash version / text)
+FRAME_KEY = "compta:live:frame:{group}"
+# Compteur global : ordonne snapshots et deltas de tous les groupes
+VERSION_KEY = "compta:live:version"
+# Channel Pusher privé d'un admin : private-channel_<id>
+PUSHER_CHANNEL_PREFIX = "private-channel_"
+
+
+class SubscriptionService:
+    """
+    Abonnements aux stats temps réel, regroupés par filtre normalisé
+
+    Un abonnement est la définition brute d'un filtre (dates non recalculées,
+    "last" conservé, dimensions triées) : deux admins avec le même filtre
+    partagent la même clé, donc le même groupe websocket, et les stats ne
+    sont calculées et sérialisées qu'une fois par filtre distinct.
+
+    Les consumers websocket (daphne) enregistrent leur filtre dans Redis
+    (COMPTA_LIVE_REDIS_URL), lu par les workers qui calculent les stats :
+    une entrée par abonnement dans un hash, son expiration
+    (COMPTA_LIVE_SUBSCRIPTION_TTL) dans un sorted set, renouvelée tant que
+    la socket est ouverte. Sans Redis configuré, les abonnements lèvent
+    ImproperlyConfigured : un stockage local au processus ne serait jamais
+    vu par les workers. Les admins connectés à Pusher (channel privé occupé)
+    reçoivent leurs stats selon leur filtre sauvegardé.
+
+    En livraison "coalesce", la trame "stat_data" d'un groupe n'est pas
+    copiée dans la file de chaque socket : seule la dernière est gardée dans
+    le même Redis et le channel layer ne transporte qu'un numéro de version.
+    Les deltas reçoivent un numéro du même compteur : le consumer n'envoie
+    jamais un snapshot plus ancien qu'un delta déjà envoyé, ni un delta déjà
+    inclus dans le snapshot envoyé.
+    """
+
+    _client = None
+    _pid: Optional[int] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_redis_url() -> Optional[str]:
+        return getattr(settings, "COMPTA_LIVE_REDIS_URL", None)
+
+    @staticmethod
+    def get_client():
+        # Un client par processus (même principe que Metrics)
+        pid = os.getpid()
+        if SubscriptionService._client is not None and SubscriptionService._pid == pid:
+            return SubscriptionService._client
+
+        if not SubscriptionService.get_redis_url():
+            raise ImproperlyConfigured(
+                "COMPTA_LIVE_REDIS_URL est requis pour les stats temps réel : "
+                "daphne et les workers doivent partager les abonnements"
+            )
+        with SubscriptionService._lock:
+            if SubscriptionService._client is None or SubscriptionService._pid != pid:
+                import redis
+
+                SubscriptionService._client = redis.Redis.from_url(SubscriptionService.get_redis_url())
+                SubscriptionService._pid = pid
+        return SubscriptionService._client
+
+    @staticmethod
+    def get_ttl() -> int:
+        return getattr(settings, "COMPTA_LIVE_SUBSCRIPTION_TTL", 300)
+
+    @staticmethod
+    def get_definition(filters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Forme canonique (sérialisable) d'un filtre brut : filtre sauvegardé ou envoyé par le client
+        Lève ValueError si une date n'est pas lisible
+        """
+        is_all_date = filters.get("is_all_date", False)
+        if isinstance(is_all_date, str):
+            is_all_date = is_all_date.lower() == "true"
+        last = filters.get("last") or None
+        if last in ("always", "all"):
+            last, is_all_date = None, True
+
+        definition = {"last": last, "is_all_date": bool(is_all_date)}
+        for field in ("start_date", "end_date"):
+            value = None if last or is_all_date else filters.get(field)
+            if isinstance(value, str):
+                parsed = parse_datetime(value)
+                if parsed is None:
+                    raise ValueError(f"Date invalide : {field}")
+                value = parsed
+            if value is not None and timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            definition[field] = value.isoformat() if value else None
+        for field in DIMENSION_FIELDS:
+            definition[field] = sorted(FilterService.normalize_values(filters.get(field)))
+        return definition
+
+    @staticmethod
+    def get_key(definition: Dict[str, Any]) -> str:
+        encoded = json.dumps(definition, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    @staticmethod
+    def get_group_name(definition: Dict[str, Any]) -> str:
+        return f"compta_stats_{SubscriptionService.get_key(definition)[:32]}"
+
+    @staticmethod
+    def get_filters(definition: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Filtres traités (dates recalculées) à utiliser pour le calcul des stats
+        """
+        return FilterService.parse_filters_from_data(dict(definition))
+
+    @staticmethod
+    def register(definition: Dict[str, Any]) -> str:
+        """
+        Enregistre (ou prolonge) un abonnement websocket ; retourne le nom du groupe
+        Une seule transaction Redis, sans lecture préalable de l'index
+        """
+        key = SubscriptionService.get_key(definition)
+        pipeline = SubscriptionService.get_client().pipeline(transaction=True)
+        pipeline.hset(SUBSCRIPTIONS_KEY, key, json.dumps(definition))
+        pipeline.zadd(EXPIRY_KEY, {key: time.time() + SubscriptionService.get_ttl()})
+        pipeline.execute()
+        return SubscriptionService.get_group_name(definition)
+
+    @staticmethod
+    def prune(now: float):
+        """
+        Supprime les abonnements expirés ; abandonné si l'un d'eux est
+        renouvelé pendant le nettoyage (WATCH), repris au prochain appel
+        """
+        from redis.exceptions import WatchError
+
+        with SubscriptionService.get_client().pipeline() as pipeline:
+            try:
+                pipeline.watch(EXPIRY_KEY)
+                expired = pipeline.zrangebyscore(EXPIRY_KEY, "-inf", now)
+                if not expired:
+                    return
+                pipeline.multi()
+                pipeline.zrem(EXPIRY_KEY, *expired)
+                pipeline.hdel(SUBSCRIPTIONS_KEY, *expired)
+                pipeline.execute()
+            except WatchError:
+                pass
+
+    @staticmethod
+    def get_websocket_subscriptions() -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        SubscriptionService.prune(now)
+        client = SubscriptionService.get_client()
+        keys = client.zrangebyscore(EXPIRY_KEY, now, "+inf")
+        if not keys:
+            return {}
+        definitions = client.hmget(SUBSCRIPTIONS_KEY, keys)
+        return {
+            key.decode(): json.loads(definition)
+            for key, definition in zip(keys, definitions)
+            if definition is not None
+        }
+
+    @staticmethod
+    def get_targets() -> Dict[str, Dict[str, Any]]:
+        """
+        Destinataires des stats par filtre distinct :
+        {clé: {"definition", "group" (websocket ou None), "pusher_channels"}}
+        Les admins actifs connectés (private-channel_<id> occupé chez Pusher)
+        sont servis par Pusher selon leur filtre sauvegardé,
+        sauf si COMPTA_PUSHER_STATS_ENABLED est désactivé
+        """
+        targets: Dict[str, Dict[str, Any]] = {}
+
+        def get_target(definition: Dict[str, Any]) -> Dict[str, Any]:
+            key = SubscriptionService.get_key(definition)
+            return targets.setdefault(
+                key, {"definition": definition, "group": None, "pusher_channels": []}
+            )
+
+        for definition in SubscriptionService.get_websocket_subscriptions().values():
+            get_target(definition)["group"] = SubscriptionService.get_group_name(definition)
+
+        for user in SubscriptionService.get_pusher_admins():
+            user_filter = getattr(user, "usertransactionfilter", None)
+            try:
+                definition = SubscriptionService.get_definition(
+                    FilterService.to_filters(user_filter)
+                )
+            except ValueError:
+                continue
+            get_target(definition)["pusher_channels"].append(f"{PUSHER_CHANNEL_PREFIX}{user.id}")
+        return targets
+
+    @staticmethod
+    def get_pusher_admins():
+        """
+        Admins actifs dont le channel Pusher privé a un abonné
+        Aucun si Pusher ne répond pas : les stats ne partent que par websocket
+        """
+        if not getattr(settings, "COMPTA_PUSHER_STATS_ENABLED", True):
+            return []
+        from compta.services.pusher_publisher import PusherPublisher
+
+        occupied = PusherPublisher.get_occupied_channels(PUSHER_CHANNEL_PREFIX)
+        user_ids = [
+            int(channel[len(PUSHER_CHANNEL_PREFIX):])
+            for channel in occupied or ()
+            if channel[len(PUSHER_CHANNEL_PREFIX):].isdigit()
+        ]
+        if not user_ids:
+            return []
+        return User.objects.filter(id__in=user_ids, is_staff=True, is_active=True).select_related(
+            "usertransactionfilter"
+        )
+
+    @staticmethod
+    def get_user_definition(user) -> Dict[str, Any]:
+        return SubscriptionService.get_definition(FilterService.load_user_last_filter(user))
+
+    @staticmethod
+    def is_coalesced() -> bool:
+        return getattr(settings, "COMPTA_LIVE_STATS_DELIVERY", "coalesce") == "coalesce"
+
+    @staticmethod
+    def get_min_interval() -> float:
+        return getattr(settings, "COMPTA_LIVE_STATS_MIN_INTERVAL", 1.0)
+
+    @staticmethod
+    def next_version() -> int:
+        return SubscriptionService.get_client().incr(VERSION_KEY)
+
+    @staticmethod
+    def publish_frame(group: str, text: str) -> Dict[str, Any]:
+        """
+        Remplace la dernière trame "stat_data" du groupe (une seule conservée)
+        Une trame n'écrase jamais une version plus récente déposée entre-temps
+        Retourne le message léger à diffuser sur le channel layer à la place de la trame
+        """
+        from redis.exceptions import WatchError
+
+        version = SubscriptionService.next_version()
+        key = FRAME_KEY.format(group=group)
+        with SubscriptionService.get_client().pipeline() as pipeline:
+            while True:
+                try:
+                    pipeline.watch(key)
+                    current = pipeline.hget(key, "version")
+                    if current is not None and int(current) >= version:
+                        break
+                    pipeline.multi()
+                    pipeline.hset(key, mapping={"version": version, "text": text})
+                    pipeline.expire(key, SubscriptionService.get_ttl())
+                    pipeline.execute()
+                    break
+                except WatchError:
+                    continue
+        return {"type": "stats.latest", "version": version}
+
+    @staticmethod
+    def publish_delta(text: str) -> Dict[str, Any]:
+        """
+        Message "stat_delta" numéroté sur le compteur des snapshots (livraison "coalesce")
+        """
+        return {"type": "stats.message", "text": text, "version": SubscriptionService.next_version()}
+
+    @staticmethod
+    def get_frame(group: str) -> Optional[Dict[str, Any]]:
+        frame = SubscriptionService.get_client().hgetall(FRAME_KEY.format(group=group))
+        if not frame:
+            return None
+        return {"version": int(frame[b"version"]), "text": frame[b"text"].decode()}
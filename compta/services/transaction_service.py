@@ -1,4 +1,9 @@
-from django.db.models import QuerySet, Sum
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from django.db import connections
+from django.db.models import Count, Q, QuerySet, Sum
+from django.utils.dateparse import parse_datetime
 from compta.models import Transaction
 
 
@@ -16,11 +21,96 @@ class TransactionService:
     def get_transaction_aggregates(transactions: QuerySet) -> dict:
         """
         Calcule les agrégats des transactions (totaux, fees, etc.)
+        en une seule requête
         """
+        aggregates = transactions.order_by().aggregate(
+            total=Count("id"),
+            mobcash_fee=Sum("mobcash_fee"),
+            blaffa_fee=Sum("blaffa_fee"),
+            amount=Sum("amount"),
+        )
         return {
-            "total": transactions.count(),
-            "mobcash_fee": transactions.aggregate(total=Sum("mobcash_fee"))["total"]
-            or 0,
-            "blaffa_fee": transactions.aggregate(total=Sum("blaffa_fee"))["total"] or 0,
-            "amount": transactions.aggregate(total=Sum("amount"))["total"] or 0,
+            "total": aggregates["total"],
+            "mobcash_fee": aggregates["mobcash_fee"] or 0,
+            "blaffa_fee": aggregates["blaffa_fee"] or 0,
+            "amount": aggregates["amount"] or 0,
         }
+
+    @staticmethod
+    def get_aggregates_from_rows(rows: List[Dict]) -> dict:
+        """
+        Calcule les mêmes agrégats à partir des lignes regroupées
+        de StatsService.get_grouped_rows (aucune requête supplémentaire)
+        """
+        aggregates = {"total": 0, "mobcash_fee": 0, "blaffa_fee": 0, "amount": 0}
+        for row in rows:
+            aggregates["total"] += row["total"]
+            if row["fee"] is not None:
+                aggregates["mobcash_fee"] += row["fee"]
+            if row["blaffa_fee"] is not None:
+                aggregates["blaffa_fee"] += row["blaffa_fee"]
+            if row["total_amount"] is not None:
+                aggregates["amount"] += row["total_amount"]
+        return aggregates
+
+    @staticmethod
+    def encode_cursor(transaction: Transaction) -> str:
+        """
+        Curseur opaque : position (created_at, id) de la dernière transaction d'une page
+        """
+        position = {"created_at": transaction.created_at.isoformat(), "id": transaction.id}
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[Any, int]:
+        """
+        Lève ValueError si le curseur n'a pas été produit par encode_cursor
+        """
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            created_at = parse_datetime(position["created_at"])
+            transaction_id = int(position["id"])
+        except (TypeError, KeyError, ValueError) as e:
+            raise ValueError("Curseur invalide") from e
+        if created_at is None:
+            raise ValueError("Curseur invalide")
+        return created_at, transaction_id
+
+    @staticmethod
+    def get_page(
+        transactions: QuerySet, cursor: Optional[str], page_size: int
+    ) -> Tuple[List[Transaction], Optional[str]]:
+        """
+        Page de transactions par ordre décroissant (created_at, id) après le curseur
+        Pagination par clé (pas d'OFFSET) : une page profonde coûte autant que la première
+        Retourne (transactions, curseur de la page suivante ou None)
+        """
+        transactions = transactions.order_by("-created_at", "-id")
+        if cursor:
+            created_at, transaction_id = TransactionService.decode_cursor(cursor)
+            # created_at__lte redondant : borne de parcours de l'index (created_at, id),
+            # le OR seul n'est évalué qu'en filtre
+            transactions = transactions.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=transaction_id),
+                created_at__lte=created_at,
+            )
+
+        page = list(transactions[: page_size + 1])
+        if len(page) <= page_size:
+            return page, None
+        page = page[:page_size]
+        return page, TransactionService.encode_cursor(page[-1])
+
+    @staticmethod
+    def estimate_count(transactions: QuerySet) -> Optional[int]:
+        """
+        Nombre de lignes estimé par le planificateur PostgreSQL (sans COUNT(*))
+        None si la base ne fournit pas d'estimation
+        """
+        if connections[transactions.db].vendor != "postgresql":
+            return None
+        plan = json.loads(transactions.order_by().explain(format="json"))
+        # Liste d'un plan ([{"Plan": ...}]) ou plan seul selon la version de Django / psycopg
+        if isinstance(plan, list):
+            plan = plan[0]
+        return int(plan["Plan"]["Plan Rows"])
@@ -0,0 +1,65 @@
+from datetime import timedelta
+from django.db import transaction as db_transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from compta.config_registry import ConfigRegistry
+from compta.models import APITransaction, MobCashApp, Transaction
+from compta.services.rollup_service import RollupService, floor_hour
+from compta.services.snapshot_service import SnapshotService
+
+
+def rebuild_rollup_hours(*hours):
+    """
+    Recalcule les heures touchées après le commit (lecture des données validées)
+    """
+    for hour in {hour for hour in hours if hour is not None}:
+        db_transaction.on_commit(
+            lambda hour=hour: RollupService.rebuild_range(hour, hour + timedelta(hours=1))
+        )
+
+
+@receiver(post_save, sender=Transaction)
+def invalidate_transaction_snapshots(sender, instance, created, **kwargs):
+    if created:
+        SnapshotService.invalidate_transaction(instance)
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_transaction_hour(sender, instance, **kwargs):
+    # Heure d'origine : une modification de created_at déplace la transaction d'agrégat
+    instance._rollup_hour = None
+    if instance.pk and not instance._state.adding:
+        created_at = (
+            Transaction.objects.filter(pk=instance.pk).values_list("created_at", flat=True).first()
+        )
+        instance._rollup_hour = floor_hour(created_at) if created_at else None
+
+
+@receiver(post_save, sender=Transaction)
+def update_transaction_rollup(sender, instance, created, **kwargs):
+    """
+    Une création (CreateTransaction, admin, shell...) incrémente son agrégat horaire
+    dans la transaction de l'INSERT ; une modification recalcule l'heure d'origine
+    et la nouvelle. L'import en masse (sans post_save) agrège ses lots lui-même.
+    """
+    if created:
+        RollupService.add_transaction(instance)
+        return
+    rebuild_rollup_hours(getattr(instance, "_rollup_hour", None), floor_hour(instance.created_at))
+    SnapshotService.invalidate_all()
+
+
+@receiver(post_delete, sender=Transaction)
+def remove_transaction_rollup(sender, instance, **kwargs):
+    rebuild_rollup_hours(floor_hour(instance.created_at))
+    SnapshotService.invalidate_all()
+
+
+@receiver(post_save, sender=APITransaction)
+@receiver(post_save, sender=MobCashApp)
+@receiver(post_delete, sender=APITransaction)
+@receiver(post_delete, sender=MobCashApp)
+def invalidate_all_snapshots(sender, instance, **kwargs):
+    ConfigRegistry.invalidate(sender)
+    # Balance, seuils et fees apparaissent dans chaque snapshot
+    SnapshotService.invalidate_all()
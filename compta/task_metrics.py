@@ -0,0 +1,87 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict
+from celery import signals
+from compta.metrics import Metrics
+
+# Préfixe des tâches instrumentées
+TASK_PREFIX = "compta.tasks."
+
+# En-tête ajouté à l'envoi : horodatage (epoch) de la publication
+SENT_AT_HEADER = "compta_sent_at"
+
+# Début d'exécution par task_id (processus worker courant)
+_started: Dict[str, float] = {}
+
+
+def is_instrumented(name) -> bool:
+    return bool(name) and str(name).startswith(TASK_PREFIX)
+
+
+def get_ready_at(request):
+    """
+    Moment où la tâche pouvait commencer : l'envoi, ou l'ETA / countdown si plus tard
+    None si le message n'a pas été envoyé par un processus instrumenté
+    """
+    sent_at = getattr(request, SENT_AT_HEADER, None)
+    if sent_at is None:
+        sent_at = (getattr(request, "headers", None) or {}).get(SENT_AT_HEADER)
+    if sent_at is None:
+        return None
+
+    eta = getattr(request, "eta", None)
+    if isinstance(eta, str):
+        eta = datetime.fromisoformat(eta)
+    if isinstance(eta, datetime):
+        if eta.tzinfo is None:
+            eta = eta.replace(tzinfo=dt_timezone.utc)
+        return max(float(sent_at), eta.timestamp())
+    return float(sent_at)
+
+
+@signals.before_task_publish.connect
+def on_task_publish(sender=None, headers=None, **kwargs):
+    if headers is not None and is_instrumented(sender):
+        headers[SENT_AT_HEADER] = time.time()
+
+
+@signals.task_prerun.connect
+def on_task_prerun(sender=None, task_id=None, task=None, **kwargs):
+    if not is_instrumented(getattr(task, "name", None)):
+        return
+    _started[task_id] = time.perf_counter()
+
+    ready_at = get_ready_at(task.request)
+    if ready_at is not None:
+        Metrics.observe(
+            "compta_task_queue_wait_seconds",
+            {"task": task.name},
+            max(0.0, time.time() - ready_at),
+        )
+
+
+@signals.task_postrun.connect
+def on_task_postrun(sender=None, task_id=None, task=None, state=None, **kwargs):
+    start = _started.pop(task_id, None)
+    if start is None or not is_instrumented(getattr(task, "name", None)):
+        return
+    Metrics.observe(
+        "compta_task_duration_seconds",
+        {"task": task.name, "state": state or "UNKNOWN"},
+        time.perf_counter() - start,
+    )
+
+
+@signals.task_failure.connect
+def on_task_failure(sender=None, exception=None, **kwargs):
+    if is_instrumented(getattr(sender, "name", None)):
+        Metrics.observe(
+            "compta_task_failures_total",
+            {"task": sender.name, "exception": type(exception).__name__},
+        )
+
+
+@signals.task_retry.connect
+def on_task_retry(sender=None, **kwargs):
+    if is_instrumented(getattr(sender, "name", None)):
+        Metrics.observe("compta_task_retries_total", {"task": sender.name})
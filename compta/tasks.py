@@ -1,14 +1,18 @@
 import os
 from datetime import timedelta
 from django.utils import timezone
+from compta.config_registry import ConfigRegistry
 from compta.models import Transaction, APITransaction, MobCashApp
 import requests
 from django.db.models import Sum
 from django.utils.formats import number_format
-from compta.view_2 import send_stats_to_user, send_telegram_message
+from compta.view_2 import send_telegram_message
 from celery import shared_task
 
-from compta.views import get_api_balance, get_mobcash_balance, update_mobcash_balance
+from compta.services.balance_retention_service import BalanceRetentionService
+from compta.services.pusher_publisher import PusherPublisher
+from compta.services.refresh_scheduler import BalanceRefreshScheduler
+from compta.views import get_all_balances, get_api_balance, send_stats_to_user, update_mobcash_balance, update_mobcash_balances
 
 
 @shared_task
@@ -38,7 +42,7 @@ def send_compta_summary():
     commission_totale = commission_depot + commission_retrait
 
     # Soldes API individuels
-    api_qs = APITransaction.objects.all()
+    api_qs = ConfigRegistry.all(APITransaction)
     solde_api_details = "\n".join(
         [
             f"   • **{api.name} :** `{number_format(api.balance, decimal_pos=0, use_l10n=True)} FCFA`"
@@ -48,7 +52,7 @@ def send_compta_summary():
     solde_api_total = sum(api.balance for api in api_qs)
 
     # Soldes MobCashApp individuels
-    mobcash_qs = MobCashApp.objects.all()
+    mobcash_qs = ConfigRegistry.all(MobCashApp)
     solde_mobcash_details = "\n".join(
         [
             f"   • **{app.name} :** `{number_format(app.balance, decimal_pos=0, use_l10n=True)} FCFA`"
@@ -122,13 +126,48 @@ def send_compta_summary():
 
 @shared_task
 def update_balance_api():
-    get_api_balance()
-    get_mobcash_balance()
+    get_all_balances()
     send_stats_to_user()
 
 
 @shared_task
 def update_all_balance_process(transaction_id):
+    transaction = Transaction.objects.get(id=transaction_id)
     get_api_balance()
-    update_mobcash_balance(transaction=Transaction.objects.get(id=transaction_id))
-    send_stats_to_user()
+    update_mobcash_balance(transaction=transaction)
+    send_stats_to_user(transactions=[transaction])
+
+
+@shared_task
+def flush_balance_refresh(transaction_ids=None):
+    """
+    Un seul rafraîchissement des balances et un seul push des stats
+    pour toutes les transactions regroupées par BalanceRefreshScheduler
+    (ids lus dans la liste partagée ; ceux en argument viennent d'anciennes tâches)
+    """
+    if isinstance(transaction_ids, int):
+        # Tâche programmée avant la liste partagée : id de départ seul
+        transaction_ids = [transaction_ids]
+    transactions = BalanceRefreshScheduler.collect(transaction_ids)
+    get_api_balance()
+    update_mobcash_balances(transactions)
+    send_stats_to_user(transactions=transactions)
+
+
+@shared_task
+def compact_balance_history(max_chunks=None):
+    """
+    Applique la politique de rétention de l'historique des balances
+    Limité à max_chunks lots par exécution ; la suivante reprend où celle-ci s'est arrêtée
+    """
+    return BalanceRetentionService.run(max_chunks=max_chunks)
+
+
+@shared_task
+def flush_pusher_events():
+    """
+    Envoie les événements Pusher en attente par trigger_batch
+    Routée sur COMPTA_PUSHER_QUEUE (par défaut la file des workers existants,
+    CELERY_TASK_DEFAULT_QUEUE ; un worker dédié seulement si une file est configurée)
+    """
+    return PusherPublisher.flush()
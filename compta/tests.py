@@ -1,3 +1,783 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q, QuerySet, Sum
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from compta.config_registry import ConfigRegistry
+from compta.metrics import Metrics
+from compta import task_metrics
+from compta.models import (
+    API_CHOICES,
+    NETWORK_CHOICES,
+    SOURCE_CHOICES,
+    TYPE_CHOICES,
+    APIBalanceUpdate,
+    APITransaction,
+    BalanceRollup,
+    MobCashApp,
+    MobCashAppBalanceUpdate,
+    Transaction,
+    TransactionRollup,
+)
+from compta.serializers import MobCashAppSerializer, TransactionSerializer
+from compta.services.balance_retention_service import BalanceRetentionService
+from compta.services.balance_service import BalanceService
+from compta.services.dashboard_service import DashboardService
+from compta.services.filter_service import FilterService
+from compta.services.ingestion_service import IngestionService
+from compta.services.live_stats_service import LiveStatsService
+from compta.services.pusher_publisher import QUEUE_KEY, PusherPublisher
+from compta.services.refresh_scheduler import BalanceRefreshScheduler
+from compta.services.rollup_service import RollupService, floor_hour
+from compta.services.series_service import SeriesService
+from compta.services.snapshot_service import SnapshotService
+from compta.services.stats_services import StatsService
+from compta.services.subscription_service import SubscriptionService
+from compta.services.transaction_service import TransactionService
+
+
+class ExplicitDateFilterTests(TestCase):
+    """Dates explicites du query string (?start_date=2025-01-01)"""
+
+    def test_parsed_dates_are_aware(self):
+        filters = FilterService.prepare_filters(
+            {"start_date": "2025-01-01", "end_date": "2025-01-31T12:00:00"}
+        )
+        self.assertTrue(timezone.is_aware(filters["start_date"]))
+        self.assertTrue(timezone.is_aware(filters["end_date"]))
+
+    @override_settings(COMPTA_ROLLUP_ENABLED=True)
+    def test_grouped_rows_with_explicit_dates(self):
+        filters = FilterService.prepare_filters({"start_date": "2025-01-01"})
+        self.assertEqual(RollupService.get_grouped_rows(filters), [])
+
+    def test_series_with_explicit_dates(self):
+        filters = FilterService.prepare_filters(
+            {"start_date": "2025-01-01", "end_date": "2025-01-03T23:59:59"}
+        )
+        series = SeriesService.get_series(filters, "day")
+        self.assertEqual(len(series[0]["points"]), 3)
+
+    def test_comparison_with_explicit_dates(self):
+        filters = FilterService.prepare_filters(
+            {"start_date": "2025-01-01", "end_date": "2025-01-02"}
+        )
+        comparison = DashboardService.build_comparison(filters)
+        self.assertIn("balances", comparison["current"])
+        # Balances : état actuel, sans équivalent sur la fenêtre précédente
+        self.assertNotIn("balances", comparison["deltas"])
+        self.assertNotIn("balance", json.dumps(comparison["deltas"]))
+
+    def test_windows_mixing_explicit_and_relative_dates(self):
+        windows = {
+            "explicit": FilterService.parse_filters_from_data({"start_date": "2025-01-01"}),
+            "relative": FilterService.parse_filters_from_data({"last": "7_days"}),
+        }
+        payload = DashboardService.build_windows(windows)
+        self.assertEqual(set(payload["windows"]), {"explicit", "relative"})
+
+
+class RollupSyncTests(TestCase):
+    """Modifications et suppressions hors CreateTransaction (admin...)"""
+
+    def create_transaction(self, amount):
+        return Transaction.objects.create(
+            amount=Decimal(amount),
+            user_mobcash_id="1",
+            source="web",
+            type="depot",
+            api="connect",
+            mobcash="mobcash",
+        )
+
+    def test_every_create_path_counts_once(self):
+        # Admin / shell
+        transaction = self.create_transaction("100")
+        # CreateTransaction (INSERT ... ON CONFLICT + post_save envoyé par le serializer)
+        serializer = TransactionSerializer(
+            data={"amount": "50", "user_mobcash_id": "1", "source": "web", "type": "depot", "api": "connect", "mobcash": "mobcash"}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        rollup = TransactionRollup.objects.get(bucket=floor_hour(transaction.created_at))
+        self.assertEqual((rollup.count, rollup.amount), (2, Decimal("150")))
+
+    def test_edit_and_delete_rebuild_hours(self):
+        transaction = self.create_transaction("100")
+        hour = floor_hour(transaction.created_at)
+
+        transaction.amount = Decimal("250")
+        with self.captureOnCommitCallbacks(execute=True):
+            transaction.save()
+        self.assertEqual(TransactionRollup.objects.get(bucket=hour).amount, Decimal("250"))
+
+        # Déplacement dans une autre heure : l'heure d'origine est vidée
+        transaction.created_at = transaction.created_at - timedelta(hours=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            transaction.save()
+        self.assertFalse(TransactionRollup.objects.filter(bucket=hour).exists())
+        moved = floor_hour(transaction.created_at)
+        self.assertEqual(TransactionRollup.objects.get(bucket=moved).count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transaction.delete()
+        self.assertFalse(TransactionRollup.objects.exists())
+
+
+class TransactionPageTests(TestCase):
+    """Pagination par curseur de /compta/transactions"""
+
+    def test_pages_cover_equal_timestamps(self):
+        created_at = timezone.now()
+        for amount in range(5):
+            Transaction.objects.create(
+                amount=amount, user_mobcash_id="1", source="web", type="depot", api="connect", mobcash="m"
+            )
+        # Même horodatage pour toutes : l'id départage
+        Transaction.objects.update(created_at=created_at)
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = TransactionService.get_page(Transaction.objects.all(), cursor, 2)
+            seen += [transaction.id for transaction in page]
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(Transaction.objects.order_by("-id").values_list("id", flat=True)))
+
+    def test_estimate_count_plan_shapes(self):
+        plan = {"Plan": {"Plan Rows": 42}}
+        for explained in (json.dumps([plan]), json.dumps(plan)):
+            with mock.patch("compta.services.transaction_service.connections") as connections, \
+                    mock.patch.object(QuerySet, "explain", return_value=explained):
+                connections.__getitem__.return_value.vendor = "postgresql"
+                self.assertEqual(TransactionService.estimate_count(Transaction.objects.all()), 42)
+
+
+class SaveBalancesTests(TestCase):
+    """Balances reçues de Blaffa comparées à la base, pas au registre"""
+
+    def test_stale_registry_does_not_hide_change(self):
+        app = MobCashApp.objects.create(name="betpay", balance=Decimal("100"))
+        ConfigRegistry.all(MobCashApp)
+        # Écriture d'un autre processus, registre local pas encore invalidé
+        MobCashApp.objects.filter(pk=app.pk).update(balance=Decimal("200"))
+
+        changed = BalanceService.save_mobcash_balances({"betpay": "100"})
+        self.assertEqual([obj.pk for obj in changed], [app.pk])
+        self.assertEqual(MobCashApp.objects.get(pk=app.pk).balance, Decimal("100"))
+        self.assertEqual(MobCashAppBalanceUpdate.objects.filter(mobcash_balance=app).count(), 1)
+        self.assertEqual(BalanceService.save_mobcash_balances({"betpay": "100"}), [])
+
+
+class BulkIngestionTests(TestCase):
+    """Import en masse par lots (/compta/transaction/bulk)"""
+
+    @override_settings(COMPTA_BULK_CHUNK_SIZE=2)
+    def test_failed_chunk_keeps_rollup_of_committed_chunks(self):
+        items = [
+            {
+                "reference": f"ref-{index}",
+                "amount": Decimal("100"),
+                "user_mobcash_id": "1",
+                "source": "web",
+                "type": "other",
+                "api": "connect",
+                "mobcash": "betpay",
+            }
+            for index in range(4)
+        ]
+        insert = Transaction.objects.insert_ignore_conflicts
+        calls = []
+
+        def fail_second_chunk(objs, batch_size):
+            calls.append(len(objs))
+            if len(calls) == 2:
+                raise RuntimeError("lot en échec")
+            return insert(objs, batch_size=batch_size)
+
+        with mock.patch.object(Transaction.objects, "insert_ignore_conflicts", side_effect=fail_second_chunk), \
+                mock.patch("compta.services.ingestion_service.BalanceRefreshScheduler.schedule") as schedule:
+            with self.assertRaises(RuntimeError):
+                IngestionService.create_transactions(items)
+
+        self.assertEqual(Transaction.objects.count(), 2)
+        rollup = TransactionRollup.objects.get()
+        self.assertEqual((rollup.count, rollup.amount), (2, Decimal("200")))
+        # Les lots validés sont quand même rafraîchis
+        self.assertEqual(len(schedule.call_args.args), 2)
+
+
+class SnapshotIndexTests(TestCase):
+    """Index des snapshots actifs : une entrée par snapshot enregistré"""
+
+    def setUp(self):
+        SnapshotService.get_cache().clear()
+
+    def test_transaction_invalidates_matching_snapshots_only(self):
+        web = FilterService.prepare_filters({"is_all_date": True, "source": ["web"]})
+        mobile = FilterService.prepare_filters({"is_all_date": True, "source": ["mobile"]})
+        SnapshotService.get_or_compute(web, lambda: {"source": "web"})
+        SnapshotService.get_or_compute(mobile, lambda: {"source": "mobile"})
+        self.assertEqual(len(SnapshotService.get_entries()), 2)
+
+        transaction = Transaction(source="web", type="depot", api="connect", mobcash="m", created_at=timezone.now())
+        self.assertEqual(SnapshotService.invalidate_transaction(transaction), 1)
+        self.assertEqual(SnapshotService.get_or_compute(web, lambda: {"source": "recalculé"}), {"source": "recalculé"})
+        self.assertEqual(SnapshotService.get_or_compute(mobile, lambda: {}), {"source": "mobile"})
+
+
+class LiveStatsTests(TestCase):
+    """Deltas temps réel appliqués au dernier état poussé"""
+
+    def setUp(self):
+        SnapshotService.get_cache().clear()
+
+    def create_transaction(self):
+        return Transaction.objects.create(
+            amount=Decimal("100"), user_mobcash_id="1", source="web", type="depot", api="connect", mobcash="m"
+        )
+
+    def test_transactions_covered_by_full_compute_are_not_applied_again(self):
+        filters = FilterService.prepare_filters({"is_all_date": True})
+        covered = self.create_transaction()
+        payload, delta = LiveStatsService.get_payload(filters, [covered])
+        self.assertIsNone(delta)
+        self.assertEqual(payload["total"], 1)
+
+        # Même horodatage que le calcul complet : seul l'id décide
+        fresh = self.create_transaction()
+        payload, delta = LiveStatsService.get_payload(filters, [covered, fresh])
+        self.assertEqual([item["id"] for item in delta["transactions"]], [fresh.id])
+        self.assertEqual(payload["total"], 2)
+
+    def test_lower_id_committed_after_full_compute_is_applied(self):
+        filters = FilterService.prepare_filters({"is_all_date": True})
+        first, late, last = [self.create_transaction() for _ in range(3)]
+        # `late` : id attribué avant `last` mais validé après le calcul complet
+        late_id = late.id
+        late.delete()
+        payload, delta = LiveStatsService.get_payload(filters, [last])
+        self.assertIsNone(delta)
+        self.assertEqual(payload["total"], 2)
+
+        late = Transaction.objects.create(
+            id=late_id, amount=Decimal("100"), user_mobcash_id="1", source="web", type="depot", api="connect", mobcash="m"
+        )
+        payload, delta = LiveStatsService.get_payload(filters, [late])
+        self.assertEqual([item["id"] for item in delta["transactions"]], [late_id])
+        self.assertEqual(payload["total"], 3)
+
+        # Rejouée : déjà appliquée
+        payload, delta = LiveStatsService.get_payload(filters, [late])
+        self.assertEqual(delta["transactions"], [])
+        self.assertEqual(payload["total"], 3)
+
+    def test_unknown_old_id_forces_full_compute(self):
+        filters = FilterService.prepare_filters({"is_all_date": True})
+        old, recent = self.create_transaction(), self.create_transaction()
+        with mock.patch("compta.services.live_stats_service.ID_SCAN", 0):
+            LiveStatsService.get_payload(filters, [recent])
+            payload, delta = LiveStatsService.get_payload(filters, [old])
+        self.assertIsNone(delta)
+        self.assertEqual(payload["total"], 2)
+
+    def test_without_transactions_uses_snapshot_cache(self):
+        filters = FilterService.prepare_filters({"is_all_date": True})
+        with mock.patch.object(SnapshotService, "get_or_compute", return_value={"total": 0}) as get_or_compute:
+            self.assertEqual(LiveStatsService.get_payload(filters), ({"total": 0}, None))
+        get_or_compute.assert_called_once()
+
+
+class MobCashAppSerializerTests(TestCase):
+    """Noms MobCash stockés en minuscules"""
+
+    def test_name_unique_whatever_the_case(self):
+        MobCashApp.objects.create(name="BetPay")
+        serializer = MobCashAppSerializer(data={"name": "betpay"})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("name", serializer.errors)
+
+        serializer = MobCashAppSerializer(data={"name": " Melbet "})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.save().name, "melbet")
+
+
+class ConfigRegistryTests(TestCase):
+    """Registre en mémoire des configs"""
+
+    def setUp(self):
+        ConfigRegistry.clear()
+
+    def test_duplicate_names_keep_oldest_row(self):
+        name = APITransaction._meta.get_field("name").choices[0][0]
+        first = APITransaction.objects.create(name=name)
+        APITransaction.objects.create(name=name)
+        self.assertEqual(ConfigRegistry.get(APITransaction, name).pk, first.pk)
+
+
+class InsertIgnoreConflictsTests(TestCase):
+    """INSERT ... ON CONFLICT (reference, api) DO NOTHING du manager Transaction"""
+
+    def build(self, reference, amount="100", api="connect"):
+        return Transaction(
+            reference=reference,
+            amount=Decimal(amount),
+            user_mobcash_id="1",
+            source="web",
+            type="depot",
+            api=api,
+            mobcash="betpay",
+        )
+
+    def assert_matches_database(self, inserted):
+        for transaction in inserted:
+            row = Transaction.objects.get(pk=transaction.pk)
+            self.assertEqual((row.reference, row.api, row.amount), (transaction.reference, transaction.api, transaction.amount))
+
+    def test_replay_inserts_nothing(self):
+        first = Transaction.objects.insert_ignore_conflicts([self.build("a"), self.build("b")])
+        self.assertEqual(len(first), 2)
+
+        replay = Transaction.objects.insert_ignore_conflicts([self.build("a"), self.build("b")])
+        self.assertEqual(replay, [])
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_mixed_batch_keeps_ids_on_the_right_objects(self):
+        Transaction.objects.insert_ignore_conflicts([self.build("b", "1"), self.build("d", "1")])
+        batch = [
+            self.build("a", "10"),
+            self.build("b", "20"),
+            self.build(None, "30"),
+            self.build("c", "40"),
+            self.build("d", "50"),
+            self.build("b", "60", api="other"),
+        ]
+        inserted = Transaction.objects.insert_ignore_conflicts(batch)
+
+        self.assertEqual(
+            [(transaction.reference, transaction.api) for transaction in inserted],
+            [("a", "connect"), (None, "connect"), ("c", "connect"), ("b", "other")],
+        )
+        self.assert_matches_database(inserted)
+        self.assertTrue(all(transaction.pk is None for transaction in (batch[1], batch[4])))
+
+    def test_concurrent_duplicate_is_skipped(self):
+        # Même référence livrée deux fois et déjà écrite par un autre process
+        other = self.build("c", "5")
+        other.save()
+        batch = [self.build("a", "10"), self.build("a", "20"), self.build("c", "30")]
+        inserted = Transaction.objects.insert_ignore_conflicts(batch)
+
+        self.assertEqual(inserted, [batch[0]])
+        self.assert_matches_database(inserted)
+        self.assertIsNone(batch[1].pk)
+        self.assertEqual(Transaction.objects.get(reference="c").amount, Decimal("5"))
+
+
+class BalanceRefreshSchedulerTests(TestCase):
+    """Rafraîchissements de balance regroupés par fenêtre"""
+
+    def test_schedules_in_one_window_produce_one_flush(self):
+        client = mock.Mock()
+        # SET NX : seul le premier déclencheur de la fenêtre pose le marqueur
+        client.pipeline.return_value.execute.side_effect = [[1, True, 1], [2, None, 2], [3, None, 3]]
+        with mock.patch.object(BalanceRefreshScheduler, "get_client", return_value=client), \
+                mock.patch("compta.tasks.flush_balance_refresh.apply_async") as apply_async:
+            scheduled = [BalanceRefreshScheduler.schedule(transaction_id) for transaction_id in (1, 2, 3)]
+
+        self.assertEqual(scheduled, [True, False, False])
+        apply_async.assert_called_once_with(countdown=BalanceRefreshScheduler.get_window())
+
+    def test_flush_collects_the_whole_window(self):
+        transactions = [
+            Transaction.objects.create(
+                amount=Decimal("100"), user_mobcash_id="1", source="web", type="depot", api="connect", mobcash="m"
+            )
+            for _ in range(3)
+        ]
+        client = mock.Mock()
+        # Ids déposés dans le désordre (validation hors ordre des ids)
+        queued = [str(transaction.id).encode() for transaction in reversed(transactions)]
+        client.pipeline.return_value.execute.side_effect = [[1, queued, 1], [1, 2]]
+        with mock.patch.object(BalanceRefreshScheduler, "get_client", return_value=client):
+            collected = BalanceRefreshScheduler.collect()
+        self.assertEqual(collected, transactions)
+
+    @override_settings(COMPTA_REFRESH_REDIS_URL=None)
+    def test_requires_redis(self):
+        with mock.patch.object(BalanceRefreshScheduler, "_client", None):
+            with self.assertRaises(ImproperlyConfigured):
+                BalanceRefreshScheduler.schedule(1)
+
+
+class PusherPublisherTests(TestCase):
+    """Publication Pusher groupée"""
+
+    def event(self, channels, name, data="{}"):
+        return {"channels": channels, "name": name, "data": data}
+
+    def test_coalesce_drops_superseded_events_per_channel(self):
+        events = [
+            self.event(["a", "b"], "stat_data", "old"),
+            self.event(["a"], "stat_delta", "delta"),
+            self.event(["b"], "notification", "keep"),
+            self.event(["a"], "stat_data", "new"),
+        ]
+        self.assertEqual(
+            PusherPublisher.coalesce(events),
+            [
+                # Plus de snapshot récent sur "b" : l'ancien y reste
+                self.event(["b"], "stat_data", "old"),
+                self.event(["b"], "notification", "keep"),
+                self.event(["a"], "stat_data", "new"),
+            ],
+        )
+
+    def test_failed_send_requeues_unsent_events_in_order(self):
+        events = [self.event([f"channel-{index}"], "notification", str(index)) for index in range(15)]
+        redis_client, pusher_client = mock.Mock(), mock.Mock()
+        redis_client.pipeline.return_value.execute.return_value = ([json.dumps(event) for event in events], 1)
+        # Premier batch (10 événements) envoyé, le second échoue
+        pusher_client.trigger_batch.side_effect = [None, ConnectionError("pusher indisponible")]
+
+        with mock.patch.object(PusherPublisher, "get_clients", return_value=(pusher_client, redis_client)), \
+                mock.patch("compta.tasks.flush_pusher_events.apply_async") as apply_async:
+            with self.assertRaises(ConnectionError):
+                PusherPublisher.flush()
+
+        requeued = redis_client.lpush.call_args.args
+        self.assertEqual(requeued[0], QUEUE_KEY)
+        # LPUSH en ordre inverse : la liste retrouve l'ordre d'origine en tête
+        self.assertEqual([json.loads(event) for event in reversed(requeued[1:])], events[10:])
+        apply_async.assert_called_once()
+
+
+class SubscriptionTargetsTests(TestCase):
+    """Destinataires Pusher des stats temps réel"""
+
+    def setUp(self):
+        self.online = User.objects.create(username="online", is_staff=True)
+        self.offline = User.objects.create(username="offline", is_staff=True)
+        patcher = mock.patch.object(SubscriptionService, "get_websocket_subscriptions", return_value={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_channels(self):
+        return [channel for target in SubscriptionService.get_targets().values() for channel in target["pusher_channels"]]
+
+    def test_only_occupied_admin_channels_are_targets(self):
+        occupied = {f"private-channel_{self.online.id}", "private-channel_unknown"}
+        with mock.patch.object(PusherPublisher, "get_occupied_channels", return_value=occupied):
+            self.assertEqual(self.get_channels(), [f"private-channel_{self.online.id}"])
+
+    def test_no_pusher_targets_when_unavailable_or_disabled(self):
+        with mock.patch.object(PusherPublisher, "get_occupied_channels", return_value=None):
+            self.assertEqual(self.get_channels(), [])
+        with override_settings(COMPTA_PUSHER_STATS_ENABLED=False), \
+                mock.patch.object(PusherPublisher, "get_occupied_channels") as get_occupied_channels:
+            self.assertEqual(self.get_channels(), [])
+        get_occupied_channels.assert_not_called()
+
+
+def baseline_sum(transactions, field):
+    return transactions.aggregate(total=Sum(field))["total"] or 0
+
+
+def baseline_stats(transactions):
+    """
+    Calcul d'origine (une requête par valeur de chaque dimension), référence de parité
+    """
+    def totals(txs):
+        return {"total": txs.count(), "total_amount": baseline_sum(txs, "amount"), "fee": baseline_sum(txs, "mobcash_fee")}
+
+    mobcash_stats = {}
+    for mobcash in MobCashApp.objects.all():
+        txs = transactions.filter(mobcash=mobcash.name)
+        deposit, withdrawal = txs.filter(type="depot"), txs.filter(type="retrait")
+        mobcash_stats[mobcash.name] = {
+            **totals(txs),
+            "image": mobcash.image,
+            "balance": mobcash.balance,
+            "id": mobcash.id,
+            "name": mobcash.name.upper(),
+            "total_commission_amount": baseline_sum(txs, "mobcash_fee"),
+            "total_operations_amount": baseline_sum(txs, "amount"),
+            "withdrawal_commission": baseline_sum(withdrawal, "mobcash_fee"),
+            "deposit_commission": baseline_sum(deposit, "mobcash_fee"),
+            "total_withdrawal_amount": baseline_sum(withdrawal, "amount"),
+            "total_deposit_amount": baseline_sum(deposit, "amount"),
+            "total_withdrawals": withdrawal.count(),
+            "total_deposit": deposit.count(),
+            "mobcash_setting": MobCashAppSerializer(mobcash).data,
+        }
+
+    api_stats = {}
+    count = transactions.count()
+    for api_transaction in APITransaction.objects.all():
+        api = api_transaction.name.lower()
+        txs = transactions.filter(api=api)
+        networks = {network: txs.filter(network=network).count() for network in ("mtn", "moov", "orange", "wave")}
+        api_stats[api] = {
+            "label": api,
+            **totals(txs),
+            "balance": api_transaction.balance,
+            "percent": round(txs.count() / count * 100 if count else 0, 2),
+            "total_withdrawal_amount": baseline_sum(txs.filter(type="retrait"), "amount"),
+            "total_deposit_amount": baseline_sum(txs.filter(type="depot"), "amount"),
+            "total_withdrawals": txs.filter(type="retrait").count(),
+            "total_deposit": txs.filter(type="depot").count(),
+            "network_stat": dict(sorted(networks.items(), key=lambda item: item[1], reverse=True)),
+            "id": api_transaction.id,
+        }
+
+    def generic(field, choices):
+        return {value: {"label": label, **totals(transactions.filter(**{field: value}))} for value, label in choices}
+
+    return {
+        "mobcash_stats": dict(sorted(mobcash_stats.items(), key=lambda item: item[1]["balance"], reverse=True)),
+        "api_stats": dict(sorted(api_stats.items(), key=lambda item: item[1]["percent"], reverse=True)),
+        "network_stats": generic("network", NETWORK_CHOICES),
+        "source_stats": generic("source", SOURCE_CHOICES),
+        "type_stats": generic("type", TYPE_CHOICES),
+    }
+
+
+def baseline_aggregates(transactions):
+    return {
+        "total": transactions.count(),
+        "mobcash_fee": baseline_sum(transactions, "mobcash_fee"),
+        "blaffa_fee": baseline_sum(transactions, "blaffa_fee"),
+        "amount": baseline_sum(transactions, "amount"),
+    }
+
+
+class StatsParityTests(TestCase):
+    """Stats en un seul GROUP BY : même contenu que le calcul par dimension"""
+
+    def setUp(self):
+        ConfigRegistry.clear()
+        for index, name in enumerate(("betpay", "melbet", "unused")):
+            MobCashApp.objects.create(name=name, balance=Decimal(100 * (3 - index)))
+        for name, _ in API_CHOICES[:3]:
+            APITransaction.objects.create(name=name, balance=Decimal("50"))
+
+        now = timezone.now()
+        apis = [name for name, _ in API_CHOICES[:2]]
+        networks = [value for value, _ in NETWORK_CHOICES] + [None]
+        self.transactions = []
+        for index in range(40):
+            self.transactions.append(
+                Transaction(
+                    amount=Decimal(10 + index),
+                    # Fees absents sur une partie des transactions (sommes NULL)
+                    mobcash_fee=Decimal(index) / 10 if index % 3 else None,
+                    blaffa_fee=Decimal(1) if index % 4 else None,
+                    user_mobcash_id="1",
+                    mobcash=("betpay", "melbet")[index % 2],
+                    api=apis[index % len(apis)],
+                    network=networks[index % len(networks)],
+                    source=SOURCE_CHOICES[index % len(SOURCE_CHOICES)][0],
+                    type=TYPE_CHOICES[index % len(TYPE_CHOICES)][0],
+                )
+            )
+        Transaction.objects.bulk_create(self.transactions)
+        for index, transaction in enumerate(Transaction.objects.order_by("id")):
+            Transaction.objects.filter(pk=transaction.pk).update(created_at=now - timedelta(days=index % 10))
+
+    def assert_same_stats(self, stats, expected):
+        for key, value in expected.items():
+            # Même contenu et même ordre (tris par balance / pourcentage)
+            self.assertEqual(list(stats[key]), list(value), key)
+            # Decimal comparés en valeur (18 == 18.000)
+            self.assertEqual(stats[key], value, key)
+
+    def test_all_breakdowns_match_baseline(self):
+        transactions = Transaction.objects.all()
+        self.assert_same_stats(StatsService.get_all_stats(transactions), baseline_stats(transactions))
+
+    def test_window_totals_match_baseline(self):
+        filters = FilterService.prepare_filters({"last": "7_days", "mobcash": ["betpay"]})
+        transactions = FilterService.apply_filters(Transaction.objects.all(), filters)
+        rows = StatsService.get_grouped_rows(transactions)
+        self.assertEqual(TransactionService.get_aggregates_from_rows(rows), baseline_aggregates(transactions))
+        self.assert_same_stats(StatsService.build_all_stats(rows), baseline_stats(transactions))
+
+        split_at = timezone.now() - timedelta(days=3)
+        windows = StatsService.get_window_grouped_rows(
+            Transaction.objects.all(), {"current": Q(created_at__gte=split_at), "previous": Q(created_at__lt=split_at)}
+        )
+        for name, condition in (("current", Q(created_at__gte=split_at)), ("previous", Q(created_at__lt=split_at))):
+            window = Transaction.objects.filter(condition)
+            self.assertEqual(TransactionService.get_aggregates_from_rows(windows[name]), baseline_aggregates(window))
+            self.assert_same_stats(StatsService.build_all_stats(windows[name]), baseline_stats(window))
+
+
+@override_settings(COMPTA_BALANCE_RETENTION={"raw_days": 7, "hourly_days": 90, "chunk_hours": 1})
+class BalanceRetentionTests(TestCase):
+    """Compaction de l'historique des balances (lots d'une heure)"""
+
+    def setUp(self):
+        self.api = APITransaction.objects.create(name=API_CHOICES[0][0])
+        self.now = timezone.now().replace(minute=30, second=0, microsecond=0)
+        # Trois heures d'un même jour, vieux de 100 jours : compactés par heure puis par jour
+        self.day = (self.now - timedelta(days=100)).replace(hour=10, minute=0)
+        self.balances = []
+        for hour, minutes, balance in ((0, 5, 50), (0, 40, 80), (1, 10, 20), (2, 15, 90), (2, 50, 60)):
+            self.add_point(self.day + timedelta(hours=hour, minutes=minutes), balance)
+
+    def add_point(self, created_at, balance):
+        point = APIBalanceUpdate.objects.create(api_transaction=self.api, balance=Decimal(balance))
+        APIBalanceUpdate.objects.filter(pk=point.pk).update(created_at=created_at)
+
+    def get_rollups(self):
+        return list(
+            BalanceRollup.objects.order_by("resolution", "bucket").values_list(
+                "resolution", "bucket", "open", "min", "max", "close", "count"
+            )
+        )
+
+    def test_day_bucket_merges_hour_chunks(self):
+        BalanceRetentionService.run(now=self.now)
+        self.assertFalse(APIBalanceUpdate.objects.exists())
+        self.assertEqual(
+            self.get_rollups(),
+            [("day", self.day.replace(hour=0), Decimal(50), Decimal(20), Decimal(90), Decimal(60), 5)],
+        )
+
+    def test_late_point_merges_into_compacted_hour(self):
+        raw_cutoff = self.now - timedelta(days=7)
+        hour = floor_hour(raw_cutoff - timedelta(hours=3))
+        self.add_point(hour + timedelta(minutes=1), 40)
+        BalanceRetentionService.run(now=self.now)
+        # Point arrivé après la compaction de son heure
+        self.add_point(hour + timedelta(minutes=59), 10)
+        BalanceRetentionService.run(now=self.now)
+
+        self.assertEqual(
+            BalanceRollup.objects.filter(resolution="hour").values_list("open", "min", "max", "close", "count").get(),
+            (Decimal(40), Decimal(10), Decimal(40), Decimal(10), 2),
+        )
+
+    def test_interrupted_run_resumes_to_same_result(self):
+        BalanceRetentionService.run(now=self.now)
+        expected = self.get_rollups()
+        BalanceRollup.objects.all().delete()
+        for hour, minutes, balance in ((0, 5, 50), (0, 40, 80), (1, 10, 20), (2, 15, 90), (2, 50, 60)):
+            self.add_point(self.day + timedelta(hours=hour, minutes=minutes), balance)
+
+        # Arrêt après un lot, puis échec au milieu du suivant (lot annulé)
+        BalanceRetentionService.run(max_chunks=1, now=self.now)
+        with mock.patch.object(BalanceRetentionService, "merge", side_effect=RuntimeError("worker arrêté")):
+            with self.assertRaises(RuntimeError):
+                BalanceRetentionService.run(now=self.now)
+        self.assertEqual(APIBalanceUpdate.objects.count(), 3)
+
+        BalanceRetentionService.run(now=self.now)
+        self.assertEqual(self.get_rollups(), expected)
+
+
+@override_settings(COMPTA_METRICS_ENABLED=True, COMPTA_METRICS_REDIS_URL=None, COMPTA_METRICS_BUCKETS=(0.1, 1))
+class MetricsTests(TestCase):
+    """Exposition Prometheus (/compta/metrics) et mesure des requêtes HTTP"""
+
+    def setUp(self):
+        Metrics.reset()
+
+    def test_render_prometheus_text(self):
+        Metrics.observe("compta_pusher_events_total", {"outcome": 'a"b'}, 2)
+        Metrics.observe("compta_outbound_duration_seconds", {"service": "blaffa", "operation": "get", "outcome": "ok"}, 0.5)
+        labels = 'operation="get",outcome="ok",service="blaffa"'
+        self.assertEqual(
+            Metrics.render(),
+            "\n".join(
+                [
+                    "# HELP compta_outbound_duration_seconds Durée des appels sortants (Blaffa, Telegram, Pusher) par résultat",
+                    "# TYPE compta_outbound_duration_seconds histogram",
+                    # Buckets par borne croissante, puis somme et nombre
+                    f'compta_outbound_duration_seconds_bucket{{{labels},le="0.1"}} 0',
+                    f'compta_outbound_duration_seconds_bucket{{{labels},le="1.0"}} 1',
+                    f'compta_outbound_duration_seconds_bucket{{{labels},le="+Inf"}} 1',
+                    f"compta_outbound_duration_seconds_sum{{{labels}}} 0.5",
+                    f"compta_outbound_duration_seconds_count{{{labels}}} 1",
+                    "# HELP compta_pusher_events_total " + "Événements Pusher envoyés, remplacés par un snapshot plus récent, remis en file ou abandonnés",
+                    "# TYPE compta_pusher_events_total counter",
+                    'compta_pusher_events_total{outcome="a\\"b"} 2',
+                ]
+            )
+            + "\n",
+        )
+
+    def test_middleware_labels_routes_not_paths(self):
+        self.client.get("/compta/metrics")
+        self.client.get("/compta/unknown/123")
+        self.client.get("/compta/unknown/456")
+
+        samples = Metrics.collect()
+        requests = {sample: value for sample, value in samples.items() if sample.startswith("compta_http_requests_total")}
+        self.assertEqual(
+            requests,
+            {
+                'compta_http_requests_total{endpoint="metrics",method="GET",status="401"}': 1,
+                'compta_http_requests_total{endpoint="unmatched",method="GET",status="404"}': 2,
+            },
+        )
+        self.assertEqual(samples['compta_http_request_duration_seconds_count{endpoint="unmatched",method="GET"}'], 2)
+        self.assertIn('compta_http_db_queries_count{endpoint="metrics",method="GET"}', samples)
+
+
+@override_settings(COMPTA_METRICS_ENABLED=True, COMPTA_METRICS_REDIS_URL=None, COMPTA_METRICS_BUCKETS=(1, 10))
+class TaskMetricsTests(TestCase):
+    """Signaux Celery instrumentés (compta.task_metrics)"""
+
+    def setUp(self):
+        Metrics.reset()
+
+    def make_task(self, name, headers=None, eta=None):
+        task = mock.Mock(request=mock.Mock(spec=["headers", "eta"], headers=headers or {}, eta=eta))
+        task.name = name
+        return task
+
+    def test_lifecycle_of_an_instrumented_task(self):
+        headers = {}
+        task_metrics.on_task_publish(sender="compta.tasks.flush_pusher_events", headers=headers)
+        self.assertIn(task_metrics.SENT_AT_HEADER, headers)
+
+        # Envoyée il y a 5 s, ETA il y a 2 s : l'attente compte depuis l'ETA
+        now = timezone.now()
+        task = self.make_task(
+            "compta.tasks.flush_pusher_events",
+            headers={task_metrics.SENT_AT_HEADER: now.timestamp() - 5},
+            eta=(now - timedelta(seconds=2)).isoformat(),
+        )
+        task_metrics.on_task_prerun(task_id="1", task=task)
+        task_metrics.on_task_failure(sender=task, exception=ValueError())
+        task_metrics.on_task_postrun(task_id="1", task=task, state="FAILURE")
+        task_metrics.on_task_retry(sender=task)
+
+        samples = Metrics.collect()
+        labels = 'task="compta.tasks.flush_pusher_events"'
+        self.assertEqual(samples[f'compta_task_queue_wait_seconds_bucket{{{labels},le="1.0"}}'], 0)
+        self.assertEqual(samples[f'compta_task_queue_wait_seconds_bucket{{{labels},le="10.0"}}'], 1)
+        self.assertAlmostEqual(samples[f"compta_task_queue_wait_seconds_sum{{{labels}}}"], 2, delta=0.5)
+        self.assertEqual(samples[f'compta_task_duration_seconds_count{{state="FAILURE",{labels}}}'], 1)
+        self.assertEqual(samples[f'compta_task_failures_total{{exception="ValueError",{labels}}}'], 1)
+        self.assertEqual(samples[f"compta_task_retries_total{{{labels}}}"], 1)
+        self.assertNotIn("1", task_metrics._started)
+
+    def test_other_tasks_are_ignored(self):
+        headers = {}
+        task_metrics.on_task_publish(sender="celery.backend_cleanup", headers=headers)
+        task = self.make_task("celery.backend_cleanup")
+        task_metrics.on_task_prerun(task_id="2", task=task)
+        task_metrics.on_task_postrun(task_id="2", task=task, state="SUCCESS")
+        task_metrics.on_task_failure(sender=task, exception=ValueError())
+
+        self.assertEqual(headers, {})
+        self.assertEqual(Metrics.collect(), {})
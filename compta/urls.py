@@ -3,7 +3,12 @@ from . import views
 
 urlpatterns = [
     path("compta", views.ComptatView.as_view()),
+    path("compta/batch", views.BatchStatsView.as_view(), name="compta-batch"),
+    path("series", views.SeriesView.as_view(), name="series"),
     path("transaction", views.CreateTransaction.as_view()),
+    path("transaction/bulk", views.BulkCreateTransaction.as_view(), name="transaction-bulk"),
+    path("transactions", views.TransactionListView.as_view(), name="transaction-list"),
+    path("transactions/export", views.TransactionExportView.as_view(), name="transaction-export"),
     path("mobcash-apps", views.MobCashAppListView.as_view(), name="mobcash-list"),
     path(
         "mobcash-apps/<int:pk>",
@@ -22,12 +27,14 @@ urlpatterns = [
     ),
     path("api-balance", views.APIBalanceView.as_view()),
     path("mobcash-balance", views.MobCashBalance.as_view()),
+    path("balances/as-of", views.BalanceAsOfView.as_view(), name="balance-as-of"),
     path(
         "user-filter",
         views.UserTransactionFilterView.as_view(),
         name="user-transaction-filter",
     ),
     path("reset-filter", views.ResetUserTransactionFilterView.as_view()),
+    path("metrics", views.MetricsView.as_view(), name="metrics"),
     path("test", views.TestView.as_view()),
     path("auth-pusher", views.AuthenPusherUser.as_view()),
 ]
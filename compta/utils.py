@@ -22,6 +22,20 @@ def log_filter_usage(user, filters: Dict[str, Any]):
     )
 
 
+# Champs "dimension" des transactions, stockés en minuscules
+DIMENSION_FIELDS = ("source", "network", "api", "type", "mobcash")
+
+
+def normalize_dimension(value):
+    """
+    Forme canonique d'une valeur de dimension : minuscules, sans espaces autour
+    Permet des lookups `=` / `__in` au lieu de `__iexact`
+    """
+    if isinstance(value, str):
+        return value.strip().lower()
+    return value
+
+
 def format_balance(amount: float) -> str:
     """
     Formate un montant en devise locale
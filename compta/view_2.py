@@ -2,6 +2,7 @@ import os
 import requests
 from rest_framework import decorators, permissions
 from django.utils.dateparse import parse_datetime, parse_date
+from compta.metrics import Metrics
 from compta.models import MobCashApp, Transaction, UserTransactionFilter
 from django.utils import timezone
 from django.db.models import Sum
@@ -242,8 +243,10 @@ def send_telegram_message(content, chat_id=None):
         "text": content,
     }
     try:
-
-        response = requests.post(api_url, data=data)
+        with Metrics.span("telegram", "sendMessage") as span:
+            response = requests.post(api_url, data=data)
+            if not response.ok:
+                span["outcome"] = "error"
         return response.json()
     except:
         return None
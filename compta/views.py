@@ -1,30 +1,43 @@
 import json
+import logging
 import os
 import requests
 from rest_framework import decorators, permissions, status, generics
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
-from datetime import time, datetime
+from datetime import time, datetime, timedelta
 from django.contrib.auth.models import User
 
 
-from pusher import Pusher
-from compta.models import APIBalanceUpdate, APITransaction, MobCashApp, MobCashAppBalanceUpdate, Transaction, UserTransactionFilter
+from compta.config_registry import ConfigRegistry
+from compta.metrics import Metrics
+from compta.parsers import NDJSONParser
+from compta.models import APITransaction, MobCashApp, Transaction, UserTransactionFilter
 from compta.serializers import APITransactionSerializer, MobCashAppSerializer, PusherAuthSerializer, TransactionSerializer, UserTransactionFilterSerializer
-from compta.services.filter_service import FilterService
 from compta.services.balance_service import BalanceService
-from compta.services.stats_services import StatsService
+from compta.services.blaffa_client import BlaffaClient
+from compta.services.filter_service import FilterService
+from compta.services.dashboard_service import DashboardService
+from compta.services.export_service import ExportService
+from compta.services.ingestion_service import IngestionService
+from compta.services.live_stats_service import LiveStatsService
+from compta.services.pusher_publisher import PusherPublisher
+from compta.services.refresh_scheduler import BalanceRefreshScheduler
+from compta.services.series_service import SeriesService
+from compta.services.subscription_service import SubscriptionService
 from compta.services.transaction_service import TransactionService
+from compta.utils import normalize_dimension
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from celery import shared_task
-pusher_client = Pusher(
-    app_id=os.getenv("PUSER_ID"),
-    key=os.getenv("PUSHER_KEY"),
-    secret=os.getenv("PUSHER_SECRET"),
-    cluster="eu",
-    ssl=False,
-)
+
+logger = logging.getLogger(__name__)
+
+
 class ComptatView(decorators.APIView):
     """
     Vue principale pour récupérer les statistiques de comptabilité
@@ -34,6 +47,7 @@ class ComptatView(decorators.APIView):
     - Si aucun filtre envoyé → charger le dernier filtre sauvegardé
     - Si is_all_date = True → ignorer start_date et end_date
     - Si start_date est null → prendre la date d'aujourd'hui
+    - Si compare=previous → ajouter la période précédente de même durée et les écarts
     """
 
     permission_classes = [permissions.IsAdminUser]
@@ -47,23 +61,22 @@ class ComptatView(decorators.APIView):
             filters["start_date"] = None
             filters["end_date"] = None
 
-        # 3. Récupérer et filtrer les transactions
-        transactions = TransactionService.get_all_transactions()
-        transactions = FilterService.apply_filters(transactions, filters)
-
-        # 4. Calculer les agrégats
-        aggregates = TransactionService.get_transaction_aggregates(transactions)
-
-        # 5. Calculer les balances actuelles (pas de période)
-        balances = BalanceService.get_all_balances()
-
-        # 6. Calculer les stats
-        stats = StatsService.get_all_stats(transactions)
-
-        # 7. Sauvegarder le filtre
+        # 3. Agrégats, stats et balances actuelles (snapshot en cache si à jour)
+        comparison = None
+        if request.GET.get("compare") == "previous":
+            # Les deux périodes en un seul parcours, sans passer par le snapshot
+            try:
+                comparison = DashboardService.build_comparison(filters)
+            except ValueError as e:
+                return Response({"erreur": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            payload = comparison.pop("current")
+        else:
+            payload = DashboardService.get_payload(filters)
+
+        # 4. Sauvegarder le filtre
         FilterService.save_user_filter(request.user, filters)
 
-        # 8. Construire la réponse
+        # 5. Construire la réponse
         data = {
             "filters": {
                 "start_date": filters.get("start_date"),
@@ -76,17 +89,10 @@ class ComptatView(decorators.APIView):
                 "mobcash": filters.get("mobcash", []),
                 "type": filters.get("type", []),
             },
-            "total": aggregates["total"],
-            "mobcash_fee": aggregates["mobcash_fee"],
-            "blaffa_fee": aggregates["blaffa_fee"],
-            "amount": aggregates["amount"],
-            "mobcash_stats": stats["mobcash_stats"],
-            "api_stats": stats["api_stats"],
-            "network_stats": stats["network_stats"],
-            "source_stats": stats["source_stats"],
-            "type_stats": stats["type_stats"],
-            "balances": balances,
+            **payload,
         }
+        if comparison is not None:
+            data["comparison"] = comparison
 
         return Response(data)
 
@@ -104,96 +110,105 @@ class DecimalEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
-def send_stats_to_user():
+def build_stats_event(filters, transactions=None):
     """
-    Envoie les stats en temps réel via WebSocket
-    Utilise le dernier filtre de l'utilisateur
+    Événement temps réel pour un filtre traité : (nom, données)
+
+    Avec `transactions` (nouvelles transactions), seul leur delta est appliqué
+    au dernier état poussé ; en mode COMPTA_LIVE_STATS_MODE = "delta",
+    un message compact "stat_delta" est envoyé au lieu du snapshot complet
     """
-    try:
-        # Récupérer le premier utilisateur (à adapter selon ton besoin)
-        user = User.objects.first()
-        if not user:
-            return
+    # Agrégats, balances et stats (delta appliqué au dernier état si possible)
+    payload, delta = LiveStatsService.get_payload(filters, transactions)
 
-        # Charger le dernier filtre de l'utilisateur
-        filters = FilterService.load_user_last_filter(user)
-        filters = FilterService.process_dates(filters)
+    if delta is not None and settings.COMPTA_LIVE_STATS_MODE == "delta":
+        return "stat_delta", {
+            "type": "stats_delta",
+            "context": "user_filter",
+            "data": json.dumps(delta, cls=DecimalEncoder),
+        }
 
-        # Gérer is_all_date
-        if filters.get("is_all_date"):
-            filters["start_date"] = None
-            filters["end_date"] = None
-        # Sinon, si start_date est null, prendre aujourd'hui
-        elif not filters.get("start_date"):
-            from django.utils import timezone
+    # Préparer les données
+    stats_payload = {
+        "filters": {
+            "start_date": (
+                filters.get("start_date").isoformat()
+                if filters.get("start_date")
+                else None
+            ),
+            "end_date": (
+                filters.get("end_date").isoformat()
+                if filters.get("end_date")
+                else None
+            ),
+            "last": filters.get("last"),
+            "is_all_date": filters.get("is_all_date", False),
+            "source": filters.get("source", []),
+            "network": filters.get("network", []),
+            "api": filters.get("api", []),
+            "mobcash": filters.get("mobcash", []),
+            "type": filters.get("type", []),
+        },
+        **payload,
+    }
 
-            filters["start_date"] = timezone.now().replace(
-                hour=0, minute=0, second=0, microsecond=0
-            )
+    # Construire le message avec JSON encoder personnalisé
+    return "stat_data", {
+        "type": "stats_update",
+        "context": "user_filter",
+        "data": json.dumps(stats_payload, cls=DecimalEncoder),
+    }
 
-        # Récupérer et filtrer les transactions
-        transactions = TransactionService.get_all_transactions()
-        transactions = FilterService.apply_filters(transactions, filters)
 
-        # Calculer les agrégats, balances et stats
-        aggregates = TransactionService.get_transaction_aggregates(transactions)
-        balances = BalanceService.get_all_balances()
-        stats = StatsService.get_all_stats(transactions)
+def send_stats_to_user(transactions=None):
+    """
+    Envoie les stats en temps réel à chaque abonné :
+    - groupes websocket (un par filtre normalisé, voir compta.consumer)
+    - admins actifs connectés à Pusher (private-channel_<id> occupé, selon leur filtre sauvegardé),
+      en un seul dépôt dans le tampon de PusherPublisher
 
-        # Préparer les données
-        stats_payload = {
-            "filters": {
-                "start_date": (
-                    filters.get("start_date").isoformat()
-                    if filters.get("start_date")
-                    else None
-                ),
-                "end_date": (
-                    filters.get("end_date").isoformat()
-                    if filters.get("end_date")
-                    else None
-                ),
-                "last": filters.get("last"),
-                "is_all_date": filters.get("is_all_date", False),
-                "source": filters.get("source", []),
-                "network": filters.get("network", []),
-                "api": filters.get("api", []),
-                "mobcash": filters.get("mobcash", []),
-                "type": filters.get("type", []),
-            },
-            "total": aggregates.get("total"),
-            "mobcash_fee": aggregates.get("mobcash_fee"),
-            "blaffa_fee": aggregates.get("blaffa_fee"),
-            "amount": aggregates.get("amount"),
-            "mobcash_stats": stats.get("mobcash_stats"),
-            "api_stats": stats.get("api_stats"),
-            "network_stats": stats.get("network_stats"),
-            "source_stats": stats.get("source_stats"),
-            "type_stats": stats.get("type_stats"),
-            "balances": balances,
-        }
+    Les stats sont calculées et sérialisées une seule fois par filtre
+    distinct, quel que soit le nombre d'abonnés qui le partagent
+    """
+    try:
+        targets = SubscriptionService.get_targets()
+    except Exception as e:
+        logger.exception("Abonnés aux stats introuvables : %s", e)
+        return str(e)
 
-        # Construire le message avec JSON encoder personnalisé
-        data = {
-            "type": "stats_update",
-            "context": "user_filter",
-            "data": json.dumps(stats_payload, cls=DecimalEncoder),  # ← CLEF ICI
-        }
+    channel_layer = get_channel_layer()
+    pusher_events = []
+    sent = 0
+    for target in targets.values():
+        try:
+            filters = SubscriptionService.get_filters(target["definition"])
+            event, data = build_stats_event(filters, transactions)
+
+            # Un seul événement pour tous les admins du filtre
+            pusher_events.append((target["pusher_channels"], event, data))
+
+            if target["group"]:
+                # Trame websocket sérialisée une fois pour tout le groupe
+                text = json.dumps({"type": event, "data": data["data"]})
+                if not SubscriptionService.is_coalesced():
+                    message = {"type": "stats.message", "text": text}
+                elif event == "stat_data":
+                    # Snapshot complet : seul le dernier compte (voir StatsConsumer.stats_latest)
+                    message = SubscriptionService.publish_frame(target["group"], text)
+                else:
+                    # Delta numéroté : ordonné par rapport aux snapshots (voir StatsConsumer)
+                    message = SubscriptionService.publish_delta(text)
+                async_to_sync(channel_layer.group_send)(target["group"], message)
+            sent += 1
+        except Exception as e:
+            logger.exception("Erreur send_stats_to_user : %s", e)
 
-        # Envoyer via WebSocket
-        response = {}
-        message = "1111111111111111111"
-        pusher_client.trigger(
-            f"private-channel_1",
-            "stat_data",
-            data,
-        )
-        message2 = "222222222222222222"
-        return {"message": message, "message2": message2}
+    # Envoi groupé par le worker Pusher (voir PusherPublisher)
+    try:
+        PusherPublisher.publish(pusher_events)
     except Exception as e:
-        # Log l'erreur (à adapter selon ton système de logging)
-        print(f"Erreur send_stats_to_user: {e}")
-        return str(e)
+        logger.exception("Publication Pusher impossible : %s", e)
+    return {"filters": len(targets), "sent": sent}
 
 
 def send_telegram_message(chat_id, content):
@@ -205,22 +220,246 @@ def send_telegram_message(chat_id, content):
         "text": content,
     }
     try:
-
-        response = requests.post(api_url, data=data)
+        with Metrics.span("telegram", "sendMessage") as span:
+            response = requests.post(api_url, data=data)
+            if not response.ok:
+                span["outcome"] = "error"
         return response.json()
     except:
         return None
 
 
 class CreateTransaction(decorators.APIView):
+    """
+    Création idempotente : (reference, api) est unique
+    L'en-tête Idempotency-Key sert de référence quand le corps n'en a pas
+    """
+
     def post(self, request, *args, **kwargs):
-        serializer = TransactionSerializer(data=request.data)
+        data = request.data.copy()
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key and not data.get("reference"):
+            data["reference"] = idempotency_key
+
+        # Rejeu : une seule sonde d'index, pas de recalcul des stats
+        reference = data.get("reference")
+        api = normalize_dimension(data.get("api"))
+        if reference and api:
+            existing = Transaction.objects.filter(reference=reference, api=api).first()
+            if existing:
+                return self.replay_response(existing)
+
+        serializer = TransactionSerializer(data=data)
         serializer.is_valid(raise_exception=True)
         transaction = serializer.save()
-        from compta.tasks import update_all_balance_process
-        update_all_balance_process.delay(transaction.id)
+        if serializer.is_replay:
+            # Doublon concurrent écarté par ON CONFLICT DO NOTHING
+            return self.replay_response(transaction)
+
+        BalanceRefreshScheduler.schedule(transaction.id)
         return Response(TransactionSerializer(transaction).data)
 
+    def replay_response(self, transaction):
+        return Response(
+            TransactionSerializer(transaction).data,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+
+class BulkCreateTransaction(decorators.APIView):
+    """
+    Import en masse : tableau JSON, {"transactions": [...]} ou flux NDJSON
+    """
+
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get("transactions")
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"erreur": "Une liste de transactions est attendue"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > settings.COMPTA_BULK_MAX_ITEMS:
+            return Response(
+                {"erreur": f"Maximum {settings.COMPTA_BULK_MAX_ITEMS} transactions par requête"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        serializer = TransactionSerializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        transactions = IngestionService.create_transactions(serializer.validated_data)
+        return Response(
+            {
+                "created": len(transactions),
+                "skipped": len(items) - len(transactions),
+                "ids": [transaction.id for transaction in transactions],
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class BatchStatsView(decorators.APIView):
+    """
+    Stats de plusieurs fenêtres nommées en une requête (wallboard) :
+    {"windows": {"today": {}, "yesterday": {"last": "yesterday"}, "7_days": {"last": "7_days", "api": ["pal"]}}}
+    Mêmes clés de filtre que ComptatView ; le filtre sauvegardé de l'utilisateur n'est ni lu ni modifié
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        windows = request.data.get("windows") if isinstance(request.data, dict) else None
+        if not isinstance(windows, dict) or not windows:
+            return Response(
+                {"erreur": "Un objet windows {nom: filtres} est attendu"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(windows) > settings.COMPTA_BATCH_MAX_WINDOWS:
+            return Response(
+                {"erreur": f"Maximum {settings.COMPTA_BATCH_MAX_WINDOWS} fenêtres par requête"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not all(isinstance(filters, dict) for filters in windows.values()):
+            return Response(
+                {"erreur": "Chaque fenêtre doit être un objet de filtres"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        filters_by_window = {
+            name: FilterService.parse_filters_from_data(filters)
+            for name, filters in windows.items()
+        }
+        payload = DashboardService.build_windows(filters_by_window)
+
+        for name, filters in filters_by_window.items():
+            payload["windows"][name] = {
+                "filters": {
+                    "start_date": filters.get("start_date"),
+                    "end_date": filters.get("end_date"),
+                    "last": filters.get("last"),
+                    "is_all_date": filters.get("is_all_date", False),
+                    "source": filters.get("source", []),
+                    "network": filters.get("network", []),
+                    "api": filters.get("api", []),
+                    "mobcash": filters.get("mobcash", []),
+                    "type": filters.get("type", []),
+                },
+                **payload["windows"][name],
+            }
+        return Response(payload)
+
+
+class SeriesView(decorators.APIView):
+    """
+    Séries temporelles pour les graphiques (mêmes filtres que ComptatView, non sauvegardés)
+    ?granularity=hour|day|week|month (défaut day), ?split=api|mobcash|network|source|type
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        filters = FilterService.parse_filters_from_request(request)
+        granularity = request.GET.get("granularity", "day")
+        split = request.GET.get("split") or None
+
+        try:
+            series = SeriesService.get_series(filters, granularity, split)
+        except ValueError as e:
+            return Response({"erreur": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {
+                "filters": {
+                    "start_date": filters.get("start_date"),
+                    "end_date": filters.get("end_date"),
+                    "last": filters.get("last"),
+                    "is_all_date": filters.get("is_all_date", False),
+                    "source": filters.get("source", []),
+                    "network": filters.get("network", []),
+                    "api": filters.get("api", []),
+                    "mobcash": filters.get("mobcash", []),
+                    "type": filters.get("type", []),
+                },
+                "granularity": granularity,
+                "split": split,
+                "series": series,
+            }
+        )
+
+
+class TransactionListView(decorators.APIView):
+    """
+    Liste des transactions filtrées (mêmes filtres que ComptatView, non sauvegardés)
+    Pagination par curseur : ?cursor=<next_cursor de la page précédente>&page_size=50
+    ?estimate_total=true ajoute le total estimé par le planificateur (pas de COUNT(*))
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        filters = FilterService.parse_filters_from_request(request)
+        transactions = FilterService.apply_filters(Transaction.objects.all(), filters)
+
+        try:
+            page_size = int(request.GET.get("page_size", settings.COMPTA_TRANSACTIONS_PAGE_SIZE))
+        except ValueError:
+            page_size = settings.COMPTA_TRANSACTIONS_PAGE_SIZE
+        page_size = max(1, min(page_size, settings.COMPTA_TRANSACTIONS_MAX_PAGE_SIZE))
+
+        try:
+            page, next_cursor = TransactionService.get_page(
+                transactions, request.GET.get("cursor"), page_size
+            )
+        except ValueError as e:
+            return Response({"erreur": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = {
+            "results": TransactionSerializer(page, many=True).data,
+            "next_cursor": next_cursor,
+            "page_size": page_size,
+        }
+        if request.GET.get("estimate_total", "false").lower() == "true":
+            data["estimated_total"] = TransactionService.estimate_count(transactions)
+        return Response(data)
+
+
+class TransactionExportView(decorators.APIView):
+    """
+    Export en flux des transactions filtrées (mêmes filtres que ComptatView, non sauvegardés)
+    ?export_format=csv|ndjson, ?gzip=true pour compresser à la volée
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        # "format" est réservé par DRF pour le choix du renderer
+        export_format = request.GET.get("export_format", "csv").lower()
+        if export_format not in ("csv", "ndjson"):
+            return Response(
+                {"erreur": "export_format doit valoir csv ou ndjson"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        filters = FilterService.parse_filters_from_request(request)
+        transactions = FilterService.apply_filters(Transaction.objects.all(), filters)
+
+        if export_format == "csv":
+            chunks, content_type = ExportService.iter_csv(transactions), "text/csv"
+        else:
+            chunks, content_type = ExportService.iter_ndjson(transactions), "application/x-ndjson"
+        filename = f"transactions-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+
+        if request.GET.get("gzip", "false").lower() == "true":
+            chunks, content_type = ExportService.gzip(chunks), "application/gzip"
+            filename += ".gz"
+
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
 
 class UserTransactionFilterView(decorators.APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -269,6 +508,10 @@ class MobCashAppUpdateView(generics.RetrieveUpdateAPIView):
     serializer_class = MobCashAppSerializer
     permission_classes = [permissions.IsAdminUser]
 
+    def perform_update(self, serializer):
+        serializer.save()
+        ConfigRegistry.invalidate(MobCashApp)
+
 
 class APITransactionListView(generics.ListAPIView):
     queryset = APITransaction.objects.all()
@@ -281,85 +524,63 @@ class APITransactionUpdateView(generics.RetrieveUpdateAPIView):
     serializer_class = APITransactionSerializer
     permission_classes = [permissions.IsAdminUser]
 
+    def perform_update(self, serializer):
+        serializer.save()
+        ConfigRegistry.invalidate(APITransaction)
+
+
+API_BALANCE_PATH = "balance"
+MOBCASH_BALANCE_PATH = "mobcash-balance"
 
-def get_api_balance():
-    url = "https://api.blaffa.net/blaffa/balance"
-    headers = {
-        "Content-Type": "application/json",
-    }
 
+def get_api_balance():
     try:
-        response = requests.get(url=url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-
-        for api in APITransaction.objects.all():
-            api_name = api.name.lower()
-
-            if api_name in data:
-                balance_data = data[api_name]
-
-                # Ignorer les valeurs invalides ou en erreur
-                if isinstance(balance_data, (int, float, str)):
-                    try:
-                        balance = float(balance_data)
-                        api.balance = balance
-                        api.save()
-
-                        # Créer un enregistrement historique
-                        APIBalanceUpdate.objects.create(
-                            api_transaction=api, balance=balance
-                        )
-
-                    except ValueError:
-                        # Si balance_data n’est pas convertible en float
-                        continue
-
-        return data
-    
+        return save_api_balance(BlaffaClient.get(API_BALANCE_PATH))
     except Exception as e:
         return {"error": str(e)}
 
 
-def get_mobcash_balance():
-    url = "https://api.blaffa.net/blaffa/mobcash-balance"
-    headers = {
-        "Content-Type": "application/json",
-    }
-
-    try:
-        response = requests.get(url=url, headers=headers)
-        response.raise_for_status()
-        balances = response.json()  
-        balance_dict = {
-            item["app_name"].lower(): item["solde"]
-            for item in balances
-            if "app_name" in item and "solde" in item
-        }
-
-        for mobcash in MobCashApp.objects.all():
-            app_name = mobcash.name.lower()
+def save_api_balance(data):
+    # Seules les balances modifiées sont écrites (et historisées)
+    BalanceService.save_api_balances(data)
+    return data
 
-            if app_name in balance_dict:
-                balance_value = balance_dict[app_name]
 
-                try:
-                    balance = float(balance_value)
-                    mobcash.balance = balance
-                    mobcash.save()
+def get_mobcash_balance():
+    try:
+        return save_mobcash_balance(BlaffaClient.get(MOBCASH_BALANCE_PATH))
+    except Exception as e:
+        return {"error": str(e)}
 
-                    MobCashAppBalanceUpdate.objects.create(
-                        mobcash_balance=mobcash, balance=balance
-                    )
 
-                except (ValueError, TypeError):
-                    # Balance invalide ou non convertible
-                    continue
+def save_mobcash_balance(balances):
+    balance_dict = {
+        normalize_dimension(item["app_name"]): item["solde"]
+        for item in balances
+        if "app_name" in item and "solde" in item
+    }
+    BalanceService.save_mobcash_balances(balance_dict)
+    return balance_dict
 
-        return balance_dict
 
-    except Exception as e:
-        return {"error": str(e)}
+def get_all_balances():
+    """
+    Interroge les deux endpoints Blaffa en parallèle puis enregistre les balances
+    Retourne (balances API, balances MobCash), {"error": ...} pour un endpoint en échec
+    """
+    responses = BlaffaClient.get_many([API_BALANCE_PATH, MOBCASH_BALANCE_PATH])
+    results = []
+    for path, save in (
+        (API_BALANCE_PATH, save_api_balance),
+        (MOBCASH_BALANCE_PATH, save_mobcash_balance),
+    ):
+        try:
+            if isinstance(responses[path], Exception):
+                raise responses[path]
+            results.append(save(responses[path]))
+        except Exception as e:
+            results.append({"error": str(e)})
+    return tuple(results)
 
 
 class APIBalanceView(decorators.APIView):
@@ -373,6 +594,79 @@ class MobCashBalance(decorators.APIView):
     def get(self, request, *args, **kwargs):
         return Response(get_mobcash_balance())
 
+
+def parse_as_of(value):
+    """
+    Date et heure, ou date seule (fin de journée)
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        parsed = datetime.combine(day, time.max)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class BalanceAsOfView(decorators.APIView):
+    """
+    Balances API / MobCash à une ou plusieurs dates :
+    ?at=2025-01-31&at=2025-02-01T12:00:00 (ou séparées par des virgules),
+    ?start_date=2025-01-01&end_date=2025-01-31 pour chaque fin de journée
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        values = [
+            value
+            for param in request.GET.getlist("at")
+            for value in param.split(",")
+            if value.strip()
+        ]
+        timestamps = [parse_as_of(value.strip()) for value in values]
+
+        start_date = request.GET.get("start_date")
+        end_date = request.GET.get("end_date")
+        if start_date or end_date:
+            start, end = parse_date(start_date or ""), parse_date(end_date or "")
+            if start is None or end is None or start > end:
+                return Response(
+                    {"erreur": "start_date et end_date (AAAA-MM-JJ) sont attendues"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            timestamps += [
+                timezone.make_aware(datetime.combine(start + timedelta(days=offset), time.max))
+                for offset in range((end - start).days + 1)
+            ]
+
+        if not timestamps:
+            timestamps = [timezone.now()]
+        if None in timestamps:
+            return Response({"erreur": "Date invalide"}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_points = settings.COMPTA_BALANCE_AS_OF_MAX_POINTS
+        if len(timestamps) > max_points:
+            return Response(
+                {"erreur": f"Maximum {max_points} dates par requête"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response({"balances": BalanceService.get_balances_as_of(sorted(set(timestamps)))})
+
+class MetricsView(decorators.APIView):
+    """
+    Métriques par endpoint au format texte Prometheus (compta.metrics)
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(Metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 class TestView(decorators.APIView):
     def post(self, request, *args, **kwargs):
         from compta.tasks import send_compta_summary
@@ -390,6 +684,7 @@ class AuthenPusherUser(decorators.APIView):
         channel_name = f"private-channel_{request.user.id}"
         if not channel_name:
             return Response({"erreur": "Aucun channel trouvé"}, status=status.HTTP_400_BAD_REQUEST)
+        pusher_client, _ = PusherPublisher.get_clients()
         try:
             if channel_name.startswith("private"):
                 auth = pusher_client.authenticate(channel=channel_name, socket_id=socket_id)
@@ -413,23 +708,22 @@ def update_api_transaction_balance(transaction:Transaction):
     api_balance = transaction.api_balance
     if api_balance is None or api_balance == 0:
         return
-    api_balance_instance = APITransaction.objects.filter(name=transaction.api).first()
-    api_balance_instance.balance=api_balance
-    api_balance_instance.save()
-    APIBalanceUpdate.objects.create(
-        api_transaction=api_balance_instance, balance=api_balance
-    )
+    BalanceService.save_api_balances({normalize_dimension(transaction.api): api_balance})
 
 
 def update_mobcash_balance(transaction: Transaction):
-    mobcash_balance = transaction.mobcash_balance
-    if mobcash_balance is None or mobcash_balance==0:
-        return
-    mobcash_balance_instance = MobCashApp.objects.filter(
-        name=transaction.mobcash
-    ).first()
-    mobcash_balance_instance.balance = mobcash_balance
-    mobcash_balance_instance.save()
-    MobCashAppBalanceUpdate.objects.create(
-        mobcash_balance=mobcash_balance_instance, balance=mobcash_balance
-    )
+    update_mobcash_balances([transaction])
+
+
+def update_mobcash_balances(transactions):
+    """
+    Enregistre la dernière balance MobCash reçue par app, en un seul passage
+    """
+    balances = {}
+    for transaction in transactions:
+        mobcash_balance = transaction.mobcash_balance
+        if mobcash_balance is None or mobcash_balance == 0:
+            continue
+        balances[normalize_dimension(transaction.mobcash)] = mobcash_balance
+    if balances:
+        BalanceService.save_mobcash_balances(balances)
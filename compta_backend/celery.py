@@ -2,6 +2,7 @@ from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery, shared_task
 from celery.schedules import crontab
+from django.conf import settings
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "compta_backend.settings")
 app = Celery("compta_backend")
@@ -20,4 +21,9 @@ app.conf.beat_schedule = {
         "task": "compta.tasks.send_compta_summary",
         "schedule": crontab(minute=0, hour="0,12"),
     },
+    "compact_balance_history": {
+        "task": "compta.tasks.compact_balance_history",
+        "schedule": crontab(minute=30, hour=3),
+        "kwargs": {"max_chunks": getattr(settings, "COMPTA_BALANCE_MAX_CHUNKS", 200)},
+    },
 }
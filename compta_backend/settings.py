@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'compta.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,6 +99,27 @@ DATABASES = {
     }
 }
 
+# Cache des snapshots du dashboard : mémoire locale par défaut, Redis si configuré
+COMPTA_CACHE_REDIS_URL = os.getenv("COMPTA_CACHE_REDIS_URL")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "snapshots": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": COMPTA_CACHE_REDIS_URL,
+            "KEY_PREFIX": "compta",
+        }
+        if COMPTA_CACHE_REDIS_URL
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "compta-snapshots",
+        }
+    ),
+}
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -190,3 +212,117 @@ CELERY_TASK_DEFAULT_QUEUE = 'compta_queue'
 CELERY_TASK_SOFT_TIME_LIMIT = 220
 CELERY_TASK_TIME_LIMIT = 600
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+
+"""COMPTA STATS CONFIGURATION"""
+# Lire les heures complètes dans TransactionRollup ; à activer seulement
+# après `python manage.py backfill_transaction_rollup` (sinon totaux incomplets)
+COMPTA_ROLLUP_ENABLED = os.getenv("COMPTA_ROLLUP_ENABLED", "false").lower() == "true"
+
+# Durée de vie (secondes) des snapshots du dashboard ;
+# les fenêtres relatives (last=7_days...) glissent, on les garde moins longtemps
+COMPTA_SNAPSHOT_TTL = {
+    "default": int(os.getenv("COMPTA_SNAPSHOT_TTL", 300)),
+    "relative": int(os.getenv("COMPTA_SNAPSHOT_RELATIVE_TTL", 60)),
+}
+
+# Stats temps réel : "snapshot" pousse le dashboard complet, "delta" un message compact
+COMPTA_LIVE_STATS_MODE = os.getenv("COMPTA_LIVE_STATS_MODE", "snapshot")
+# Au-delà (secondes), l'état poussé est recalculé entièrement au lieu d'être patché
+COMPTA_LIVE_STATS_MAX_AGE = int(os.getenv("COMPTA_LIVE_STATS_MAX_AGE", 120))
+
+# Fenêtre (secondes) de regroupement des rafraîchissements de balance après transaction
+COMPTA_BALANCE_REFRESH_WINDOW = int(os.getenv("COMPTA_BALANCE_REFRESH_WINDOW", 5))
+# Redis partagé des ids en attente de rafraîchissement (par défaut celui du cache,
+# sinon le broker Celery qui exécute déjà la tâche de rafraîchissement) ; obligatoire
+COMPTA_REFRESH_REDIS_URL = os.getenv(
+    "COMPTA_REFRESH_REDIS_URL", COMPTA_CACHE_REDIS_URL or CELERY_BROKER_URL
+)
+
+# Import en masse (/compta/transaction/bulk)
+COMPTA_BULK_MAX_ITEMS = int(os.getenv("COMPTA_BULK_MAX_ITEMS", 10000))
+COMPTA_BULK_CHUNK_SIZE = int(os.getenv("COMPTA_BULK_CHUNK_SIZE", 500))
+
+# Registre en mémoire des configs MobCashApp / APITransaction (secondes) ;
+# les invalidations sont diffusées sur Redis quand COMPTA_CONFIG_REDIS_URL est défini
+COMPTA_CONFIG_TTL = int(os.getenv("COMPTA_CONFIG_TTL", 30))
+COMPTA_CONFIG_REDIS_URL = os.getenv("COMPTA_CONFIG_REDIS_URL", COMPTA_CACHE_REDIS_URL)
+
+# Endpoints de balance Blaffa : timeouts (connexion, lecture) en secondes et retries par requête
+COMPTA_BLAFFA_BASE_URL = os.getenv("COMPTA_BLAFFA_BASE_URL", "https://api.blaffa.net/blaffa")
+COMPTA_BLAFFA_TIMEOUT = (
+    float(os.getenv("COMPTA_BLAFFA_CONNECT_TIMEOUT", 3)),
+    float(os.getenv("COMPTA_BLAFFA_READ_TIMEOUT", 10)),
+)
+COMPTA_BLAFFA_RETRIES = int(os.getenv("COMPTA_BLAFFA_RETRIES", 2))
+
+# Rétention de l'historique des balances : jours de points bruts, puis de points horaires
+# (au-delà, un point par jour) ; chunk_hours = taille d'un lot de compaction
+COMPTA_BALANCE_RETENTION = {
+    "raw_days": int(os.getenv("COMPTA_BALANCE_RAW_DAYS", 7)),
+    "hourly_days": int(os.getenv("COMPTA_BALANCE_HOURLY_DAYS", 90)),
+    "chunk_hours": int(os.getenv("COMPTA_BALANCE_CHUNK_HOURS", 24)),
+}
+# Lots compactés au plus par exécution planifiée (beat) ; la suivante reprend la suite
+COMPTA_BALANCE_MAX_CHUNKS = int(os.getenv("COMPTA_BALANCE_MAX_CHUNKS", 200))
+
+# Nombre maximum de dates par appel à /compta/balances/as-of
+COMPTA_BALANCE_AS_OF_MAX_POINTS = int(os.getenv("COMPTA_BALANCE_AS_OF_MAX_POINTS", 366))
+
+# Liste paginée des transactions (/compta/transactions)
+COMPTA_TRANSACTIONS_PAGE_SIZE = int(os.getenv("COMPTA_TRANSACTIONS_PAGE_SIZE", 50))
+COMPTA_TRANSACTIONS_MAX_PAGE_SIZE = int(os.getenv("COMPTA_TRANSACTIONS_MAX_PAGE_SIZE", 500))
+
+# Export en flux (/compta/transactions/export) : lignes lues par lot sur le curseur serveur
+COMPTA_EXPORT_CHUNK_SIZE = int(os.getenv("COMPTA_EXPORT_CHUNK_SIZE", 2000))
+
+# Seule base sur laquelle `manage.py benchmark_compta` accepte d'écrire (nom de la base
+# dédiée, jamais celle de production) ; non défini : commande refusée
+COMPTA_BENCHMARK_DATABASE = os.getenv("COMPTA_BENCHMARK_DATABASE")
+
+# Nombre maximum de points par série (/compta/series)
+COMPTA_SERIES_MAX_BUCKETS = int(os.getenv("COMPTA_SERIES_MAX_BUCKETS", 2000))
+
+# Nombre maximum de fenêtres par appel à /compta/compta/batch
+COMPTA_BATCH_MAX_WINDOWS = int(os.getenv("COMPTA_BATCH_MAX_WINDOWS", 10))
+
+# Métriques par endpoint exposées sur /compta/metrics (format Prometheus) ;
+# agrégées entre workers dans Redis quand COMPTA_METRICS_REDIS_URL est défini
+COMPTA_METRICS_ENABLED = os.getenv("COMPTA_METRICS_ENABLED", "true").lower() == "true"
+COMPTA_METRICS_REDIS_URL = os.getenv("COMPTA_METRICS_REDIS_URL", COMPTA_CACHE_REDIS_URL)
+# Bornes (secondes) de l'histogramme de latence
+COMPTA_METRICS_BUCKETS = tuple(
+    float(bound)
+    for bound in os.getenv(
+        "COMPTA_METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"
+    ).split(",")
+)
+
+# Redis partagé par daphne et les workers pour les abonnements websocket aux stats
+# (par défaut celui du cache) ; obligatoire : ImproperlyConfigured s'il n'est pas défini
+COMPTA_LIVE_REDIS_URL = os.getenv("COMPTA_LIVE_REDIS_URL", COMPTA_CACHE_REDIS_URL)
+# Durée (secondes) d'un abonnement websocket aux stats sans renouvellement
+# (les consumers connectés le prolongent automatiquement)
+COMPTA_LIVE_SUBSCRIPTION_TTL = int(os.getenv("COMPTA_LIVE_SUBSCRIPTION_TTL", 300))
+# Livraison websocket des snapshots : "coalesce" (dernier gagnant, une trame gardée par groupe
+# dans COMPTA_LIVE_REDIS_URL, deltas ordonnés par version) ou "direct" (chaque snapshot
+# copié dans la file de chaque socket)
+COMPTA_LIVE_STATS_DELIVERY = os.getenv("COMPTA_LIVE_STATS_DELIVERY", "coalesce")
+# Intervalle minimum (secondes) entre deux snapshots envoyés à une même socket
+COMPTA_LIVE_STATS_MIN_INTERVAL = float(os.getenv("COMPTA_LIVE_STATS_MIN_INTERVAL", 1))
+
+# Publication Pusher groupée : événements déposés dans Redis puis envoyés par trigger_batch
+# depuis la file COMPTA_PUSHER_QUEUE (par défaut la file des workers existants) ;
+# une file dédiée n'est à configurer qu'avec le worker qui la sert :
+#   COMPTA_PUSHER_QUEUE=compta_pusher
+#   celery -A compta_backend worker -Q compta_pusher -c 1 -n pusher@%h
+COMPTA_PUSHER_REDIS_URL = os.getenv("COMPTA_PUSHER_REDIS_URL", COMPTA_CACHE_REDIS_URL)
+COMPTA_PUSHER_QUEUE = os.getenv("COMPTA_PUSHER_QUEUE", CELERY_TASK_DEFAULT_QUEUE)
+# Fenêtre (secondes) pendant laquelle les événements sont regroupés avant envoi
+COMPTA_PUSHER_FLUSH_WINDOW = float(os.getenv("COMPTA_PUSHER_FLUSH_WINDOW", 1))
+# Stats poussées aux admins par Pusher, seulement sur les channels privés occupés
+# (liste relue au plus toutes les COMPTA_PUSHER_OCCUPANCY_TTL secondes)
+COMPTA_PUSHER_STATS_ENABLED = os.getenv("COMPTA_PUSHER_STATS_ENABLED", "true").lower() == "true"
+COMPTA_PUSHER_OCCUPANCY_TTL = float(os.getenv("COMPTA_PUSHER_OCCUPANCY_TTL", 10))
+COMPTA_PUSHER_SSL = os.getenv("COMPTA_PUSHER_SSL", "true").lower() == "true"
+COMPTA_PUSHER_TIMEOUT = int(os.getenv("COMPTA_PUSHER_TIMEOUT", 5))